@@ -0,0 +1,55 @@
+import copy
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def session_cache(tmp_path_factory):
+    """
+    Points the default cache to a file of the test session, so the tests
+    never read or clear the cache of a running server, nor see the entries
+    of a previous run.
+    """
+    caches = copy.deepcopy(settings.CACHES)
+    caches['default']['LOCATION'] = str(tmp_path_factory.mktemp('cache') / 'cache.sqlite3')
+    with override_settings(CACHES=caches):
+        yield
+
+
+@pytest.fixture(autouse=True, scope='session')
+def missing_prerender_root(tmp_path_factory):
+    """
+    Points PRERENDER_ROOT to a directory that does not exist, so the tests
+    never regenerate the pages of a running server; the prerender tests
+    create one of their own.
+    """
+    root = str(tmp_path_factory.mktemp('prerender') / 'pages')
+    with override_settings(PRERENDER_ROOT=root):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(session_cache):
+    """
+    Empties the cache after each test: the rows cached by a test are
+    rolled back, the entries would outlive them.
+    """
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True, scope='session')
+def plain_static_storage():
+    """
+    Serves the static files under their own names: the tests run without
+    collectstatic, so the manifest storage would reject every asset.
+    """
+    storages = copy.deepcopy(settings.STORAGES)
+    storages['staticfiles'] = {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    }
+    with override_settings(STORAGES=storages):
+        yield
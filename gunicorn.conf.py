@@ -1,3 +1,5 @@
 bind = "0.0.0.0:8000"
 wsgi_app = "oc_lettings_site.wsgi:application"
 workers = 2
+# Threaded workers, so long-lived change streams do not hold a whole worker
+threads = 8
@@ -1,6 +1,40 @@
 from django.contrib import admin
-from .models import Letting, Address
+from oc_lettings_site.pagination import EstimatedCountPaginator
+from .models import Address, Country, Letting, State
 
 
-admin.site.register(Letting)  # Registers Letting model to manage lettings in the admin interface
-admin.site.register(Address)  # Registers Address model to manage addresses in the admin interface
+@admin.register(Country, State)
+class ReferenceAdmin(admin.ModelAdmin):
+    """
+    Admin for the state and country reference tables.
+    """
+    list_display = ('code', 'name')
+    search_fields = ('^code', 'name')
+    ordering = ('code',)
+
+
+@admin.register(Address)
+class AddressAdmin(admin.ModelAdmin):
+    """
+    Admin for addresses, searchable by city or street prefix
+    through case-insensitive indexes.
+    """
+    list_display = ('__str__', 'city', 'state', 'zip_code', 'country')
+    search_fields = ('^city', '^street')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Letting)
+class LettingAdmin(admin.ModelAdmin):
+    """
+    Admin for lettings, the address is joined on the changelist and
+    picked through an autocomplete widget instead of a full <select>.
+    """
+    list_display = ('title', 'address', 'is_active')
+    list_filter = ('is_active',)
+    list_select_related = ('address',)
+    search_fields = ('^title',)
+    autocomplete_fields = ('address',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -6,3 +6,6 @@ class LettingsConfig(AppConfig):
     Configuration class for the Lettings application.
     """
     name = 'lettings'
+
+    def ready(self):
+        import lettings.signals  # noqa: F401
@@ -0,0 +1,152 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from oc_lettings_site import changes, counters, prerender, versions
+from oc_lettings_site.models import ChangeLog, Tombstone
+from oc_lettings_site.suggest import suggester
+from . import batch
+from .models import Address, ArchivedAddress, ArchivedLetting, Letting, LettingSummary
+from .signals import invalidate_cities
+
+
+# Columns copied as is from the address table to its archive
+ADDRESS_COLUMNS = (
+    'id', 'number', 'street', 'city', 'state_id', 'zip_code', 'country_id',
+    'latitude', 'longitude',
+)
+
+
+def archive(letting_ids):
+    """
+    Moves lettings and their addresses to the archive tables: both are
+    copied by one INSERT ... SELECT each, then deleted by one DELETE each.
+    Deletes in bulk send no signals: the counters, tombstones and change
+    log are written set-wise in the same transaction, and the caches,
+    pages and typeahead are brought up to date here.
+    Args:
+        letting_ids (list): The ids of the lettings to archive.
+    Returns:
+        int: The number of lettings archived.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(ADDRESS_COLUMNS)
+    with transaction.atomic():
+        rows = list(
+            Letting.objects.filter(pk__in=letting_ids)
+            .values_list('pk', 'address_id', 'title', 'address__city', 'address__city_key')
+        )
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        address_ids = [row[1] for row in rows]
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(ArchivedAddress._meta.db_table)} ({columns}) '
+                f'SELECT {columns} FROM {quote(Address._meta.db_table)} WHERE id IN '
+                f'(SELECT address_id FROM {quote(Letting._meta.db_table)} '
+                f'WHERE id IN ({placeholders}))',
+                ids,
+            )
+            cursor.execute(
+                f'INSERT INTO {quote(ArchivedLetting._meta.db_table)} '
+                '(id, title, address_id, archived_at) '
+                f'SELECT id, title, address_id, %s FROM {quote(Letting._meta.db_table)} '
+                f'WHERE id IN ({placeholders})',
+                [connection.ops.adapt_datetimefield_value(timezone.now()), *ids],
+            )
+
+            # Read from the rows before they go
+            counters.uncount(Letting, pk__in=ids)
+            counters.uncount(Address, pk__in=address_ids)
+            lettings_label, addresses_label = Letting._meta.label_lower, Address._meta.label_lower
+            buried = [(lettings_label, pk) for pk in ids]
+            buried += [(addresses_label, pk) for pk in address_ids]
+            Tombstone.objects.bulk_create(
+                [
+                    Tombstone(version=version, model=label, object_id=pk)
+                    for version, (label, pk) in zip(versions.next_versions(len(buried)), buried)
+                ],
+                batch_size=500,
+            )
+            changes.record_many(Letting, ids, ChangeLog.DELETED)
+            changes.record_many(Address, address_ids, ChangeLog.DELETED)
+
+            # Summaries first, the foreign keys are checked on commit
+            LettingSummary.objects.filter(letting_id__in=ids).delete()
+            cursor.execute(
+                f'DELETE FROM {quote(Letting._meta.db_table)} WHERE id IN ({placeholders})', ids
+            )
+            # The R*Tree triggers drop the addresses from the spatial index
+            cursor.execute(
+                f'DELETE FROM {quote(Address._meta.db_table)} WHERE id IN ({placeholders})',
+                address_ids,
+            )
+
+        invalidate_cities(*{row[4] for row in rows})
+        batch.invalidate(*ids)
+        if prerender.is_enabled():
+            prerender.schedule(
+                [prerender.lettings_index_path()],
+                removed=[prerender.letting_path(letting_id) for letting_id in ids],
+            )
+        for title in {row[2] for row in rows}:
+            suggester.remove('titles', title)
+        for city in {row[3] for row in rows}:
+            suggester.remove('cities', city)
+    return len(rows)
+
+
+def archive_inactive(batch_size):
+    """
+    Archives every inactive letting, a transaction per batch.
+    Args:
+        batch_size (int): The number of lettings moved per transaction.
+    Returns:
+        int: The number of lettings archived.
+    """
+    archived = 0
+    while True:
+        # The partial index holds only the inactive lettings
+        batch = list(
+            Letting.objects.filter(is_active=False).values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return archived
+        archived += archive(batch)
+
+
+def restore(letting_ids):
+    """
+    Moves archived lettings and their addresses back to the live tables,
+    with their ids, saved one by one so the signals run.
+    Args:
+        letting_ids (list): The ids of the archived lettings.
+    Returns:
+        int: The number of lettings restored.
+    """
+    with transaction.atomic():
+        archived = list(
+            ArchivedLetting.objects.select_related('address').filter(pk__in=letting_ids)
+        )
+        for archived_letting in archived:
+            archived_address = archived_letting.address
+            address = Address(
+                **{column: getattr(archived_address, column) for column in ADDRESS_COLUMNS}
+            )
+            address.save(force_insert=True)
+            Letting.objects.create(
+                id=archived_letting.pk, title=archived_letting.title, address=address
+            )
+            # Deletes the archived letting too
+            archived_address.delete()
+    return len(archived)
+
+
+def find_archived(letting_id):
+    """
+    Looks a letting up in the archive, the fallback of the letting page.
+    Returns:
+        ArchivedLetting: The letting with its address, None if it is not archived.
+    """
+    return ArchivedLetting.objects.select_related('address').filter(pk=letting_id).first()
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+
+from . import registry
+from .models import Letting
+
+
+CACHE_PREFIX = 'lettings:batch:'
+
+COLUMNS = (
+    'id', 'title', 'address__number', 'address__street', 'address__city',
+    'address__state_id', 'address__zip_code', 'address__country_id',
+    'address__latitude', 'address__longitude',
+)
+
+
+def cache_key(letting_id):
+    return f'{CACHE_PREFIX}{letting_id}'
+
+
+def serialize(row):
+    letting_id, title, number, street, city, state_id, zip_code, country_id, lat, lon = row
+    return {
+        'id': letting_id,
+        'title': title,
+        'address': {
+            'number': number,
+            'street': street,
+            'city': city,
+            # Codes from the in-process registries, no join
+            'state': registry.states.get_by_id(state_id).code,
+            'zip_code': zip_code,
+            'country_iso_code': registry.countries.get_by_id(country_id).code,
+            'latitude': lat,
+            'longitude': lon,
+        },
+        'url': reverse('lettings:letting', args=[letting_id]),
+    }
+
+
+class LettingLoader:
+    """
+    Loads lettings by id in batches: the ids asked for are deduplicated,
+    read from the per-letting cache entries, and the misses are read
+    together in one query joined to their addresses. A loader remembers
+    what it loaded, so asking again for an id costs nothing.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+
+    def load_many(self, letting_ids):
+        """
+        Returns the lettings of some ids.
+        Args:
+            letting_ids (iterable): The letting ids, duplicates allowed.
+        Returns:
+            dict: The serialized lettings keyed by id, without the unknown and
+            inactive ids.
+        """
+        wanted = [pk for pk in dict.fromkeys(letting_ids) if pk not in self.loaded]
+        if wanted:
+            cached = cache.get_many([cache_key(pk) for pk in wanted])
+            missing = []
+            for pk in wanted:
+                value = cached.get(cache_key(pk))
+                if value is None:
+                    missing.append(pk)
+                else:
+                    self.loaded[pk] = value
+            if missing:
+                listed = Letting.objects.filter(id__in=missing, is_active=True)
+                fetched = {row[0]: serialize(row) for row in listed.values_list(*COLUMNS)}
+                cache.set_many(
+                    {cache_key(pk): value for pk, value in fetched.items()},
+                    settings.LETTINGS_BATCH_CACHE_TIMEOUT,
+                )
+                self.loaded.update(fetched)
+        return {pk: self.loaded[pk] for pk in letting_ids if pk in self.loaded}
+
+
+def invalidate(*letting_ids):
+    """
+    Drops lettings from the shared cache once the current transaction
+    commits: dropped before, a concurrent request could cache the rows
+    not committed yet again, until their timeout.
+    Args:
+        *letting_ids: The ids of the changed lettings.
+    """
+    keys = [cache_key(pk) for pk in letting_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
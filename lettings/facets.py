@@ -0,0 +1,32 @@
+from oc_lettings_site import counters
+
+from . import registry
+from .models import Letting
+
+
+# Facet name, counted letting field and display label lookup
+FACETS = (
+    ('state', 'state', registry.states.label),
+    # Case-folded keys, spelling variants of a city are counted together
+    ('city', 'city_key', str.title),
+    ('country', 'country_iso_code', registry.countries.label),
+)
+
+
+def get_facets():
+    """
+    Returns the lettings by state, city and country, read from the letting
+    counters kept up to date in the transaction of every write (see
+    oc_lettings_site.counters), so they need no cache nor invalidation.
+    Returns:
+        dict: For each facet, a list of {'value', 'label', 'count'} dicts,
+        the largest counts first.
+    """
+    totals = counters.get_all_facet_counts(Letting)
+    return {
+        name: [
+            {'value': value, 'label': label(value) if label else value, 'count': count}
+            for value, count in sorted(totals[field].items(), key=lambda item: (-item[1], item[0]))
+        ]
+        for name, field, label in FACETS
+    }
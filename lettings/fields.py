@@ -0,0 +1,66 @@
+from django.db import models
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+
+from .registry import registry_for
+
+
+def fold(text):
+    """
+    Returns the case-folded form of a text with its spaces normalized,
+    the key under which it is looked up case-insensitively.
+    """
+    return ' '.join(text.split()).casefold()
+
+
+class CodeForwardDescriptor(ForwardManyToOneDescriptor):
+    """
+    Reads the related row from the reference registry instead of the
+    database, and accepts a code string on assignment. An unknown code
+    gives an unsaved row, validated by clean_fields() and created on save.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        pk = getattr(instance, self.field.attname)
+        if pk is not None and not self.field.is_cached(instance):
+            row = registry_for(self.field.related_model).get_by_id(pk)
+            if row is not None:
+                self.field.set_cached_value(instance, row)
+        return super().__get__(instance, cls)
+
+    def __set__(self, instance, value):
+        if isinstance(value, str):
+            model = self.field.related_model
+            value = registry_for(model).get(value) or model(code=value, name=value)
+        super().__set__(instance, value)
+
+
+class CodeForeignKey(models.ForeignKey):
+    """
+    Foreign key to a 'State' or 'Country' reference row, also settable by code.
+    """
+    forward_related_accessor_class = CodeForwardDescriptor
+
+
+class FoldedKeyField(models.CharField):
+    """
+    Case-folded copy of another text field of the model, recomputed on
+    every save and bulk_create, so it can be indexed and matched exactly.
+    """
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs['editable'] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        del kwargs['editable']
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = fold(getattr(model_instance, self.source) or '')
+        setattr(model_instance, self.attname, value)
+        return value
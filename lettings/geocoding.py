@@ -0,0 +1,152 @@
+import csv
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from oc_lettings_site import versions
+from oc_lettings_site.models import ChangeLog
+
+
+# Column names of the bundled CSV, then of the Census ZCTA gazetteer
+COLUMNS = (
+    ('zip_code', 'latitude', 'longitude'),
+    ('GEOID', 'INTPTLAT', 'INTPTLONG'),
+)
+
+TEMP_TABLE = 'geocoding_centroid'
+CHANGES_TABLE = 'geocoding_change'
+
+_lock = threading.Lock()
+# Centroids of the configured dataset, loaded on first use
+_centroids = {}
+
+
+def read_centroids(path):
+    """
+    Reads a zip code centroids file.
+    Args:
+        path (str): A CSV or tab separated file, with a header row.
+    Returns:
+        dict: The (latitude, longitude) of every zip code, keyed by zip code.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        sample = file.readline()
+        file.seek(0)
+        delimiter = '\t' if '\t' in sample else ','
+        reader = csv.DictReader(file, delimiter=delimiter)
+        # Gazetteer headers may carry trailing spaces
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        for zip_column, latitude_column, longitude_column in COLUMNS:
+            if zip_column in reader.fieldnames:
+                break
+        else:
+            raise ValueError(f"{path}: no zip code column.")
+        return {
+            int(row[zip_column]): (float(row[latitude_column]), float(row[longitude_column]))
+            for row in reader
+        }
+
+
+def centroids():
+    """
+    Returns the centroids of the GEOCODING_DATASET setting, read once per process.
+    """
+    path = settings.GEOCODING_DATASET
+    with _lock:
+        if path not in _centroids:
+            _centroids.clear()
+            _centroids[path] = read_centroids(path)
+        return _centroids[path]
+
+
+def locate(zip_code):
+    """
+    Looks up the centroid of a zip code.
+    Args:
+        zip_code (int): The zip code.
+    Returns:
+        tuple: (latitude, longitude), or None if the zip code is not in the dataset.
+    """
+    return centroids().get(zip_code)
+
+
+def geocode_all(path=None, missing_only=False):
+    """
+    Sets the coordinates of every address from its zip code in one join:
+    the dataset is loaded in a temporary table, joined to the addresses to
+    find the coordinates that change, then applied by a single UPDATE ...
+    FROM. The changed addresses take new versions and are logged in the
+    change feed, so mirrors receive their coordinates, and their lettings
+    are dropped from the batch cache once committed.
+    Args:
+        path (str): The dataset, GEOCODING_DATASET when None.
+        missing_only (bool): Whether to keep the coordinates already set.
+    Returns:
+        tuple: The number of addresses given new coordinates, and of
+        addresses left without coordinates.
+    """
+    # The models import this module
+    from . import batch
+    Address = apps.get_model('lettings', 'Address')
+    Letting = apps.get_model('lettings', 'Letting')
+    points = centroids() if path is None else read_centroids(path)
+    quote = connection.ops.quote_name
+    address_table = quote(Address._meta.db_table)
+    temp_table = quote(TEMP_TABLE)
+    changes_table = quote(CHANGES_TABLE)
+    if missing_only:
+        condition = f'{address_table}.latitude IS NULL AND c.zip_code IS NOT NULL'
+    else:
+        # Coordinates of a zip code no longer in the dataset are stale, cleared
+        condition = (
+            f'({address_table}.latitude IS NOT c.latitude '
+            f'OR {address_table}.longitude IS NOT c.longitude)'
+        )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE {temp_table} '
+            '(zip_code INTEGER PRIMARY KEY, latitude REAL, longitude REAL)'
+        )
+        try:
+            cursor.executemany(
+                f'INSERT INTO {temp_table} VALUES (%s, %s, %s)',
+                [(zip_code, latitude, longitude) for zip_code, (latitude, longitude)
+                 in points.items()],
+            )
+            # Numbered, so the changed addresses take a range of versions
+            cursor.execute(
+                f'CREATE TEMP TABLE {changes_table} AS '
+                f'SELECT {address_table}.id AS id, c.latitude AS latitude, '
+                f'c.longitude AS longitude, '
+                f'ROW_NUMBER() OVER (ORDER BY {address_table}.id) - 1 AS position '
+                f'FROM {address_table} LEFT JOIN {temp_table} c '
+                f'ON c.zip_code = {address_table}.zip_code WHERE {condition}'
+            )
+            cursor.execute(f'SELECT id, latitude IS NOT NULL FROM {changes_table}')
+            changed = cursor.fetchall()
+            if changed:
+                first = versions.next_versions(len(changed)).start
+                cursor.execute(
+                    f'UPDATE {address_table} SET latitude = g.latitude, '
+                    f'longitude = g.longitude, version = %s + g.position '
+                    f'FROM {changes_table} g WHERE g.id = {address_table}.id',
+                    [first],
+                )
+                ChangeLog.objects.bulk_create([
+                    ChangeLog(model=Address._meta.label_lower, object_id=pk,
+                              action=ChangeLog.UPDATED)
+                    for pk, _located in changed
+                ])
+                cursor.execute(
+                    f'SELECT id FROM {quote(Letting._meta.db_table)} '
+                    f'WHERE address_id IN (SELECT id FROM {changes_table})'
+                )
+                batch.invalidate(*[letting_id for letting_id, in cursor.fetchall()])
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {changes_table}')
+            cursor.execute(f'DROP TABLE {temp_table}')
+    geocoded = sum(located for _pk, located in changed)
+    missing = Address.objects.filter(latitude__isnull=True).count()
+    return geocoded, missing
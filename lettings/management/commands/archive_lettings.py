@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from lettings import archive
+from oc_lettings_site import prerender
+
+
+class Command(BaseCommand):
+    """
+    Moves the inactive lettings and their addresses to the archive
+    tables, so the live tables and their indexes only hold listed rows.
+    """
+    help = "Archives the inactive lettings, or restores archived ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Lettings moved per transaction.")
+        parser.add_argument('--restore', type=int, nargs='+', metavar='LETTING_ID',
+                            help="Ids of archived lettings to list again.")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            restored = archive.restore(options['restore'])
+            self.stdout.write(f"{restored} lettings restored.")
+        else:
+            archived = archive.archive_inactive(options['batch_size'])
+            self.stdout.write(f"{archived} lettings archived.")
+        # The pages of the moved lettings, before the process exits
+        prerender.flush()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lettings import geocoding
+
+
+class Command(BaseCommand):
+    """
+    Geocodes the addresses offline from a zip code coordinates dataset,
+    joined to the addresses table in a single statement.
+    """
+    help = "Sets the coordinates of every address from its zip code."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset',
+                            help="Coordinates file, the GEOCODING_DATASET setting by default.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Only geocode the addresses without coordinates.")
+
+    def handle(self, *args, **options):
+        try:
+            geocoded, missing = geocoding.geocode_all(options['dataset'], options['missing'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Unreadable dataset: {e}")
+        self.stdout.write(f"{geocoded} addresses geocoded, {missing} without coordinates.")
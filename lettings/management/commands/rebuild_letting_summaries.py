@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from lettings.models import LettingSummary
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the flattened letting summaries from the lettings tables,
+    for instance after a bulk import that sent no model signals.
+    """
+    help = "Rewrites every letting summary in one statement."
+
+    def handle(self, *args, **options):
+        written = LettingSummary.rebuild()
+        self.stdout.write(f"{written} letting summaries rebuilt.")
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+    """
+    Adds case-insensitive indexes on the fields searched by prefix in the admin.
+    """
+
+    dependencies = [
+        ('lettings', '0002_migrate_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(
+                django.db.models.functions.comparison.Collate('city', 'nocase'),
+                name='address_city_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(
+                django.db.models.functions.comparison.Collate('street', 'nocase'),
+                name='address_street_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='letting',
+            index=models.Index(
+                django.db.models.functions.comparison.Collate('title', 'nocase'),
+                name='letting_title_nocase_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forward_func(apps, schema_editor):
+    """
+    Builds the summaries of the existing lettings.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    Letting = apps.get_model('lettings', 'Letting')
+    LettingSummary = apps.get_model('lettings', 'LettingSummary')
+    LettingSummary.objects.bulk_create(
+        LettingSummary(
+            letting_id=letting.id,
+            title=letting.title,
+            address_line=f'{letting.address.number} {letting.address.street}',
+            city=letting.address.city,
+            state=letting.address.state,
+            zip_code=letting.address.zip_code,
+            country_iso_code=letting.address.country_iso_code,
+        )
+        for letting in Letting.objects.select_related('address').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the 'LettingSummary' read model and fills it.
+    """
+
+    dependencies = [
+        ('lettings', '0003_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LettingSummary',
+            fields=[
+                ('letting', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='summary',
+                    serialize=False,
+                    to='lettings.letting')),
+                ('title', models.CharField(max_length=256)),
+                ('address_line', models.CharField(max_length=80)),
+                ('city', models.CharField(max_length=64)),
+                ('state', models.CharField(max_length=2)),
+                ('zip_code', models.PositiveIntegerField()),
+                ('country_iso_code', models.CharField(max_length=3)),
+            ],
+            options={
+                'verbose_name_plural': 'Letting summaries',
+            },
+        ),
+        migrations.RunPython(forward_func, migrations.RunPython.noop),
+    ]
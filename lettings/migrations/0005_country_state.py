@@ -0,0 +1,166 @@
+from django.db import migrations, models
+import django.core.validators
+import django.db.models.deletion
+import lettings.fields
+
+
+COUNTRIES = [
+    ('USA', 'United States'),
+]
+
+STATES = [
+    ('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'),
+    ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'),
+    ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'),
+    ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'),
+    ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'),
+    ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'),
+    ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'),
+    ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'),
+    ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'),
+    ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'),
+    ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'),
+    ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'),
+    ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'),
+]
+
+
+def seed_references(apps, schema_editor):
+    """
+    Creates the known countries and states, then one row for any other
+    code found in the addresses, named after its code.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    Address = apps.get_model('lettings', 'Address')
+    Country = apps.get_model('lettings', 'Country')
+    State = apps.get_model('lettings', 'State')
+    countries = dict(COUNTRIES)
+    states = dict(STATES)
+    for code in Address.objects.values_list('country_iso_code', flat=True).distinct():
+        countries.setdefault(code, code)
+    for code in Address.objects.values_list('state', flat=True).distinct():
+        states.setdefault(code, code)
+    Country.objects.bulk_create(Country(code=code, name=name) for code, name in countries.items())
+    State.objects.bulk_create(State(code=code, name=name) for code, name in states.items())
+
+
+def link_references(apps, schema_editor):
+    """
+    Points every address at its state and country rows, one statement each.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    schema_editor.execute(
+        'UPDATE lettings_address SET '
+        'state_ref_id = (SELECT id FROM lettings_state WHERE code = lettings_address.state), '
+        'country_id = (SELECT id FROM lettings_country '
+        'WHERE code = lettings_address.country_iso_code)'
+    )
+
+
+def unlink_references(apps, schema_editor):
+    """
+    Copies the codes back into the address columns.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    schema_editor.execute(
+        'UPDATE lettings_address SET '
+        'state = (SELECT code FROM lettings_state WHERE id = lettings_address.state_ref_id), '
+        'country_iso_code = (SELECT code FROM lettings_country '
+        'WHERE id = lettings_address.country_id)'
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Moves the address state and country codes to the 'State' and
+    'Country' reference tables.
+    """
+
+    dependencies = [
+        ('lettings', '0004_lettingsummary'),
+        # Counts the address facets from the old columns
+        ('oc_lettings_site', '0002_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(
+                    max_length=3,
+                    unique=True,
+                    validators=[django.core.validators.MinLengthValidator(3)])),
+                ('name', models.CharField(max_length=64)),
+            ],
+            options={
+                'verbose_name_plural': 'Countries',
+            },
+        ),
+        migrations.CreateModel(
+            name='State',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(
+                    max_length=2,
+                    unique=True,
+                    validators=[django.core.validators.MinLengthValidator(2)])),
+                ('name', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(seed_references, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='address',
+            name='state_ref',
+            field=lettings.fields.CodeForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='addresses',
+                to='lettings.state'),
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='country',
+            field=lettings.fields.CodeForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='addresses',
+                to='lettings.country'),
+        ),
+        migrations.RunPython(link_references, unlink_references),
+        migrations.RemoveField(
+            model_name='address',
+            name='state',
+        ),
+        migrations.RemoveField(
+            model_name='address',
+            name='country_iso_code',
+        ),
+        migrations.RenameField(
+            model_name='address',
+            old_name='state_ref',
+            new_name='state',
+        ),
+        migrations.AlterField(
+            model_name='address',
+            name='state',
+            field=lettings.fields.CodeForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='addresses',
+                to='lettings.state'),
+        ),
+        migrations.AlterField(
+            model_name='address',
+            name='country',
+            field=lettings.fields.CodeForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='addresses',
+                to='lettings.country'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the zip code centroid coordinates to the addresses.
+    They are filled by 'manage.py geocode_addresses'.
+    """
+
+    dependencies = [
+        ('lettings', '0005_country_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
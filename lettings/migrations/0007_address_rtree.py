@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+# Frozen copy of lettings.spatial.CREATE_INDEX_SQL at this migration
+CREATE_INDEX_SQL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS lettings_address_rtree USING rtree(id, min_lat, '
+    'max_lat, min_lon, max_lon)',
+    'DELETE FROM lettings_address_rtree',
+    'INSERT INTO lettings_address_rtree SELECT id, latitude, latitude, longitude, '
+    'longitude FROM lettings_address WHERE latitude IS NOT NULL AND longitude IS NOT '
+    'NULL',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_insert AFTER INSERT ON '
+    'lettings_address WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN '
+    'INSERT INTO lettings_address_rtree VALUES (new.id, new.latitude, new.latitude, '
+    'new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_update AFTER UPDATE OF '
+    'latitude, longitude ON lettings_address BEGIN DELETE FROM lettings_address_rtree '
+    'WHERE id = old.id; INSERT INTO lettings_address_rtree SELECT new.id, new.latitude, '
+    'new.latitude, new.longitude, new.longitude WHERE new.latitude IS NOT NULL AND '
+    'new.longitude IS NOT NULL; END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_delete AFTER DELETE ON '
+    'lettings_address BEGIN DELETE FROM lettings_address_rtree WHERE id = old.id; END',
+]
+
+# Frozen copy of lettings.spatial.DROP_INDEX_SQL at this migration
+DROP_INDEX_SQL = [
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_insert',
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_update',
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_delete',
+    'DROP TABLE IF EXISTS lettings_address_rtree',
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the R*Tree index of the address coordinates and the
+    triggers keeping it in sync with 'lettings_address'.
+    """
+
+    dependencies = [
+        ('lettings', '0006_address_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX_SQL, DROP_INDEX_SQL),
+    ]
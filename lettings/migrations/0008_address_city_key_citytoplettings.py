@@ -0,0 +1,72 @@
+from django.db import migrations, models
+import lettings.fields
+
+
+# Frozen copy of lettings.spatial.CREATE_INDEX_SQL at this migration
+CREATE_INDEX_SQL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS lettings_address_rtree USING rtree(id, min_lat, '
+    'max_lat, min_lon, max_lon)',
+    'DELETE FROM lettings_address_rtree',
+    'INSERT INTO lettings_address_rtree SELECT id, latitude, latitude, longitude, '
+    'longitude FROM lettings_address WHERE latitude IS NOT NULL AND longitude IS NOT '
+    'NULL',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_insert AFTER INSERT ON '
+    'lettings_address WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN '
+    'INSERT INTO lettings_address_rtree VALUES (new.id, new.latitude, new.latitude, '
+    'new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_update AFTER UPDATE OF '
+    'latitude, longitude ON lettings_address BEGIN DELETE FROM lettings_address_rtree '
+    'WHERE id = old.id; INSERT INTO lettings_address_rtree SELECT new.id, new.latitude, '
+    'new.latitude, new.longitude, new.longitude WHERE new.latitude IS NOT NULL AND '
+    'new.longitude IS NOT NULL; END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_delete AFTER DELETE ON '
+    'lettings_address BEGIN DELETE FROM lettings_address_rtree WHERE id = old.id; END',
+]
+
+
+def fill_city_keys(apps, schema_editor):
+    """
+    Computes the case-folded city of every address in one statement,
+    with Python's casefold() registered as an SQLite function.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    schema_editor.connection.connection.create_function(
+        'fold_city', 1, lambda city: ' '.join(city.split()).casefold(), deterministic=True
+    )
+    schema_editor.execute('UPDATE lettings_address SET city_key = fold_city(city)')
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the indexed case-folded city of the addresses and the
+    precomputed lettings lists of the favorite cities.
+    """
+
+    dependencies = [
+        ('lettings', '0007_address_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='city_key',
+            field=lettings.fields.FoldedKeyField(
+                db_index=True, default='', max_length=64, source='city'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_city_keys, migrations.RunPython.noop),
+        # Adding the column remade the address table, dropping its R*Tree triggers
+        migrations.RunSQL(CREATE_INDEX_SQL, migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name='CityTopLettings',
+            fields=[
+                ('city_key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('lettings', models.JSONField()),
+            ],
+            options={
+                'verbose_name_plural': 'City top lettings',
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations
+import oc_lettings_site.versions
+
+
+# Frozen copy of versions.backfill_sql('lettings_address') at this migration
+BACKFILL_LETTINGS_ADDRESS_SQL = [
+    'UPDATE lettings_address SET version = id + COALESCE((SELECT value FROM '
+    "oc_lettings_site_counter WHERE key = 'sync:version'), 0)",
+    "INSERT INTO oc_lettings_site_counter (key, value) VALUES ('sync:version', "
+    'COALESCE((SELECT MAX(version) FROM lettings_address), 0)) ON CONFLICT (key) DO '
+    'UPDATE SET value = MAX(value, excluded.value)',
+]
+
+# Frozen copy of versions.backfill_sql('lettings_letting') at this migration
+BACKFILL_LETTINGS_LETTING_SQL = [
+    'UPDATE lettings_letting SET version = id + COALESCE((SELECT value FROM '
+    "oc_lettings_site_counter WHERE key = 'sync:version'), 0)",
+    "INSERT INTO oc_lettings_site_counter (key, value) VALUES ('sync:version', "
+    'COALESCE((SELECT MAX(version) FROM lettings_letting), 0)) ON CONFLICT (key) DO '
+    'UPDATE SET value = MAX(value, excluded.value)',
+]
+
+# Frozen copy of lettings.spatial.CREATE_INDEX_SQL at this migration
+CREATE_INDEX_SQL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS lettings_address_rtree USING rtree(id, min_lat, '
+    'max_lat, min_lon, max_lon)',
+    'DELETE FROM lettings_address_rtree',
+    'INSERT INTO lettings_address_rtree SELECT id, latitude, latitude, longitude, '
+    'longitude FROM lettings_address WHERE latitude IS NOT NULL AND longitude IS NOT '
+    'NULL',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_insert AFTER INSERT ON '
+    'lettings_address WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN '
+    'INSERT INTO lettings_address_rtree VALUES (new.id, new.latitude, new.latitude, '
+    'new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_update AFTER UPDATE OF '
+    'latitude, longitude ON lettings_address BEGIN DELETE FROM lettings_address_rtree '
+    'WHERE id = old.id; INSERT INTO lettings_address_rtree SELECT new.id, new.latitude, '
+    'new.latitude, new.longitude, new.longitude WHERE new.latitude IS NOT NULL AND '
+    'new.longitude IS NOT NULL; END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_delete AFTER DELETE ON '
+    'lettings_address BEGIN DELETE FROM lettings_address_rtree WHERE id = old.id; END',
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the row versions of the lettings and addresses, numbered from
+    the shared clock.
+    """
+
+    dependencies = [
+        ('lettings', '0008_address_city_key_citytoplettings'),
+        ('oc_lettings_site', '0004_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='version',
+            field=oc_lettings_site.versions.VersionField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='letting',
+            name='version',
+            field=oc_lettings_site.versions.VersionField(db_index=True, default=0),
+        ),
+        migrations.RunSQL(BACKFILL_LETTINGS_ADDRESS_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_LETTINGS_LETTING_SQL, migrations.RunSQL.noop),
+        # Adding the column remade the address table, dropping its R*Tree triggers
+        migrations.RunSQL(CREATE_INDEX_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the active flag of the lettings and the archive tables the
+    inactive lettings and their addresses are moved to.
+    """
+
+    dependencies = [
+        ('lettings', '0009_letting_address_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='letting',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='letting',
+            index=models.Index(
+                condition=models.Q(('is_active', False)), fields=['id'],
+                name='letting_inactive_idx'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedAddress',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('number', models.PositiveIntegerField()),
+                ('street', models.CharField(max_length=64)),
+                ('city', models.CharField(max_length=64)),
+                ('state', models.ForeignKey(
+                    on_delete=django.db.models.deletion.PROTECT,
+                    related_name='+',
+                    to='lettings.state')),
+                ('zip_code', models.PositiveIntegerField()),
+                ('country', models.ForeignKey(
+                    on_delete=django.db.models.deletion.PROTECT,
+                    related_name='+',
+                    to='lettings.country')),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived addresses',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedLetting',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=256)),
+                ('address', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='lettings.archivedaddress')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Marks the stale lists of the favorite cities instead of deleting
+    them, with a generation and the time they were computed. The lists
+    stored so far are dropped, they are computed again on first use.
+    """
+
+    dependencies = [
+        ('lettings', '0010_letting_is_active_archive'),
+    ]
+
+    operations = [
+        migrations.RunSQL('DELETE FROM lettings_citytoplettings', migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='citytoplettings',
+            name='lettings',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='citytoplettings',
+            name='generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='citytoplettings',
+            name='computed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
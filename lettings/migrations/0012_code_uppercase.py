@@ -0,0 +1,42 @@
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Checks on the model fields that the country and state codes are
+    upper case, the rule the bulk validation already applied.
+    """
+
+    dependencies = [
+        ('lettings', '0011_citytoplettings_generation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='country',
+            name='code',
+            field=models.CharField(
+                max_length=3, unique=True,
+                validators=[
+                    django.core.validators.MinLengthValidator(3),
+                    django.core.validators.RegexValidator(
+                        '^[A-Z]+\\Z', 'Le code doit être en lettres majuscules.'
+                    ),
+                ],
+            ),
+        ),
+        migrations.AlterField(
+            model_name='state',
+            name='code',
+            field=models.CharField(
+                max_length=2, unique=True,
+                validators=[
+                    django.core.validators.MinLengthValidator(2),
+                    django.core.validators.RegexValidator(
+                        '^[A-Z]+\\Z', 'Le code doit être en lettres majuscules.'
+                    ),
+                ],
+            ),
+        ),
+    ]
@@ -1,22 +1,89 @@
+from urllib.parse import quote
+
 import sentry_sdk
-from django.db import models
-from django.core.validators import MaxValueValidator, MinLengthValidator
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.functions import Collate
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinLengthValidator, RegexValidator
+from django.utils import timezone
+
+from . import geocoding, registry
+from oc_lettings_site.snapshots import StoredValuesModel
+from oc_lettings_site.versions import VersionedModel
+from .fields import CodeForeignKey, FoldedKeyField, fold
+
+# Upper case letters only, the length is checked separately
+CODE_VALIDATOR = RegexValidator(r'^[A-Z]+\Z', "Le code doit être en lettres majuscules.")
+
+
+class Country(models.Model):
+    """
+    Reference row of a country, identified by its ISO 3166 alpha-3 code.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    code = models.CharField(
+        max_length=3, unique=True, validators=[MinLengthValidator(3), CODE_VALIDATOR]
+    )
+    name = models.CharField(max_length=64)
 
+    class Meta:
+        verbose_name_plural = "Countries"
 
-class Address(models.Model):
+    def __str__(self):
+        """
+        Returns the country code.
+        """
+        return self.code
+
+
+class State(models.Model):
+    """
+    Reference row of a state, identified by its two letters code.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    code = models.CharField(
+        max_length=2, unique=True, validators=[MinLengthValidator(2), CODE_VALIDATOR]
+    )
+    name = models.CharField(max_length=64)
+
+    def __str__(self):
+        """
+        Returns the state code.
+        """
+        return self.code
+
+
+class Address(StoredValuesModel, VersionedModel):
     """
     Represents a physical address with a street number,
     name, city, state, zip code, and country ISO code.
+    'state' and 'country' reference small tables read through the
+    in-process registry, they may be assigned a code string.
     """
+    # Compared by the signals with the saved values (counters, caches, typeahead)
+    STORED_FIELDS = ('city', 'city_key', 'state_id', 'country_id')
+
     number = models.PositiveIntegerField(validators=[MaxValueValidator(9999)])
     street = models.CharField(max_length=64)
     city = models.CharField(max_length=64)
-    state = models.CharField(max_length=2, validators=[MinLengthValidator(2)])
+    # Case-folded city, for indexed case-insensitive matches
+    city_key = FoldedKeyField(max_length=64, source='city', db_index=True)
+    state = CodeForeignKey(State, on_delete=models.PROTECT, related_name='addresses')
     zip_code = models.PositiveIntegerField(validators=[MaxValueValidator(99999)])
-    country_iso_code = models.CharField(max_length=3, validators=[MinLengthValidator(3)])
+    country = CodeForeignKey(Country, on_delete=models.PROTECT, related_name='addresses')
+    # Coordinates of the zip code, set on save from the GEOCODING_DATASET
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "Addresses"
+        indexes = [
+            # Case-insensitive indexes for the admin prefix searches
+            models.Index(Collate('city', 'nocase'), name='address_city_nocase_idx'),
+            models.Index(Collate('street', 'nocase'), name='address_street_nocase_idx'),
+        ]
 
     def __str__(self):
         """
@@ -24,6 +91,45 @@ class Address(models.Model):
         """
         return f'{self.number} {self.street}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Saving again only geocodes when the zip code changed
+        instance._geocoded_zip_code = instance.__dict__.get('zip_code')
+        return instance
+
+    @property
+    def country_iso_code(self):
+        return self.country.code
+
+    @country_iso_code.setter
+    def country_iso_code(self, code):
+        self.country = code
+
+    def new_references(self):
+        # Reference rows given by an unknown code, not saved yet
+        for field_name in registry.REGISTRIES:
+            row = self._meta.get_field(field_name).get_cached_value(self, None)
+            if row is not None and row.pk is None:
+                yield field_name, row
+
+    def clean_fields(self, exclude=None):
+        exclude = set(exclude or ())
+        errors = {}
+        for field_name, row in self.new_references():
+            # The row is created on save, only its code has to be valid
+            exclude.add(field_name)
+            try:
+                row.clean_fields(exclude={'name'})
+            except ValidationError as e:
+                errors[field_name] = e.message_dict['code']
+        try:
+            super().clean_fields(exclude=exclude)
+        except ValidationError as e:
+            errors.update(e.message_dict)
+        if errors:
+            raise ValidationError(errors)
+
     def clean(self):
         try:
             super().clean()
@@ -33,13 +139,48 @@ class Address(models.Model):
             sentry_sdk.capture_message("Erreur de validation dans le modèle Address")
             raise
 
+    def geocode(self):
+        """
+        Sets the coordinates from the zip code, clearing them if it is unknown.
+        """
+        self.latitude, self.longitude = geocoding.locate(self.zip_code) or (None, None)
+        self._geocoded_zip_code = self.zip_code
+
+    def save(self, *args, **kwargs):
+        for field_name, row in list(self.new_references()):
+            setattr(self, field_name, registry.REGISTRIES[field_name].resolve(row.code))
+        derived = set()
+        if getattr(self, '_geocoded_zip_code', None) != self.zip_code:
+            self.geocode()
+            derived.update(('latitude', 'longitude'))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'city' in update_fields:
+                derived.add('city_key')
+            kwargs['update_fields'] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
 
-class Letting(models.Model):
+
+class Letting(StoredValuesModel, VersionedModel):
     """
     Represents a rental listing associated with a specific address.
     """
+    # Compared by the signals with the saved values (counters, typeahead)
+    STORED_FIELDS = ('title', 'address_id', 'is_active')
+
     title = models.CharField(max_length=256)
     address = models.OneToOneField(Address, on_delete=models.CASCADE)
+    # Inactive lettings are moved to the archive tables by 'archive_lettings'
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(Collate('title', 'nocase'), name='letting_title_nocase_idx'),
+            # Only the few inactive rows, waiting to be archived
+            models.Index(
+                fields=['id'], condition=models.Q(is_active=False), name='letting_inactive_idx'
+            ),
+        ]
 
     def __str__(self):
         """
@@ -55,3 +196,258 @@ class Letting(models.Model):
             sentry_sdk.capture_exception(e)
             sentry_sdk.capture_message("Erreur de validation dans le modèle Letting")
             raise
+
+
+class LettingSummary(models.Model):
+    """
+    Flattened, read-optimized copy of a letting and its address.
+    Listing and detail pages read one row of this table instead of
+    joining 'Letting' with 'Address'. Only the active lettings, which
+    are listed, have a summary. Rows are kept up to date by the
+    lettings signals, bulk_create included, and rebuilt in bulk by
+    'rebuild_letting_summaries' after writes that send no signal.
+    """
+    letting = models.OneToOneField(
+        Letting, primary_key=True, on_delete=models.CASCADE, related_name='summary'
+    )
+    title = models.CharField(max_length=256)
+    address_line = models.CharField(max_length=80)
+    city = models.CharField(max_length=64)
+    state = models.CharField(max_length=2)
+    zip_code = models.PositiveIntegerField()
+    country_iso_code = models.CharField(max_length=3)
+
+    class Meta:
+        verbose_name_plural = "Letting summaries"
+
+    def __str__(self):
+        """
+        Returns the title of the summarized letting.
+        """
+        return self.title
+
+    @staticmethod
+    def address_fields(address):
+        """
+        Returns the summary fields copied from an address.
+        """
+        return {
+            'address_line': str(address),
+            'city': address.city,
+            'state': address.state.code,
+            'zip_code': address.zip_code,
+            'country_iso_code': address.country_iso_code,
+        }
+
+    @classmethod
+    def refresh(cls, letting):
+        """
+        Creates or updates the summary of a letting.
+        Args:
+            letting (Letting): The summarized letting, active.
+        Returns:
+            LettingSummary: The up to date summary.
+        """
+        summary, _created = cls.objects.update_or_create(
+            letting_id=letting.pk,
+            defaults={'title': letting.title, **cls.address_fields(letting.address)},
+        )
+        return summary
+
+    @classmethod
+    def insert_sql(cls, where=''):
+        """
+        Builds the statement summarizing the active lettings from the
+        lettings tables, replacing their existing summaries.
+        Args:
+            where (str): A condition on the lettings, 'l', to summarize.
+        Returns:
+            str: The INSERT ... SELECT statement.
+        """
+        quote = connection.ops.quote_name
+        return (
+            f'INSERT OR REPLACE INTO {quote(cls._meta.db_table)} '
+            '(letting_id, title, address_line, city, state, zip_code, country_iso_code) '
+            "SELECT l.id, l.title, CAST(a.number AS TEXT) || ' ' || a.street, "
+            'a.city, s.code, a.zip_code, c.code '
+            f'FROM {quote(Letting._meta.db_table)} l '
+            f'INNER JOIN {quote(Address._meta.db_table)} a ON a.id = l.address_id '
+            f'INNER JOIN {quote(State._meta.db_table)} s ON s.id = a.state_id '
+            f'INNER JOIN {quote(Country._meta.db_table)} c ON c.id = a.country_id '
+            'WHERE l.is_active'
+            + (f' AND ({where})' if where else '')
+        )
+
+    @classmethod
+    def refresh_many(cls, letting_ids):
+        """
+        Creates or updates the summaries of lettings, one statement per
+        500 lettings, for the lettings written by bulk_create.
+        Args:
+            letting_ids (list): The ids of the summarized lettings.
+        """
+        with connection.cursor() as cursor:
+            for start in range(0, len(letting_ids), 500):
+                batch = letting_ids[start:start + 500]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(cls.insert_sql(f'l.id IN ({placeholders})'), batch)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rewrites the summaries of the active lettings from the lettings
+        tables in one statement.
+        Returns:
+            int: The number of summaries written.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(cls._meta.db_table)}')
+            cursor.execute(cls.insert_sql())
+            return cursor.rowcount
+
+
+class CityTopLettings(models.Model):
+    """
+    Precomputed list of the latest lettings of a city, shown on the
+    profiles whose favorite city it is. Rows are computed on first use,
+    and marked stale by the lettings signals when a letting of the city
+    changes: the generation taken by the mark keeps a list computed before
+    the change from being stored after it. Lists are also computed again
+    after FAVORITE_CITY_LIST_MAX_AGE seconds.
+    """
+    city_key = models.CharField(max_length=64, primary_key=True)
+    # None once stale
+    lettings = models.JSONField(null=True)
+    generation = models.PositiveBigIntegerField(default=0)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "City top lettings"
+
+    def __str__(self):
+        """
+        Returns the key of the city.
+        """
+        return self.city_key
+
+    @classmethod
+    def for_city(cls, city):
+        """
+        Returns the latest lettings of a city, whatever its case. A city
+        may be the favorite of thousands of profiles, whose pages are all
+        removed when its lettings change: the list goes through the shared
+        cache, so the workers serving them compute it once.
+        Args:
+            city (str): The city name.
+        Returns:
+            list: Up to FAVORITE_CITY_LETTINGS dicts with the 'id' and
+            'title' of a letting, latest first.
+        """
+        key = fold(city or '')
+        if not key:
+            return []
+        return cache.get_or_set(
+            cls.cache_key(key), lambda: cls.load(key), settings.FAVORITE_CITY_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def cache_key(city_key):
+        # Keys without spaces, which some cache backends reject
+        return f'lettings:city:{quote(city_key)}'
+
+    @classmethod
+    def load(cls, key):
+        row = cls.objects.filter(city_key=key).values_list(
+            'lettings', 'generation', 'computed_at'
+        ).first()
+        expired = timezone.now() - timezone.timedelta(seconds=settings.FAVORITE_CITY_LIST_MAX_AGE)
+        if row is not None and row[0] is not None and row[2] > expired:
+            return row[0]
+        lettings = [
+            {'id': letting_id, 'title': title}
+            for letting_id, title in Letting.objects.filter(address__city_key=key, is_active=True)
+            .order_by('-pk').values_list('pk', 'title')[:settings.FAVORITE_CITY_LETTINGS]
+        ]
+        if row is None:
+            # Left out if the city was marked stale, or computed, meanwhile
+            cls.objects.bulk_create(
+                [cls(city_key=key, lettings=lettings)], ignore_conflicts=True
+            )
+        else:
+            # Left out if the city was marked stale again meanwhile
+            cls.objects.filter(city_key=key, generation=row[1]).update(
+                lettings=lettings, computed_at=timezone.now()
+            )
+        return lettings
+
+    @classmethod
+    def invalidate(cls, *city_keys):
+        keys = sorted({key for key in city_keys if key})
+        if keys:
+            # Marks rather than deletes, so a list computed before the
+            # change cannot be stored after it
+            cls.objects.bulk_create(
+                [cls(city_key=key, lettings=None) for key in keys], ignore_conflicts=True
+            )
+            cls.objects.filter(city_key__in=keys).update(
+                lettings=None, generation=models.F('generation') + 1
+            )
+            # Once committed, or a request could cache the old rows again
+            cached = [cls.cache_key(key) for key in keys]
+            transaction.on_commit(lambda: cache.delete_many(cached))
+
+
+class ArchivedAddress(models.Model):
+    """
+    Address of an archived letting, moved out of 'Address' with the same id.
+    """
+    id = models.IntegerField(primary_key=True)
+    number = models.PositiveIntegerField()
+    street = models.CharField(max_length=64)
+    city = models.CharField(max_length=64)
+    state = models.ForeignKey(State, on_delete=models.PROTECT, related_name='+')
+    zip_code = models.PositiveIntegerField()
+    country = models.ForeignKey(Country, on_delete=models.PROTECT, related_name='+')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Archived addresses"
+
+    def __str__(self):
+        """
+        Returns a string representation of the address in the format: 'number street'.
+        """
+        return f'{self.number} {self.street}'
+
+
+class ArchivedLetting(models.Model):
+    """
+    Letting no longer listed, moved out of 'Letting' with the same id so
+    its page stays reachable. Moved in bulk by 'archive_lettings'.
+    """
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=256)
+    address = models.OneToOneField(ArchivedAddress, on_delete=models.CASCADE)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """
+        Returns the title of the letting.
+        """
+        return self.title
+
+    def summary(self):
+        """
+        Returns an unsaved summary of the letting, for the letting page.
+        """
+        address = self.address
+        return LettingSummary(
+            letting_id=self.pk,
+            title=self.title,
+            address_line=str(address),
+            city=address.city,
+            state=registry.states.get_by_id(address.state_id).code,
+            zip_code=address.zip_code,
+            country_iso_code=registry.countries.get_by_id(address.country_id).code,
+        )
@@ -0,0 +1,119 @@
+import threading
+
+from django.apps import apps
+from django.db import transaction
+
+
+class ReferenceRegistry:
+    """
+    In-process copy of a small reference table (states, countries), loaded
+    on first use and kept for the life of the worker. Lookups by code or by
+    id cost no query. Rows created through resolve() are only added once
+    their transaction commits, so a rollback never leaves a stale entry.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.by_code = None
+        self.by_id = None
+
+    @property
+    def model(self):
+        return apps.get_model('lettings', self.model_name)
+
+    def load(self):
+        """
+        Reads the whole reference table, replacing the cached rows.
+        Returns:
+            tuple: The rows keyed by code, and keyed by id.
+        """
+        rows = list(self.model.objects.all())
+        by_code = {row.code: row for row in rows}
+        by_id = {row.pk: row for row in rows}
+        with self.lock:
+            self.by_code = by_code
+            self.by_id = by_id
+        return by_code, by_id
+
+    def clear(self):
+        with self.lock:
+            self.by_code = None
+            self.by_id = None
+
+    def add(self, row):
+        with self.lock:
+            if self.by_code is not None:
+                self.by_code[row.code] = row
+                self.by_id[row.pk] = row
+
+    def get(self, code):
+        """
+        Returns the cached row of a code.
+        Args:
+            code (str): The state or country code.
+        Returns:
+            Model: The row, None if the code is unknown to this worker.
+        """
+        # Read once, clear() may reset the attribute from another thread
+        by_code = self.by_code
+        if by_code is None:
+            by_code, _by_id = self.load()
+        return by_code.get(code)
+
+    def get_by_id(self, pk):
+        """
+        Returns the row of an id, read from the database on a miss
+        (a row added by another worker).
+        Args:
+            pk (int): The row id.
+        Returns:
+            Model: The row, None if it does not exist.
+        """
+        by_id = self.by_id
+        if by_id is None:
+            _by_code, by_id = self.load()
+        row = by_id.get(pk)
+        if row is None:
+            row = self.model.objects.filter(pk=pk).first()
+            if row is not None:
+                transaction.on_commit(lambda: self.add(row))
+        return row
+
+    def label(self, code):
+        """
+        Returns the display name of a code, without any query once loaded.
+        Args:
+            code (str): The state or country code.
+        Returns:
+            str: The name, or the code itself if it is unknown.
+        """
+        row = self.get(code)
+        return row.name if row is not None else code
+
+    def resolve(self, code):
+        """
+        Returns the row of a code, creating it if needed.
+        Args:
+            code (str): The state or country code.
+        Returns:
+            Model: The saved row.
+        """
+        row = self.get(code)
+        if row is None:
+            row, _created = self.model.objects.get_or_create(code=code, defaults={'name': code})
+            transaction.on_commit(lambda: self.add(row))
+        return row
+
+
+states = ReferenceRegistry('State')
+countries = ReferenceRegistry('Country')
+
+REGISTRIES = {
+    'state': states,
+    'country': countries,
+}
+
+
+def registry_for(model):
+    return REGISTRIES[model._meta.model_name]
@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from oc_lettings_site.versions import rows_bulk_created
+from . import batch, registry
+from .models import Address, CityTopLettings, Country, Letting, LettingSummary, State
+
+
+# Sent with 'city_keys' when the latest lettings of cities may have changed
+city_lettings_changed = Signal()
+
+
+def invalidate_cities(*city_keys):
+    keys = {key for key in city_keys if key}
+    if keys:
+        CityTopLettings.invalidate(*keys)
+        city_lettings_changed.send(sender=CityTopLettings, city_keys=keys)
+
+
+@receiver(post_save, sender=Letting)
+def refresh_letting_summary(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    if instance.is_active:
+        LettingSummary.refresh(instance)
+    else:
+        # Not listed anymore, until it is archived
+        LettingSummary.objects.filter(pk=instance.pk).delete()
+
+
+@receiver(rows_bulk_created, sender=Letting)
+def summarize_bulk_lettings(sender, objs, **kwargs):
+    # Without a primary key when bulk_create ignored conflicts
+    LettingSummary.refresh_many([letting.pk for letting in objs if letting.pk is not None])
+
+
+@receiver(rows_bulk_created, sender=Letting)
+def invalidate_bulk_lettings_cities(sender, objs, **kwargs):
+    address_ids = [letting.address_id for letting in objs if letting.pk is not None]
+    city_keys = set()
+    for start in range(0, len(address_ids), 500):
+        city_keys.update(
+            Address.objects.filter(pk__in=address_ids[start:start + 500])
+            .values_list('city_key', flat=True)
+        )
+    invalidate_cities(*city_keys)
+
+
+@receiver(post_save, sender=Address)
+def refresh_address_summary(sender, instance, created, raw, **kwargs):
+    if created or raw:
+        # A new address has no letting, hence no summary, yet
+        return
+    LettingSummary.objects.filter(letting__address_id=instance.pk).update(
+        **LettingSummary.address_fields(instance)
+    )
+
+
+@receiver(post_save, sender=Letting)
+@receiver(post_delete, sender=Letting)
+def invalidate_letting_city(sender, instance, **kwargs):
+    # Cached by the summary refresh on save
+    invalidate_cities(instance.address.city_key)
+    batch.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def invalidate_address_city(sender, instance, created=False, **kwargs):
+    if created:
+        # A new address has no letting yet
+        return
+    # The list of the previous city too, when the address moved
+    invalidate_cities(instance.city_key, instance.stored_value('city_key'))
+    batch.invalidate(*Letting.objects.filter(address=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def clear_reference_registry(sender, instance, **kwargs):
+    # Reloaded on next use, once the change is visible to other connections
+    transaction.on_commit(registry.registry_for(sender).clear)
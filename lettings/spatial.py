@@ -0,0 +1,126 @@
+import math
+
+from django.db import connection
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+INDEX_TABLE = 'lettings_address_rtree'
+
+# Radius of the first box searched, doubled until enough lettings are found
+FIRST_RADIUS_KM = 2.0
+# Candidates kept by SQL for each letting returned
+CANDIDATES_PER_RESULT = 2
+
+# R*Tree of the geocoded addresses, one point box per address, kept in sync
+# with 'lettings_address' by triggers. A migration that remakes the address
+# table drops the triggers, it has to run a frozen copy of CREATE_INDEX_SQL.
+CREATE_INDEX_SQL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} '
+    'USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+    f'DELETE FROM {INDEX_TABLE}',
+    f'INSERT INTO {INDEX_TABLE} '
+    'SELECT id, latitude, latitude, longitude, longitude FROM lettings_address '
+    'WHERE latitude IS NOT NULL AND longitude IS NOT NULL',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_insert '
+    'AFTER INSERT ON lettings_address '
+    'WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN '
+    f'INSERT INTO {INDEX_TABLE} '
+    'VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_update '
+    'AFTER UPDATE OF latitude, longitude ON lettings_address BEGIN '
+    f'DELETE FROM {INDEX_TABLE} WHERE id = old.id; '
+    f'INSERT INTO {INDEX_TABLE} '
+    'SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude '
+    'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END',
+    'CREATE TRIGGER IF NOT EXISTS lettings_address_rtree_delete '
+    'AFTER DELETE ON lettings_address BEGIN '
+    f'DELETE FROM {INDEX_TABLE} WHERE id = old.id; END',
+]
+
+DROP_INDEX_SQL = [
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_insert',
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_update',
+    'DROP TRIGGER IF EXISTS lettings_address_rtree_delete',
+    f'DROP TABLE IF EXISTS {INDEX_TABLE}',
+]
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Computes the great circle distance between two points (haversine).
+    Returns:
+        float: The distance in kilometers.
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Computes a box holding every point within a radius.
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon), the longitudes span
+        the whole globe near the poles or across the antimeridian.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    # The box is widest at the latitude of its edge closest to a pole
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    if dlon >= 180.0 or longitude - dlon < -180.0 or longitude + dlon > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, longitude - dlon, longitude + dlon
+
+
+def nearby_lettings(latitude, longitude, radius_km, limit):
+    """
+    Finds the closest lettings to a point. The R*Tree is searched by
+    bounding box from FIRST_RADIUS_KM, doubled until the circle holds
+    'limit' lettings or reaches the radius, so a dense area never reads
+    every address of the radius. In each box SQLite keeps the closest
+    candidates by planar distance (degrees of longitude scaled to the
+    latitude), then they are ranked by great circle distance (from the
+    index coordinates, 32 bit floats accurate to about a meter).
+    Args:
+        latitude (float): The latitude of the point.
+        longitude (float): The longitude of the point.
+        radius_km (float): The search radius, in kilometers.
+        limit (int): The maximum number of lettings returned.
+    Returns:
+        list: (distance in km, letting id) pairs, closest first.
+    """
+    scale = math.cos(math.radians(latitude))
+    step_km = min(FIRST_RADIUS_KM, radius_km)
+    with connection.cursor() as cursor:
+        while True:
+            min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, step_km)
+            cursor.execute(
+                f'SELECT l.id, r.min_lat, r.min_lon FROM {INDEX_TABLE} r '
+                'JOIN lettings_letting l ON l.address_id = r.id '
+                'WHERE r.max_lat >= %s AND r.min_lat <= %s '
+                'AND r.max_lon >= %s AND r.min_lon <= %s '
+                'ORDER BY (r.min_lat - %s) * (r.min_lat - %s) '
+                '+ (min(abs(r.min_lon - %s), 360 - abs(r.min_lon - %s)) * %s) '
+                '* (min(abs(r.min_lon - %s), 360 - abs(r.min_lon - %s)) * %s) '
+                'LIMIT %s',
+                [min_lat, max_lat, min_lon, max_lon, latitude, latitude]
+                + [longitude, longitude, scale] * 2
+                # Room for the planar ranking to differ from the exact one
+                + [limit * CANDIDATES_PER_RESULT],
+            )
+            # The box is wider than the circle, the exact distance settles the corners
+            distances = (
+                (distance_km(latitude, longitude, lat, lon), letting_id)
+                for letting_id, lat, lon in cursor.fetchall()
+            )
+            nearest = sorted(pair for pair in distances if pair[0] <= step_km)[:limit]
+            if len(nearest) >= limit or step_km >= radius_km:
+                return nearest
+            step_km = min(step_km * 2, radius_km)
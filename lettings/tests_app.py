@@ -1,9 +1,27 @@
+import os
+import tempfile
 import sentry_sdk
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.template.exceptions import TemplateDoesNotExist
-from .models import Address, Letting
+from oc_lettings_site import counters, errors
+from oc_lettings_site.models import ChangeLog, Tombstone
+from oc_lettings_site.pagination import EstimatedCountPaginator
+from . import batch, facets, geocoding, registry, spatial
+from .models import (
+    Address, ArchivedAddress, ArchivedLetting, CityTopLettings, Country, Letting,
+    LettingSummary, State
+)
+from .validation import validate_addresses
 
 
 class AddressModelTest(TestCase):
@@ -31,7 +49,7 @@ class AddressModelTest(TestCase):
         self.assertEqual(self.address.number, 1)
         self.assertEqual(self.address.street, "Test Street")
         self.assertEqual(self.address.city, "Test City")
-        self.assertEqual(self.address.state, "TS")
+        self.assertEqual(self.address.state.code, "TS")
         self.assertEqual(self.address.zip_code, 12345)
         self.assertEqual(self.address.country_iso_code, "TST")
 
@@ -353,8 +371,8 @@ class LettingViewTest(TestCase):
 
         sentry_calls = []
 
-        def mock_capture_exception(exc):
-            sentry_calls.append(('exception', exc))
+        def mock_capture_exception(exc, contexts=None):
+            sentry_calls.append(('exception', exc, contexts))
             return None
 
         def mock_capture_message(message):
@@ -372,6 +390,8 @@ class LettingViewTest(TestCase):
             sentry_sdk.capture_exception = mock_capture_exception
             sentry_sdk.capture_message = mock_capture_message
 
+            errors.reporter.reset()
+
             # Appeler la vue
             response = self.client.get(reverse('lettings:index'))
 
@@ -383,13 +403,11 @@ class LettingViewTest(TestCase):
             self.assertEqual(sentry_calls[0][0], 'exception')
             self.assertTrue(isinstance(sentry_calls[0][1], TemplateDoesNotExist))
 
-            # Vérifier le message spécifique
-            message_found = False
-            for call in sentry_calls:
-                if call[0] == 'message' and call[1] == "Erreur dans lettings.views index.":
-                    message_found = True
-                    break
-            self.assertTrue(message_found)
+            # Vérifier qu'un seul rapport porte le message
+            self.assertEqual(len(sentry_calls), 1)
+            self.assertEqual(
+                sentry_calls[0][2]['report']['message'], "Erreur dans lettings.views index."
+            )
 
         finally:
             # Restaurer les fonctions originales
@@ -410,8 +428,8 @@ class LettingViewTest(TestCase):
 
         sentry_calls = []
 
-        def mock_capture_exception(exc):
-            sentry_calls.append(('exception', exc))
+        def mock_capture_exception(exc, contexts=None):
+            sentry_calls.append(('exception', exc, contexts))
             return None
 
         def mock_capture_message(message):
@@ -429,6 +447,8 @@ class LettingViewTest(TestCase):
             sentry_sdk.capture_exception = mock_capture_exception
             sentry_sdk.capture_message = mock_capture_message
 
+            errors.reporter.reset()
+
             # Appeler la vue
             response = self.client.get(reverse('lettings:letting', args=[self.letting.id]))
 
@@ -440,16 +460,881 @@ class LettingViewTest(TestCase):
             self.assertEqual(sentry_calls[0][0], 'exception')
             self.assertTrue(isinstance(sentry_calls[0][1], TemplateDoesNotExist))
 
-            # Vérifier le message spécifique
-            message_found = False
-            for call in sentry_calls:
-                if call[0] == 'message' and call[1] == "Erreur dans lettings.views index.":
-                    message_found = True
-                    break
-            self.assertTrue(message_found)
+            # Vérifier qu'un seul rapport porte le message
+            self.assertEqual(len(sentry_calls), 1)
+            self.assertEqual(
+                sentry_calls[0][2]['report']['message'], "Erreur dans lettings.views letting."
+            )
 
         finally:
             # Restaurer les fonctions originales
             Engine.find_template = original_find_template
             sentry_sdk.capture_exception = original_capture_exception
             sentry_sdk.capture_message = original_capture_message
+
+
+def create_letting(index):
+    """
+    Creates a letting and its address for tests that need many rows.
+    """
+    address = Address.objects.create(
+        number=index,
+        street=f"Street {index}",
+        city="Test City",
+        state="TS",
+        zip_code=12345,
+        country_iso_code="TST"
+    )
+    return Letting.objects.create(title=f"Letting {index}", address=address)
+
+
+class LettingAdminTest(TestCase):
+    """
+    Test case for the Letting and Address admin pages.
+    """
+
+    def setUp(self):
+        """
+        Logs a superuser in and creates a few lettings.
+        """
+        self.admin = User.objects.create_superuser(
+            username="admin", email="admin@test.com", password="adminpassword"
+        )
+        self.client.force_login(self.admin)
+        for index in range(1, 4):
+            create_letting(index)
+
+    def count_changelist_queries(self, url):
+        """Returns the number of queries needed to render a changelist"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_letting_changelist_queries_do_not_grow_with_rows(self):
+        """
+        Test that the letting changelist joins the address instead of
+        querying it once per row.
+        """
+        url = reverse('admin:lettings_letting_changelist')
+        before = self.count_changelist_queries(url)
+        for index in range(4, 10):
+            create_letting(index)
+
+        self.assertEqual(self.count_changelist_queries(url), before)
+
+    def test_letting_changelist_search(self):
+        """Test that the title prefix search finds the letting"""
+        response = self.client.get(
+            reverse('admin:lettings_letting_changelist'), {'q': '"letting 2"'}
+        )
+        self.assertContains(response, "Letting 2")
+        self.assertNotContains(response, "Letting 3")
+
+    def test_address_changelist_search(self):
+        """Test that the street prefix search finds the address"""
+        response = self.client.get(
+            reverse('admin:lettings_address_changelist'), {'q': '"street 3"'}
+        )
+        self.assertContains(response, "3 Street 3")
+        self.assertNotContains(response, "1 Street 1")
+
+    def test_letting_form_uses_autocomplete(self):
+        """Test that the address is not rendered as a full <select>"""
+        response = self.client.get(reverse('admin:lettings_letting_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, "1 Street 1")
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    """
+    Test case for the paginator estimating the total of large tables.
+    """
+
+    def setUp(self):
+        """
+        Creates three lettings then deletes the second one.
+        """
+        self.lettings = [create_letting(index) for index in range(1, 4)]
+        self.lettings[1].address.delete()
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=0)
+    def test_unfiltered_count_uses_counter(self):
+        """Test that a model with a maintained counter is counted exactly"""
+        paginator = EstimatedCountPaginator(Address.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, 2)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=0)
+    def test_unfiltered_count_is_estimated(self):
+        """Test that a model without counter is counted from the highest key"""
+        users = [User.objects.create_user(username=f"user{index}") for index in range(3)]
+        users[1].delete()
+
+        paginator = EstimatedCountPaginator(User.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, users[2].id)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=0)
+    def test_filtered_count_is_exact(self):
+        """Test that a filtered queryset is counted exactly"""
+        queryset = Letting.objects.filter(title__startswith="Letting").order_by('id')
+        self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 2)
+
+    def test_small_table_count_is_exact(self):
+        """Test that tables under the threshold are counted exactly"""
+        users = [User.objects.create_user(username=f"user{index}") for index in range(3)]
+        users[1].delete()
+
+        paginator = EstimatedCountPaginator(User.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, 2)
+
+
+class LettingSummaryTest(TestCase):
+    """
+    Test case for the flattened LettingSummary read model.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting, which summarizes it.
+        """
+        self.letting = create_letting(1)
+
+    def test_summary_created_with_letting(self):
+        """Test that saving a letting writes its summary"""
+        summary = LettingSummary.objects.get(pk=self.letting.pk)
+        self.assertEqual(summary.title, "Letting 1")
+        self.assertEqual(summary.address_line, "1 Street 1")
+        self.assertEqual(summary.city, "Test City")
+        self.assertEqual(summary.zip_code, 12345)
+
+    def test_summary_follows_letting_and_address_updates(self):
+        """Test that letting and address updates reach the summary"""
+        self.letting.title = "Renamed"
+        self.letting.save()
+        address = self.letting.address
+        address.street = "New Street"
+        address.city = "New City"
+        address.save()
+
+        summary = LettingSummary.objects.get(pk=self.letting.pk)
+        self.assertEqual(summary.title, "Renamed")
+        self.assertEqual(summary.address_line, "1 New Street")
+        self.assertEqual(summary.city, "New City")
+
+    def test_summary_deleted_with_address(self):
+        """Test that deleting the address removes the summary"""
+        self.letting.address.delete()
+        self.assertFalse(LettingSummary.objects.exists())
+
+    def test_summary_created_with_bulk_created_letting(self):
+        """Test that bulk_create summarizes the lettings it inserts"""
+        address = Address.objects.create(
+            number=2, street="Bulk Street", city="Bulk City", state="BC",
+            zip_code=54321, country_iso_code="BLK"
+        )
+        letting, = Letting.objects.bulk_create([Letting(title="Bulk Letting", address=address)])
+
+        summary = LettingSummary.objects.get(pk=letting.pk)
+        self.assertEqual((summary.title, summary.address_line, summary.state),
+                         ("Bulk Letting", "2 Bulk Street", "BC"))
+        self.assertContains(self.client.get(reverse('lettings:index')), "Bulk Letting")
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command rewrites missing and stale summaries"""
+        address = Address.objects.create(
+            number=2, street="Bulk Street", city="Bulk City", state="BC",
+            zip_code=54321, country_iso_code="BLK"
+        )
+        Letting.objects.bulk_create([Letting(title="Bulk Letting", address=address)])
+        LettingSummary.objects.exclude(pk=self.letting.pk).delete()
+        LettingSummary.objects.filter(pk=self.letting.pk).update(title="Stale")
+
+        call_command('rebuild_letting_summaries', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(LettingSummary.objects.values_list('title', 'address_line')),
+            [("Bulk Letting", "2 Bulk Street"), ("Letting 1", "1 Street 1")],
+        )
+
+    def test_views_read_one_table(self):
+        """Test that the index and detail views need a single query"""
+        with self.assertNumQueries(4):
+            # The emptiness check, the lettings list, the lettings counter
+            # and the facet counters
+            self.client.get(reverse('lettings:index'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('lettings:letting', args=[self.letting.pk]))
+        self.assertContains(response, "1 Street 1")
+
+    def test_detail_view_summarizes_missing_letting(self):
+        """Test that the detail view falls back to the lettings tables"""
+        LettingSummary.objects.all().delete()
+
+        response = self.client.get(reverse('lettings:letting', args=[self.letting.pk]))
+
+        self.assertContains(response, "1 Street 1")
+        self.assertTrue(LettingSummary.objects.filter(pk=self.letting.pk).exists())
+
+
+@override_settings(STREAMING_LIST_THRESHOLD=3, STREAMING_CHUNK_SIZE=2)
+class StreamingIndexTest(TestCase):
+    """
+    Test case for the streamed lettings index.
+    """
+
+    def setUp(self):
+        """
+        Creates five lettings, above the streaming threshold.
+        """
+        for index in range(1, 6):
+            create_letting(index)
+
+    def test_large_index_is_streamed(self):
+        """Test that the page is sent as head, row chunks and tail"""
+        response = self.client.get(reverse('lettings:index'))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+
+        self.assertTrue(response.streaming)
+        self.assertIn("5 lettings available", chunks[0])
+        self.assertNotIn("Letting 1", chunks[0])
+        # Five rows in chunks of two
+        self.assertEqual(len(chunks), 5)
+        page = ''.join(chunks)
+        positions = [page.index(f"Letting {index}<") for index in range(1, 6)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertTrue(page.rstrip().endswith("</html>"))
+
+    def test_small_index_is_not_streamed(self):
+        """Test that lists under the threshold render as a single response"""
+        with self.settings(STREAMING_LIST_THRESHOLD=10):
+            response = self.client.get(reverse('lettings:index'))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "Letting 5")
+
+    def test_streaming_error_closes_page(self):
+        """Test that an error while streaming is reported and the page closed"""
+        captured = []
+
+        def failing_iterator(queryset, chunk_size=None):
+            raise Exception("Test exception")
+            yield
+
+        original_capture_exception = sentry_sdk.capture_exception
+        original_iterator = QuerySet.iterator
+        sentry_sdk.capture_exception = lambda exc, contexts=None: captured.append(exc)
+        QuerySet.iterator = failing_iterator
+        errors.reporter.reset()
+        try:
+            response = self.client.get(reverse('lettings:index'))
+            page = b''.join(response.streaming_content).decode()
+        finally:
+            # Restore original methods
+            sentry_sdk.capture_exception = original_capture_exception
+            QuerySet.iterator = original_iterator
+
+        self.assertEqual(len(captured), 1)
+        self.assertEqual(str(captured[0]), "Test exception")
+        self.assertNotIn("Letting 1<", page)
+        self.assertTrue(page.rstrip().endswith("</html>"))
+
+
+class AddressBatchValidationTest(TestCase):
+    """
+    Test case for the batch validation of addresses.
+    """
+
+    def setUp(self):
+        """
+        Replaces the Sentry message capture.
+        """
+        self.reports = []
+        self.original_capture_message = sentry_sdk.capture_message
+        sentry_sdk.capture_message = (
+            lambda message, **kwargs: self.reports.append((message, kwargs))
+        )
+
+    def tearDown(self):
+        sentry_sdk.capture_message = self.original_capture_message
+
+    @staticmethod
+    def row(**values):
+        row = {
+            'number': 1, 'street': "Test Street", 'city': "Brunswick",
+            'state': "GA", 'zip_code': 31525, 'country_iso_code': "USA",
+        }
+        row.update(values)
+        return row
+
+    def test_valid_rows(self):
+        """Test that valid dicts and instances pass without any report"""
+        rows = [self.row(), Address(**self.row(number=9999, zip_code=0))]
+        result = validate_addresses(rows)
+
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.valid_rows(), [0, 1])
+        self.assertEqual(self.reports, [])
+
+    def test_structured_errors(self):
+        """Test that every failed check is returned with its row and code"""
+        rows = [
+            self.row(),
+            self.row(number=10000, zip_code=-1),
+            self.row(state="G", country_iso_code="usa"),
+            self.row(street="", city="x" * 65, number="12a"),
+        ]
+        result = validate_addresses(rows)
+
+        self.assertEqual(result.valid_rows(), [0])
+        self.assertEqual(
+            [(error['field'], error['code']) for error in result.errors_by_row()[1]],
+            [('number', 'max_value'), ('zip_code', 'min_value')],
+        )
+        self.assertEqual(
+            sorted((error['field'], error['code']) for error in result.errors_by_row()[2]),
+            [('country_iso_code', 'invalid'), ('state', 'min_length')],
+        )
+        self.assertEqual(
+            sorted((error['field'], error['code']) for error in result.errors_by_row()[3]),
+            [('city', 'max_length'), ('number', 'invalid'), ('street', 'required')],
+        )
+
+    def test_allowed_codes(self):
+        """Test that codes outside the allowed sets are rejected"""
+        result = validate_addresses(
+            [self.row(), self.row(state="ZZ")], states={"GA"}, countries={"USA"}
+        )
+        self.assertEqual(
+            [(error['row'], error['code']) for error in result.errors], [(1, 'invalid_choice')]
+        )
+
+    def test_single_report_per_batch(self):
+        """Test that a batch sends one aggregated report, whatever its errors"""
+        rows = [self.row(number=10000) for _ in range(500)] + [self.row(state="g")]
+        result = validate_addresses(rows)
+
+        self.assertEqual(len(result.invalid_rows()), 501)
+        self.assertEqual(len(self.reports), 1)
+        message, kwargs = self.reports[0]
+        self.assertIn("501 adresses invalides sur 501", message)
+        self.assertEqual(
+            kwargs['contexts']['validation'],
+            {'number:max_value': 500, 'state:invalid': 1, 'state:min_length': 1},
+        )
+
+    def test_numeric_strings(self):
+        """Test that numbers given as strings are coerced like the model fields do"""
+        rows = [self.row(number="12", zip_code="31525"), self.row(number="10000")]
+        result = validate_addresses(rows, report=False)
+
+        self.assertEqual(
+            [(error['row'], error['code']) for error in result.errors], [(1, 'max_value')]
+        )
+
+    def test_empty_integer_cells_required(self):
+        """Test that empty integer cells are reported as required, not invalid"""
+        rows = [self.row(number=""), self.row(zip_code="  "), self.row(number=None)]
+        result = validate_addresses(rows, report=False)
+
+        self.assertEqual(
+            [(error['row'], error['field'], error['code']) for error in result.errors],
+            [(0, 'number', 'required'), (1, 'zip_code', 'required'), (2, 'number', 'required')],
+        )
+
+
+class ReferenceRegistryTest(TestCase):
+    """
+    Test case for the state and country reference tables and their registry.
+    """
+
+    def setUp(self):
+        """
+        Loads the registry and creates a letting in Georgia.
+        """
+        registry.states.load()
+        registry.countries.load()
+        self.address = Address.objects.create(
+            number=1, street="Ocean Drive", city="Brunswick",
+            state="GA", zip_code=31525, country_iso_code="USA"
+        )
+        self.letting = Letting.objects.create(title="Beach House", address=self.address)
+
+    def test_migration_seeds_references(self):
+        """Test that the known states and countries are seeded with their names"""
+        self.assertEqual(State.objects.get(code="GA").name, "Georgia")
+        self.assertEqual(Country.objects.get(code="USA").name, "United States")
+        self.assertEqual(self.address.state, State.objects.get(code="GA"))
+
+    def test_references_read_without_queries(self):
+        """Test that codes and labels are resolved from the registry"""
+        address = Address.objects.get(pk=self.address.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(address.state.code, "GA")
+            self.assertEqual(address.country_iso_code, "USA")
+            self.assertEqual(registry.states.label("GA"), "Georgia")
+            self.assertEqual(registry.countries.label("XYZ"), "XYZ")
+
+    def test_lookup_survives_concurrent_clear(self):
+        """Test that a lookup still answers when another thread clears the registry"""
+        states = registry.states
+        load = states.load
+
+        def load_then_clear():
+            tables = load()
+            # A State created by another request commits meanwhile
+            states.clear()
+            return tables
+
+        states.clear()
+        with mock.patch.object(states, 'load', side_effect=load_then_clear):
+            self.assertEqual(states.get("GA").name, "Georgia")
+            self.assertEqual(states.get_by_id(self.address.state_id).code, "GA")
+
+    def test_detail_view_shows_labels(self):
+        """Test that the detail page shows the state and country names"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('lettings:letting', args=[self.letting.pk]))
+        self.assertContains(response, '<abbr title="Georgia">GA</abbr>')
+        self.assertContains(response, "United States")
+
+    def test_unknown_code_created_on_save(self):
+        """Test that an unknown code is validated, then created on save"""
+        address = Address(
+            number=2, street="Main Street", city="Kingston",
+            state="JM", zip_code=12345, country_iso_code="JAM"
+        )
+        address.full_clean()
+        address.save()
+
+        self.assertEqual(State.objects.get(code="JM").name, "JM")
+        self.assertEqual(address.country.code, "JAM")
+
+        with self.assertRaises(ValidationError) as raised:
+            Address(
+                number=2, street="Main Street", city="Kingston",
+                state="J", zip_code=12345, country_iso_code="JAM"
+            ).full_clean()
+        self.assertEqual(list(raised.exception.message_dict), ['state'])
+
+    def test_lower_case_codes_rejected(self):
+        """Test that the model fields reject the codes the bulk validation rejects"""
+        with self.assertRaises(ValidationError) as raised:
+            Country(code="jam", name="Jamaica").full_clean()
+        self.assertEqual(list(raised.exception.message_dict), ['code'])
+
+        with self.assertRaises(ValidationError) as raised:
+            Address(
+                number=2, street="Main Street", city="Kingston",
+                state="jm", zip_code=12345, country_iso_code="JAM"
+            ).full_clean()
+        self.assertEqual(list(raised.exception.message_dict), ['state'])
+
+
+class GeocodingTest(TestCase):
+    """
+    Test case for the offline geocoding of addresses.
+    """
+
+    def create_address(self, zip_code=31525):
+        return Address.objects.create(
+            number=1, street="Ocean Drive", city="Brunswick",
+            state="GA", zip_code=zip_code, country_iso_code="USA"
+        )
+
+    def test_geocoded_on_save(self):
+        """Test that new and changed addresses get the centroid of their zip code"""
+        address = self.create_address()
+        self.assertEqual((address.latitude, address.longitude), geocoding.locate(31525))
+
+        address = Address.objects.get(pk=address.pk)
+        address.zip_code = 10001
+        address.save(update_fields=['zip_code'])
+        address.refresh_from_db()
+        self.assertEqual((address.latitude, address.longitude), geocoding.locate(10001))
+
+        address.zip_code = 1
+        address.save()
+        self.assertIsNone(address.latitude)
+
+    def test_command_geocodes_in_bulk(self):
+        """Test that the command geocodes bulk created addresses in one join"""
+        address = self.create_address()
+        Address.objects.filter(pk=address.pk).update(latitude=None, longitude=None)
+        unknown = self.create_address(zip_code=1)
+        out = StringIO()
+
+        call_command('geocode_addresses', '--missing', stdout=out)
+
+        self.assertIn("1 addresses geocoded, 1 without coordinates.", out.getvalue())
+        address.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertAlmostEqual(address.latitude, 31.1499)
+        self.assertIsNone(unknown.longitude)
+
+    def test_command_versions_and_logs_changes(self):
+        """Test that only the addresses whose coordinates change are versioned and logged"""
+        moved = self.create_address()
+        unchanged = self.create_address(zip_code=10001)
+        Address.objects.filter(pk=moved.pk).update(latitude=None, longitude=None)
+        ChangeLog.objects.all().delete()
+
+        call_command('geocode_addresses', stdout=StringIO())
+
+        version = moved.version
+        moved.refresh_from_db()
+        self.assertGreater(moved.version, version)
+        self.assertEqual(Address.objects.get(pk=unchanged.pk).version, unchanged.version)
+        self.assertEqual(
+            list(ChangeLog.objects.values_list('model', 'object_id', 'action')),
+            [('lettings.address', moved.pk, ChangeLog.UPDATED)],
+        )
+
+    def test_command_evicts_cached_lettings(self):
+        """Test that the lettings of geocoded addresses leave the batch cache"""
+        address = self.create_address()
+        letting = Letting.objects.create(title="Geocoded", address=address)
+        Address.objects.filter(pk=address.pk).update(latitude=None, longitude=None)
+        batch.LettingLoader().load_many([letting.pk])
+        self.assertIsNone(cache.get(batch.cache_key(letting.pk))['address']['latitude'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('geocode_addresses', stdout=StringIO())
+        self.assertIsNone(cache.get(batch.cache_key(letting.pk)))
+
+    def test_census_gazetteer_dataset(self):
+        """Test that a Census ZCTA gazetteer file can be used as dataset"""
+        address = self.create_address()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'zcta.txt')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("GEOID\tALAND\tINTPTLAT\tINTPTLONG   \n")
+                file.write("31525\t1\t31.2\t-81.5\n")
+            call_command('geocode_addresses', dataset=path, stdout=StringIO())
+
+        address.refresh_from_db()
+        self.assertEqual((address.latitude, address.longitude), (31.2, -81.5))
+
+
+class NearbyLettingsTest(TestCase):
+    """
+    Test case for the R*Tree search of lettings around a point.
+    """
+
+    def setUp(self):
+        """
+        Creates lettings in Brunswick, Savannah and Atlanta.
+        """
+        self.lettings = {}
+        for city, zip_code in (("Brunswick", 31525), ("Savannah", 31401), ("Atlanta", 30301)):
+            address = Address.objects.create(
+                number=1, street="Main Street", city=city,
+                state="GA", zip_code=zip_code, country_iso_code="USA"
+            )
+            self.lettings[city] = Letting.objects.create(title=f"{city} Home", address=address)
+
+    def get_near(self, **params):
+        return self.client.get(reverse('lettings:near'), params)
+
+    def test_closest_first_within_radius(self):
+        """Test that lettings are ranked by distance and limited to the radius"""
+        response = self.get_near(lat=31.15, lon=-81.49, radius=150)
+
+        self.assertEqual(response.status_code, 200)
+        lettings = response.json()['lettings']
+        self.assertEqual([letting['city'] for letting in lettings], ["Brunswick", "Savannah"])
+        self.assertLess(lettings[0]['distance_km'], lettings[1]['distance_km'])
+        self.assertEqual(
+            lettings[0]['url'], reverse('lettings:letting', args=[self.lettings["Brunswick"].pk])
+        )
+        self.assertEqual(len(self.get_near(lat=31.15, lon=-81.49, radius=150, limit=1)
+                             .json()['lettings']), 1)
+
+    def test_search_widens_only_as_needed(self):
+        """Test that a dense area is answered from a small box, without reading the radius"""
+        for number in range(2, 7):
+            address = Address.objects.create(
+                number=number, street="Main Street", city="Brunswick",
+                state="GA", zip_code=31525, country_iso_code="USA"
+            )
+            Letting.objects.create(title=f"Brunswick Flat {number}", address=address)
+
+        with mock.patch.object(spatial, 'distance_km', wraps=spatial.distance_km) as measure:
+            nearest = spatial.nearby_lettings(31.15, -81.49, 150, 2)
+        self.assertEqual(len(nearest), 2)
+        # Only the closest candidates kept by SQL, not the seven lettings of the radius
+        self.assertEqual(measure.call_count, 2 * spatial.CANDIDATES_PER_RESULT)
+
+    def test_index_follows_address_changes(self):
+        """Test that the triggers keep the index in sync with the addresses"""
+        address = self.lettings["Savannah"].address
+        address.zip_code = 30301
+        address.save()
+        self.lettings["Brunswick"].address.delete()
+
+        lettings = self.get_near(lat=33.75, lon=-84.39, radius=10).json()['lettings']
+        # Same zip code, same centroid
+        self.assertEqual(sorted(letting['title'] for letting in lettings),
+                         ["Atlanta Home", "Savannah Home"])
+        self.assertEqual(self.get_near(lat=31.15, lon=-81.49, radius=10).json()['lettings'], [])
+
+    def test_invalid_parameters(self):
+        """Test that missing or out of range parameters give a 400 response"""
+        for params in ({'lon': -81}, {'lat': 91, 'lon': 0}, {'lat': 'x', 'lon': 0},
+                       {'lat': 31, 'lon': -81, 'radius': 10000},
+                       {'lat': 31, 'lon': -81, 'limit': 2.9}):
+            response = self.get_near(**params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+    def test_bounding_box(self):
+        """Test that the box covers the radius and wraps around the antimeridian"""
+        min_lat, max_lat, min_lon, max_lon = spatial.bounding_box(45, 0, 100)
+        self.assertAlmostEqual(spatial.distance_km(45, 0, max_lat, 0), 100, places=3)
+        self.assertGreater(spatial.distance_km(45, 0, 45, max_lon), 100)
+        self.assertEqual(spatial.bounding_box(0, 179.9, 50)[2:], (-180.0, 180.0))
+
+
+class LettingFacetsTest(TestCase):
+    """
+    Test case for the lettings facets by state, city and country.
+    """
+
+    def setUp(self):
+        """
+        Creates two lettings in Georgia and one in Texas.
+        """
+        self.lettings = [
+            self.create_letting("Brunswick", "GA", 31525),
+            self.create_letting("Savannah", "GA", 31401),
+            self.create_letting("Austin", "TX", 78701),
+        ]
+
+    @staticmethod
+    def create_letting(city, state, zip_code):
+        address = Address.objects.create(
+            number=1, street="Main Street", city=city,
+            state=state, zip_code=zip_code, country_iso_code="USA"
+        )
+        return Letting.objects.create(title=f"{city} Home", address=address)
+
+    def test_counts_in_one_query(self):
+        """Test that every facet is read from the counters by a single query"""
+        with self.assertNumQueries(1):
+            result = facets.get_facets()
+
+        self.assertEqual(result['state'], [
+            {'value': "GA", 'label': "Georgia", 'count': 2},
+            {'value': "TX", 'label': "Texas", 'count': 1},
+        ])
+        self.assertEqual(len(result['city']), 3)
+        self.assertEqual(
+            result['country'], [{'value': "USA", 'label': "United States", 'count': 3}]
+        )
+
+    def test_cities_grouped_by_key(self):
+        """Test that the spellings of a city are one facet value"""
+        self.create_letting("  savannah ", "GA", 31401)
+
+        self.assertIn(
+            {'value': "savannah", 'label': "Savannah", 'count': 2}, facets.get_facets()['city']
+        )
+
+    def test_follow_writes(self):
+        """Test that facets follow the address and letting changes at once"""
+        address = self.lettings[2].address
+        address.state = "GA"
+        address.save()
+        self.assertEqual(facets.get_facets()['state'][0]['count'], 3)
+
+        # Deleting the address deletes its letting
+        self.lettings[0].address.delete()
+        self.assertEqual(facets.get_facets()['state'][0]['count'], 2)
+
+    def test_index_and_api(self):
+        """Test that the index page and the JSON API show the facets"""
+        self.assertContains(self.client.get(reverse('lettings:index')), "Georgia (2)")
+
+        response = self.client.get(reverse('lettings:facets'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), facets.get_facets())
+
+
+class LettingBatchTest(TestCase):
+    """
+    Test case for the batch lettings endpoint.
+    """
+
+    def setUp(self):
+        """
+        Creates three lettings, with an empty cache.
+        """
+        cache.clear()
+        self.lettings = [self.create_letting(f"Home {i}", 31401 + i) for i in range(3)]
+        registry.states.load()
+        registry.countries.load()
+
+    def tearDown(self):
+        # Filled from rows this test rolls back
+        cache.clear()
+
+    @staticmethod
+    def create_letting(title, zip_code):
+        address = Address.objects.create(
+            number=1, street="Main Street", city="Savannah",
+            state="GA", zip_code=zip_code, country_iso_code="USA"
+        )
+        return Letting.objects.create(title=title, address=address)
+
+    def get_batch(self, ids):
+        return self.client.get(reverse('lettings:batch'), {'ids': ids})
+
+    def test_one_query_in_the_given_order(self):
+        """Test that the lettings are read by one query, duplicates coalesced"""
+        first, second, third = (letting.pk for letting in self.lettings)
+        with self.assertNumQueries(1):
+            response = self.get_batch(f"{third},{first},{third},999")
+
+        body = response.json()
+        self.assertEqual([letting['title'] for letting in body['lettings']], ["Home 2", "Home 0"])
+        self.assertEqual(body['lettings'][0]['address']['state'], "GA")
+        self.assertEqual(body['missing'], [999])
+
+        with self.assertNumQueries(1):
+            # Only the letting not cached yet is read
+            body = self.get_batch(f"{first},{second}").json()
+        self.assertEqual(len(body['lettings']), 2)
+
+    def test_changes_evict_cached_lettings(self):
+        """Test that letting and address changes are visible once committed"""
+        letting = self.lettings[0]
+        self.get_batch(str(letting.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            letting.title = "Renamed"
+            letting.save()
+            letting.address.street = "Bay Street"
+            letting.address.save()
+            # Until the commit, other connections still read the old row
+            self.assertIsNotNone(cache.get(batch.cache_key(letting.pk)))
+
+        body = self.get_batch(str(letting.pk)).json()
+        self.assertEqual(body['lettings'][0]['title'], "Renamed")
+        self.assertEqual(body['lettings'][0]['address']['street'], "Bay Street")
+
+    def test_loader_remembers_loaded_lettings(self):
+        """Test that a loader reads an id once"""
+        loader = batch.LettingLoader()
+        loader.load_many([self.lettings[0].pk])
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(list(loader.load_many([self.lettings[0].pk])), [self.lettings[0].pk])
+
+    @override_settings(LETTINGS_BATCH_MAX_IDS=2)
+    def test_invalid_ids(self):
+        """Test that malformed, missing and too many ids are rejected"""
+        for ids in ("1,x", "", "0", "1,2,3"):
+            self.assertEqual(self.get_batch(ids).status_code, 400)
+
+
+class ArchiveTest(TestCase):
+    """
+    Test case for the archival of the inactive lettings.
+    """
+
+    def setUp(self):
+        """
+        Creates an active and an inactive letting.
+        """
+        self.active = self.create_letting("Still Listed", 31401)
+        self.inactive = self.create_letting("Withdrawn", 31402)
+        self.inactive.is_active = False
+        self.inactive.save()
+
+    @staticmethod
+    def create_letting(title, zip_code):
+        address = Address.objects.create(
+            number=7, street="Bull Street", city="Savannah",
+            state="GA", zip_code=zip_code, country_iso_code="USA"
+        )
+        return Letting.objects.create(title=title, address=address)
+
+    def test_inactive_lettings_are_moved(self):
+        """Test that inactive lettings and their addresses leave the live tables"""
+        out = StringIO()
+        call_command('archive_lettings', stdout=out)
+
+        self.assertIn("1 lettings archived.", out.getvalue())
+        self.assertEqual(list(Letting.objects.values_list('title', flat=True)), ["Still Listed"])
+        self.assertFalse(Address.objects.filter(pk=self.inactive.address_id).exists())
+        self.assertFalse(LettingSummary.objects.filter(pk=self.inactive.pk).exists())
+        archived = ArchivedLetting.objects.select_related('address').get()
+        self.assertEqual((archived.pk, archived.title), (self.inactive.pk, "Withdrawn"))
+        self.assertEqual(archived.address.pk, self.inactive.address_id)
+        self.assertEqual(archived.address.state.code, "GA")
+
+    def test_archived_page_stays_reachable(self):
+        """Test that an archived letting is still served by its URL"""
+        call_command('archive_lettings', stdout=StringIO())
+        response = self.client.get(reverse('lettings:letting', args=[self.inactive.pk]))
+
+        self.assertContains(response, "Withdrawn")
+        self.assertContains(response, "7 Bull Street")
+        self.assertContains(response, "no longer available")
+        missing = self.client.get(reverse('lettings:letting', args=[self.inactive.pk + 100]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_restore_lists_the_letting_again(self):
+        """Test that a restored letting is back in the live tables with its ids"""
+        call_command('archive_lettings', stdout=StringIO())
+        call_command('archive_lettings', '--restore', str(self.inactive.pk), stdout=StringIO())
+
+        letting = Letting.objects.select_related('address').get(pk=self.inactive.pk)
+        self.assertEqual(letting.address.pk, self.inactive.address_id)
+        self.assertTrue(letting.is_active)
+        self.assertTrue(LettingSummary.objects.filter(pk=letting.pk).exists())
+        self.assertFalse(ArchivedAddress.objects.exists())
+
+    def test_inactive_lettings_are_not_listed(self):
+        """Test that a deactivated letting leaves the read paths before it is archived"""
+        self.assertFalse(LettingSummary.objects.filter(pk=self.inactive.pk).exists())
+        response = self.client.get(reverse('lettings:index'))
+        self.assertContains(response, "Still Listed")
+        self.assertNotContains(response, "Withdrawn")
+        self.assertEqual(
+            [letting['id'] for letting in CityTopLettings.for_city("Savannah")], [self.active.pk]
+        )
+        ids = f'{self.active.pk},{self.inactive.pk}'
+        body = self.client.get(reverse('lettings:batch'), {'ids': ids}).json()
+        self.assertEqual([letting['id'] for letting in body['lettings']], [self.active.pk])
+        page = self.client.get(reverse('lettings:letting', args=[self.inactive.pk]))
+        self.assertContains(page, "no longer available")
+
+    def test_archive_updates_the_derived_rows(self):
+        """Test that archiving keeps the counters, tombstones and change log right"""
+        CityTopLettings.for_city("Savannah")
+        call_command('archive_lettings', stdout=StringIO())
+
+        self.assertEqual(counters.reconcile(Letting), 0)
+        self.assertEqual(counters.reconcile(Address), 0)
+        deleted = {
+            ('lettings.letting', self.inactive.pk), ('lettings.address', self.inactive.address_id)
+        }
+        self.assertEqual(set(Tombstone.objects.values_list('model', 'object_id')), deleted)
+        self.assertEqual(
+            set(ChangeLog.objects.filter(action=ChangeLog.DELETED)
+                .values_list('model', 'object_id')),
+            deleted,
+        )
+        self.assertIsNone(CityTopLettings.objects.get().lettings)
+
+    def test_archive_deletes_set_wise(self):
+        """Test that archiving many lettings takes as many queries as archiving one"""
+        with CaptureQueriesContext(connection) as one:
+            call_command('archive_lettings', stdout=StringIO())
+        for zip_code in range(31410, 31415):
+            letting = self.create_letting("Withdrawn", zip_code)
+            letting.is_active = False
+            letting.save()
+        with CaptureQueriesContext(connection) as many:
+            call_command('archive_lettings', stdout=StringIO())
+
+        self.assertEqual(Letting.objects.count(), 1)
+        self.assertEqual(len(many), len(one))
@@ -6,9 +6,15 @@ app_name = 'lettings'
 urlpatterns = [
     path('', views.index, name='index'),
     path('<int:letting_id>/', views.letting, name='letting'),
+    path('near/', views.near, name='near'),
+    path('facets/', views.facet_counts, name='facets'),
+    path('batch/', views.letting_batch, name='batch'),
 ]
 """
 URL configuration for the Lettings app.
 - '' → Calls the index view and lists all lettings.
 - '<int:letting_id>/' → Calls the letting view for a specific letting by ID.
+- 'near/' → Calls the near view, the lettings closest to a point as JSON.
+- 'facets/' → Calls the facet_counts view, the lettings by state, city and country as JSON.
+- 'batch/' → Calls the letting_batch view, several lettings by ID as JSON.
 """
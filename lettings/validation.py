@@ -0,0 +1,223 @@
+import sentry_sdk
+from django.core.validators import (
+    MaxValueValidator,
+    MinLengthValidator,
+    MinValueValidator,
+)
+
+from .models import CODE_VALIDATOR, Address, Country, State
+
+
+# The rule of the model code fields, so both accept the same codes
+CODE_RE = CODE_VALIDATOR.regex
+
+INTEGER_FIELDS = ('number', 'zip_code')
+TEXT_FIELDS = ('street', 'city')
+CODE_FIELDS = ('state', 'country_iso_code')
+
+# Code fields are checked against the 'code' of their reference table
+REFERENCE_MODELS = {
+    'state': State,
+    'country_iso_code': Country,
+}
+
+
+def field_limits(field_name):
+    """
+    Reads the limits of an Address field from its validators.
+    Args:
+        field_name (str): The field name.
+    Returns:
+        dict: 'min_value', 'max_value', 'min_length' and 'max_length', None when unset.
+    """
+    if field_name in REFERENCE_MODELS:
+        field = REFERENCE_MODELS[field_name]._meta.get_field('code')
+    else:
+        field = Address._meta.get_field(field_name)
+    limits = {
+        'min_value': None,
+        'max_value': None,
+        'min_length': None,
+        'max_length': getattr(field, 'max_length', None),
+    }
+    # The strictest validator wins, the model may also add database range ones
+    for validator in field.validators:
+        value = getattr(validator, 'limit_value', None)
+        if isinstance(validator, MinValueValidator):
+            limits['min_value'] = max(value, limits['min_value'] or value)
+        elif isinstance(validator, MaxValueValidator):
+            limits['max_value'] = min(value, limits['max_value'] or value)
+        elif isinstance(validator, MinLengthValidator):
+            limits['min_length'] = max(value, limits['min_length'] or value)
+    return limits
+
+
+def column(rows, field_name):
+    values = [
+        row.get(field_name) if isinstance(row, dict) else getattr(row, field_name, None)
+        for row in rows
+    ]
+    if field_name in REFERENCE_MODELS:
+        # Instances hold State rows, checked by their code
+        values = [getattr(value, 'code', value) for value in values]
+    return values
+
+
+class BatchValidationResult:
+    """
+    Errors found in a batch, one dict per failed check:
+    {'row': index, 'field': name, 'code': code, 'value': value}.
+    """
+
+    def __init__(self, size, errors):
+        self.size = size
+        self.errors = sorted(errors, key=lambda error: (error['row'], error['field']))
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def invalid_rows(self):
+        return sorted({error['row'] for error in self.errors})
+
+    def valid_rows(self):
+        invalid = set(self.invalid_rows())
+        return [index for index in range(self.size) if index not in invalid]
+
+    def errors_by_row(self):
+        """
+        Groups the errors by row.
+        Returns:
+            dict: The list of errors of each invalid row, keyed by row index.
+        """
+        grouped = {}
+        for error in self.errors:
+            grouped.setdefault(error['row'], []).append(error)
+        return grouped
+
+    def summary(self):
+        """
+        Counts the errors by field and code.
+        Returns:
+            dict: The number of errors keyed by 'field:code'.
+        """
+        counts = {}
+        for error in self.errors:
+            key = f"{error['field']}:{error['code']}"
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+def failing(values, field_name, code, test):
+    # One pass over a column, collecting the rows a check rejects
+    return [
+        {'row': index, 'field': field_name, 'code': code, 'value': value}
+        for index, value in enumerate(values)
+        if test(value)
+    ]
+
+
+INVALID = object()
+
+
+def is_empty(value):
+    # Missing and blank cells, stripped like a form field does
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def to_integer(value):
+    # The coercion of IntegerField.to_python(), so "12" is accepted like 12
+    if is_empty(value):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return INVALID
+
+
+def check_integers(values, field_name):
+    limits = field_limits(field_name)
+    low = limits['min_value'] if limits['min_value'] is not None else 0
+    high = limits['max_value']
+    coerced = [to_integer(value) for value in values]
+    errors = [
+        {'row': index, 'field': field_name, 'code': 'invalid', 'value': values[index]}
+        for index, number in enumerate(coerced)
+        if number is INVALID
+    ]
+    numbers = [None if number is INVALID else number for number in coerced]
+    errors += failing(values, field_name, 'required', is_empty)
+    errors += failing(
+        numbers, field_name, 'min_value', lambda value: value is not None and value < low
+    )
+    if high is not None:
+        errors += failing(
+            numbers, field_name, 'max_value', lambda value: value is not None and value > high
+        )
+    return errors
+
+
+def check_texts(values, field_name, pattern=None, allowed=None):
+    limits = field_limits(field_name)
+    errors = failing(values, field_name, 'required', lambda value: not value)
+    texts = [value if isinstance(value, str) else None for value in values]
+    errors += failing(
+        values, field_name, 'invalid',
+        lambda value: value is not None and value != '' and not isinstance(value, str),
+    )
+    if limits['min_length'] is not None:
+        errors += failing(
+            texts, field_name, 'min_length',
+            lambda value: bool(value) and len(value) < limits['min_length'],
+        )
+    if limits['max_length'] is not None:
+        errors += failing(
+            texts, field_name, 'max_length',
+            lambda value: value is not None and len(value) > limits['max_length'],
+        )
+    if pattern is not None:
+        errors += failing(
+            texts, field_name, 'invalid', lambda value: bool(value) and not pattern.match(value)
+        )
+    if allowed is not None:
+        errors += failing(
+            texts, field_name, 'invalid_choice',
+            lambda value: bool(value) and value not in allowed,
+        )
+    return errors
+
+
+def validate_addresses(rows, states=None, countries=None, report=True):
+    """
+    Validates many addresses at once, column by column, without calling
+    full_clean() (and its Sentry reports) on every row.
+    Checks the 'number' and 'zip_code' ranges and the lengths read from
+    the model validators, and that 'state' and 'country_iso_code' are
+    upper case codes, among the allowed ones when given.
+    Args:
+        rows (list): Address instances or dicts of Address field values.
+        states (set): The allowed state codes, any code when None.
+        countries (set): The allowed country codes, any code when None.
+        report (bool): Whether to send the aggregated Sentry report.
+    Returns:
+        BatchValidationResult: The errors of every row.
+    """
+    rows = list(rows)
+    errors = []
+    for field_name in INTEGER_FIELDS:
+        errors += check_integers(column(rows, field_name), field_name)
+    for field_name in TEXT_FIELDS:
+        errors += check_texts(column(rows, field_name), field_name)
+    for field_name, allowed in zip(CODE_FIELDS, (states, countries)):
+        errors += check_texts(column(rows, field_name), field_name, CODE_RE, allowed)
+
+    result = BatchValidationResult(len(rows), errors)
+    if report and not result.is_valid:
+        # One event for the whole batch, whatever the number of errors
+        sentry_sdk.capture_message(
+            f"Validation par lot: {len(result.invalid_rows())} adresses invalides "
+            f"sur {len(rows)}.",
+            level='warning',
+            contexts={'validation': result.summary()},
+        )
+    return result
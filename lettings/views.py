@@ -1,7 +1,12 @@
-import sentry_sdk
-from django.http import Http404
-from django.shortcuts import render, get_object_or_404
-from .models import Letting
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.shortcuts import render
+from oc_lettings_site import counters, errors, streaming
+from oc_lettings_site.params import float_param, int_list_param, int_param
+from oc_lettings_site.middleware import template_engine
+from . import archive, batch, facets, registry, spatial
+from .models import Letting, LettingSummary
 
 
 def index(request):
@@ -14,14 +19,24 @@ def index(request):
     """
     try:
         # Lettings.index view logic
-        lettings_list = Letting.objects.all()
-        context = {'lettings_list': lettings_list}
-        return render(request, 'lettings/index.html', context)
+        lettings_list = LettingSummary.objects.only('letting_id', 'title').order_by('pk')
+        context = {
+            # The total shown, a bulk import may leave the counter behind the table
+            'lettings_count': counters.get_count(Letting),
+            'has_lettings': lettings_list.exists(),
+            'facets': facets.get_facets(),
+        }
+        if streaming.should_stream(context['lettings_count']):
+            return streaming.render_streaming(
+                request, 'lettings/index.html', context, lettings_list,
+                'lettings/index_rows.html', using=template_engine(request),
+            )
+        context['lettings_list'] = lettings_list
+        return render(request, 'lettings/index.html', context, using=template_engine(request))
     except Exception as e:
         # Capturing sentry exception
-        sentry_sdk.capture_exception(e)
-        sentry_sdk.capture_message("Erreur dans lettings.views index.")
-        return render(request, '500.html', status=500)
+        errors.report_exception(e, "Erreur dans lettings.views index.")
+        return errors.error_response(500)
 
 
 def letting(request, letting_id):
@@ -35,17 +50,127 @@ def letting(request, letting_id):
     """
     try:
         # Lettings.letting view logic
-        letting = get_object_or_404(Letting, id=letting_id)
+        summary = LettingSummary.objects.filter(pk=letting_id).first()
+        archived = False
+        if summary is None:
+            # Not summarized yet (bulk import), build it from the lettings tables
+            letting = Letting.objects.select_related('address').filter(id=letting_id).first()
+            if letting is not None and letting.is_active:
+                summary = LettingSummary.refresh(letting)
+            elif letting is not None:
+                # Deactivated, waiting to be archived
+                summary = LettingSummary(
+                    letting_id=letting.pk, title=letting.title,
+                    **LettingSummary.address_fields(letting.address)
+                )
+                archived = True
+            else:
+                # Not listed anymore, its page stays reachable from the archive
+                archived_letting = archive.find_archived(letting_id)
+                if archived_letting is None:
+                    raise Http404
+                summary = archived_letting.summary()
+                archived = True
         context = {
-            'title': letting.title,
-            'address': letting.address,
+            'title': summary.title,
+            'address': summary,
+            'archived': archived,
+            # Display names from the in-process registry, no query
+            'state_name': registry.states.label(summary.state),
+            'country_name': registry.countries.label(summary.country_iso_code),
         }
-        return render(request, 'lettings/letting.html', context)
+        return render(request, 'lettings/letting.html', context, using=template_engine(request))
     except Http404:
-        # Username doesn't exist, 404
-        return render(request, '404.html', status=404)
+        # Letting doesn't exist, 404
+        return errors.error_response(404)
     except Exception as e:
         # Capturing other exception
-        sentry_sdk.capture_exception(e)
-        sentry_sdk.capture_message("Erreur dans lettings.views index.")
-        return render(request, '500.html', status=500)
+        errors.report_exception(e, "Erreur dans lettings.views letting.")
+        return errors.error_response(500)
+
+
+def facet_counts(request):
+    """
+    Returns the number of lettings by state, city and country, as JSON.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        JsonResponse: The facets, each a list of values with their label
+        and count, the largest counts first.
+    """
+    try:
+        return JsonResponse(facets.get_facets())
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans lettings.views facet_counts.")
+        return errors.error_response(500)
+
+
+def near(request):
+    """
+    Returns the lettings closest to a point, as JSON.
+    Query parameters: 'lat' and 'lon' (required), 'radius' in km and 'limit'.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        JsonResponse: The lettings within the radius, closest first,
+        or a 400 response listing the invalid parameter.
+    """
+    try:
+        latitude = float_param(request, 'lat', low=-90, high=90)
+        longitude = float_param(request, 'lon', low=-180, high=180)
+        radius = float_param(
+            request, 'radius', settings.NEARBY_DEFAULT_RADIUS_KM, 0, settings.NEARBY_MAX_RADIUS_KM
+        )
+        limit = int_param(
+            request, 'limit', settings.NEARBY_DEFAULT_LIMIT, 1, settings.NEARBY_MAX_LIMIT
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        nearest = spatial.nearby_lettings(latitude, longitude, radius, limit)
+        summaries = LettingSummary.objects.in_bulk([letting_id for _, letting_id in nearest])
+        lettings = [
+            {
+                'id': letting_id,
+                'title': summaries[letting_id].title,
+                'address_line': summaries[letting_id].address_line,
+                'city': summaries[letting_id].city,
+                'state': summaries[letting_id].state,
+                'zip_code': summaries[letting_id].zip_code,
+                'distance_km': round(distance, 3),
+                'url': reverse('lettings:letting', args=[letting_id]),
+            }
+            # A letting not summarized yet (bulk import) or inactive is left out
+            for distance, letting_id in nearest if letting_id in summaries
+        ]
+        return JsonResponse({'radius_km': radius, 'lettings': lettings})
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans lettings.views near.")
+        return errors.error_response(500)
+
+
+def letting_batch(request):
+    """
+    Returns several lettings with their address, as JSON.
+    Query parameter: 'ids', comma separated letting ids.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        JsonResponse: The lettings in the order of the ids and the ids
+        matching no letting, or a 400 response listing the invalid parameter.
+    """
+    try:
+        letting_ids = int_list_param(request, 'ids', settings.LETTINGS_BATCH_MAX_IDS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        lettings = batch.LettingLoader().load_many(letting_ids)
+        return JsonResponse({
+            'lettings': [lettings[pk] for pk in letting_ids if pk in lettings],
+            'missing': [pk for pk in letting_ids if pk not in lettings],
+        })
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans lettings.views letting_batch.")
+        return errors.error_response(500)
@@ -9,3 +9,6 @@ class OCLettingsSiteConfig(AppConfig):
 
     def ready(self):
         import oc_lettings_site.signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from oc_lettings_site import slow_queries
+        connection_created.connect(slow_queries.install, dispatch_uid='slow_queries')
@@ -0,0 +1,396 @@
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# A cached value: pickled, its expiry (Unix time, None for never) and the
+# seconds its computation took, which scales its early recomputation
+Entry = namedtuple('Entry', ('pickled', 'expires', 'delta'))
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, delta REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expires_idx ON cache (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_lease ('
+    'key TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL'
+    ') WITHOUT ROWID',
+)
+
+# Keys read per query, below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+class TieredCache(BaseCache):
+    """
+    Cache backend shared by the workers of a host without an external
+    service. Level 2 is a SQLite file in WAL mode at LOCATION, level 1 an
+    in-process LRU of L1_MAX_ENTRIES pickled values, each kept at most
+    L1_TIMEOUT seconds: a delete or clear made by another worker is seen
+    once that delay has passed.
+
+    get_or_set() protects expensive values from stampedes. The threads of
+    a process missing the same key wait for one of them to compute it, and
+    the processes coordinate through a lease row, held at most
+    LOCK_TIMEOUT seconds. A value is also recomputed before it expires,
+    with a probability growing as expiry nears and with the time it took
+    to compute (EARLY_RECOMPUTE_BETA, 0 disables it), while the others
+    keep being served the current value.
+    """
+    POLL_INTERVAL = 0.05
+    # Writes of a process between two checks of MAX_ENTRIES
+    CULL_EVERY = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.beta = options.get('EARLY_RECOMPUTE_BETA', 1.0)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self.l1 = OrderedDict()
+        self.lock = threading.Lock()
+        # Keys being computed by a thread of this process
+        self.flights = {}
+        self.local = threading.local()
+        self.writes = 0
+
+    # Level 2
+
+    def connection(self):
+        # One connection per thread, opened again in a forked worker
+        local = self.local
+        if getattr(local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(
+                self.path, timeout=self.lock_timeout, isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def read(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = self.connection().execute(
+                'SELECT key, value, expires, delta FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)',
+                [*chunk, time.time()],
+            )
+            for key, pickled, expires, delta in rows:
+                found[key] = Entry(pickled, expires, delta)
+        return found
+
+    def write(self, entries):
+        with self.transaction() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, delta) VALUES (?, ?, ?, ?)',
+                [(key, *entry) for key, entry in entries.items()],
+            )
+        with self.lock:
+            for key, entry in entries.items():
+                self.remember(key, entry)
+            self.writes += len(entries)
+            cull = self.writes >= self.CULL_EVERY
+            if cull:
+                self.writes = 0
+        if cull:
+            self.cull()
+
+    def cull(self):
+        now = time.time()
+        with self.transaction() as db:
+            db.execute('DELETE FROM cache WHERE expires <= ?', [now])
+            db.execute('DELETE FROM cache_lease WHERE expires <= ?', [now])
+            count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self._max_entries:
+                # The entries expiring first go first
+                culled = count // self._cull_frequency if self._cull_frequency else count
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                    [culled],
+                )
+
+    # Level 1
+
+    def remember(self, key, entry):
+        # Called with the lock held
+        expires = time.time() + self.l1_timeout
+        if entry.expires is not None:
+            expires = min(expires, entry.expires)
+        self.l1[key] = (expires, entry)
+        self.l1.move_to_end(key)
+        while len(self.l1) > self.l1_max_entries:
+            self.l1.popitem(last=False)
+
+    def forget(self, keys):
+        with self.lock:
+            for key in keys:
+                self.l1.pop(key, None)
+
+    def entries(self, keys):
+        """
+        Reads the live entries of some keys, from level 1 first.
+        Returns:
+            dict: The entries keyed by cache key, without the missing keys.
+        """
+        found = {}
+        missing = []
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                item = self.l1.get(key)
+                if item is not None and item[0] > now:
+                    self.l1.move_to_end(key)
+                    found[key] = item[1]
+                else:
+                    missing.append(key)
+        if missing:
+            loaded = self.read(missing)
+            with self.lock:
+                for key, entry in loaded.items():
+                    self.remember(key, entry)
+            found.update(loaded)
+        return found
+
+    def entry(self, key):
+        return self.entries([key]).get(key)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        entry = self.entry(key)
+        return default if entry is None else pickle.loads(entry.pickled)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        return {
+            keys[key]: pickle.loads(entry.pickled)
+            for key, entry in self.entries(list(keys)).items()
+        }
+
+    def has_key(self, key, version=None):
+        return self.entry(self.make_and_validate_key(key, version=version)) is not None
+
+    def make_entry(self, value, timeout, delta=0.0):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return Entry(pickled, self.get_backend_timeout(timeout), delta)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.write({key: self.make_entry(value, timeout)})
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.write({
+            self.make_and_validate_key(key, version=version): self.make_entry(value, timeout)
+            for key, value in data.items()
+        })
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        entry = self.make_entry(value, timeout)
+        with self.transaction() as db:
+            # Replaces an expired entry only
+            added = db.execute(
+                'INSERT INTO cache (key, value, expires, delta) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+                'expires = excluded.expires, delta = excluded.delta '
+                'WHERE cache.expires <= ?',
+                [key, *entry, time.time()],
+            ).rowcount == 1
+        if added:
+            self.forget([key])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        touched = self.connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), key, time.time()],
+        ).rowcount == 1
+        self.forget([key])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self.transaction() as db:
+            entry = self.read([key]).get(key)
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(entry.pickled) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                [pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key],
+            )
+        self.forget([key])
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted = self.connection().execute(
+            'DELETE FROM cache WHERE key = ?', [key]
+        ).rowcount == 1
+        self.forget([key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        with self.transaction() as db:
+            db.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        self.forget(keys)
+
+    def clear(self):
+        self.connection().execute('DELETE FROM cache')
+        with self.lock:
+            self.l1.clear()
+
+    def close(self, **kwargs):
+        # Kept open between requests, each thread reuses its connection
+        pass
+
+    # Stampede protection
+
+    def expires_early(self, entry):
+        """
+        Draws whether a live value is recomputed ahead of its expiry
+        ("XFetch"): the closer the expiry and the longer the computation,
+        the likelier.
+        """
+        if entry.expires is None or not entry.delta or not self.beta:
+            return False
+        gap = -entry.delta * self.beta * math.log(1.0 - random.random())
+        return time.time() + gap >= entry.expires
+
+    def acquire_lease(self, key):
+        """
+        Takes the right to compute a key, for all the processes.
+        Returns:
+            str: The lease token, None if another computation holds it.
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        acquired = self.connection().execute(
+            'INSERT INTO cache_lease (key, token, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET token = excluded.token, '
+            'expires = excluded.expires WHERE cache_lease.expires <= ?',
+            [key, token, now + self.lock_timeout, now],
+        ).rowcount == 1
+        return token if acquired else None
+
+    def release_lease(self, key, token):
+        self.connection().execute(
+            'DELETE FROM cache_lease WHERE key = ? AND token = ?', [key, token]
+        )
+
+    def await_entry(self, key):
+        """
+        Waits for the process holding the lease of a key to store it.
+        Returns:
+            Entry: The stored entry, None once the lease is released or
+            expired without one.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            entry = self.read([key]).get(key)
+            if entry is not None:
+                return entry
+            leased = self.connection().execute(
+                'SELECT 1 FROM cache_lease WHERE key = ? AND expires > ?', [key, time.time()]
+            ).fetchone()
+            if leased is None:
+                return None
+        return None
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Returns the value of a key, computed and stored once by all the
+        threads and processes missing it.
+        Args:
+            key (str): The cache key.
+            default: The value, or a callable computing it.
+            timeout (int): Seconds the value is kept.
+        Returns:
+            The cached or computed value.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        entry = self.entry(key)
+        if entry is not None and not self.expires_early(entry):
+            return pickle.loads(entry.pickled)
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = threading.Event()
+        if not leader:
+            if entry is None:
+                flight.wait(self.lock_timeout)
+                entry = self.entry(key)
+            if entry is not None:
+                # Served the current value while another thread refreshes it
+                return pickle.loads(entry.pickled)
+            # The other thread failed: computed here, unprotected
+            return self.compute(key, default, timeout)
+        try:
+            return self.fill(key, entry, default, timeout)
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.set()
+
+    def fill(self, key, entry, default, timeout):
+        token = self.acquire_lease(key)
+        if token is None:
+            # Another process computes it
+            if entry is None:
+                entry = self.await_entry(key)
+            if entry is not None:
+                return pickle.loads(entry.pickled)
+            return self.compute(key, default, timeout)
+        try:
+            if entry is None:
+                # Stored by another process since it was read
+                entry = self.read([key]).get(key)
+                if entry is not None and not self.expires_early(entry):
+                    return pickle.loads(entry.pickled)
+            return self.compute(key, default, timeout)
+        finally:
+            self.release_lease(key, token)
+
+    def compute(self, key, default, timeout):
+        started = time.monotonic()
+        value = default() if callable(default) else default
+        delta = time.monotonic() - started
+        self.write({key: self.make_entry(value, timeout, delta)})
+        return value
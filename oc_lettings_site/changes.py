@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChangeLog
+
+
+COLUMNS = ('seq', 'model', 'object_id', 'action', 'changed_at')
+
+_lock = threading.Lock()
+# Event streams served by this process, each holds a worker thread
+_open_streams = 0
+
+
+def record(instance, action):
+    """
+    Appends a write to the change log, in the transaction of the write.
+    Args:
+        instance (Model): The letting, address or profile written.
+        action (str): ChangeLog.CREATED, UPDATED or DELETED.
+    """
+    ChangeLog.objects.create(
+        model=instance._meta.label_lower, object_id=instance.pk, action=action
+    )
+
+
+def record_many(model, object_ids, action):
+    """
+    Appends writes of many rows to the change log, in one insert per
+    batch of 500 rows, in the transaction of the writes.
+    Args:
+        model (Model): The model class of the rows.
+        object_ids (list): The primary keys of the rows.
+        action (str): ChangeLog.CREATED, UPDATED or DELETED.
+    """
+    label = model._meta.label_lower
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(model=label, object_id=pk, action=action) for pk in object_ids],
+        batch_size=500,
+    )
+
+
+def changes_since(seq, limit):
+    """
+    Reads the changes following a sequence number, a range scan of the
+    primary key.
+    Args:
+        seq (int): The last sequence number seen, 0 for the whole log.
+        limit (int): The maximum number of changes.
+    Returns:
+        list: The changes as dicts, in sequence order.
+    """
+    rows = ChangeLog.objects.filter(seq__gt=seq).order_by('seq').values(*COLUMNS)[:limit]
+    return [dict(row, changed_at=row['changed_at'].isoformat()) for row in rows]
+
+
+def is_truncated(seq):
+    """
+    Tells whether changes following a sequence number were pruned.
+    Returns:
+        bool: True if the consumer has to start over from a full copy.
+    """
+    first = ChangeLog.objects.order_by('seq').values_list('seq', flat=True).first()
+    if first is None:
+        return False
+    return first > seq + 1
+
+
+def prune(days):
+    """
+    Deletes the changes older than some days.
+    Returns:
+        int: The number of changes deleted.
+    """
+    before = timezone.now() - timezone.timedelta(days=days)
+    last = ChangeLog.objects.order_by('-seq').values_list('seq', flat=True).first()
+    # The last change is kept, so sequence numbers are never reused
+    deleted, _ = ChangeLog.objects.filter(changed_at__lt=before).exclude(seq=last).delete()
+    return deleted
+
+
+def reserve_stream():
+    """
+    Takes one of the CHANGES_MAX_STREAMS slots of this process.
+    Returns:
+        bool: False when every slot is taken.
+    """
+    global _open_streams
+    with _lock:
+        if _open_streams >= settings.CHANGES_MAX_STREAMS:
+            return False
+        _open_streams += 1
+        return True
+
+
+def release_stream():
+    global _open_streams
+    with _lock:
+        _open_streams -= 1
+
+
+def event(name, data, seq=None):
+    lines = [] if seq is None else [f'id: {seq}']
+    lines += [f'event: {name}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+class ChangeStream:
+    """
+    Server-Sent Events of the changes following a sequence number. The
+    log is polled every CHANGES_POLL_INTERVAL seconds, a comment is sent
+    when idle so proxies keep the connection, and the stream ends after
+    CHANGES_STREAM_TIMEOUT seconds so the worker thread is given back;
+    clients reconnect with the last event id. The stream slot is released
+    when the response is closed, even if it was never iterated.
+    """
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.released = False
+
+    def __iter__(self):
+        yield f'retry: {int(settings.CHANGES_RETRY_INTERVAL * 1000)}\n\n'
+        if is_truncated(self.seq):
+            yield event('truncated', {'seq': self.seq})
+        deadline = time.monotonic() + settings.CHANGES_STREAM_TIMEOUT
+        idle_since = time.monotonic()
+        while True:
+            changes = changes_since(self.seq, settings.CHANGES_MAX_LIMIT)
+            for change in changes:
+                self.seq = change['seq']
+                yield event('change', change, self.seq)
+            if len(changes) == settings.CHANGES_MAX_LIMIT:
+                continue
+            now = time.monotonic()
+            if changes:
+                idle_since = now
+            elif now - idle_since >= settings.CHANGES_HEARTBEAT_INTERVAL:
+                yield ': keepalive\n\n'
+                idle_since = now
+            if now >= deadline:
+                return
+            time.sleep(settings.CHANGES_POLL_INTERVAL)
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            release_stream()
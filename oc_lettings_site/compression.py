@@ -0,0 +1,231 @@
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Content types worth compressing, matched as prefixes
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def available_encodings():
+    """
+    Lists the encodings the server can produce, preferred first.
+    Returns:
+        tuple: 'br' when the brotli package is installed, then 'gzip'.
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encoding(accept_encoding, encodings=None):
+    """
+    Picks the encoding of a response from the Accept-Encoding header.
+    Args:
+        accept_encoding (str): The Accept-Encoding request header.
+        encodings (tuple): The candidate encodings, preferred first.
+    Returns:
+        str: The first candidate the client accepts with a non zero
+        quality, or None.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        name, _, value = params.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    for encoding in encodings or available_encodings():
+        if qualities.get(encoding, qualities.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type):
+    content_type = content_type.lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+def gzip_compressor():
+    # wbits=31 writes a gzip header, with no file name and no timestamp
+    return zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def compress(content, encoding):
+    """
+    Compresses a whole response body.
+    Args:
+        content (bytes): The body.
+        encoding (str): 'br' or 'gzip'.
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    compressor = gzip_compressor()
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses a streamed body, flushing after every chunk so each one
+    reaches the client as soon as it is produced.
+    Args:
+        chunks (iterable): The body chunks, as bytes.
+        encoding (str): 'br' or 'gzip'.
+    Yields:
+        bytes: The compressed chunks.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def measure_stream(chunks, compress_chunks):
+    """
+    Compresses a streamed body, and records its sizes and the CPU time
+    spent compressing it in the stats once the stream is exhausted or
+    closed. The time spent producing the chunks is left out.
+    Args:
+        chunks (iterable): The body chunks, as bytes.
+        compress_chunks (callable): Compresses an iterable of chunks,
+        yielding the compressed chunks.
+    Yields:
+        bytes: The compressed chunks.
+    """
+    bytes_in = bytes_out = 0
+    cpu_seconds = producing_seconds = 0.0
+
+    def source():
+        nonlocal bytes_in, producing_seconds
+        iterator = iter(chunks)
+        while True:
+            started = time.thread_time()
+            chunk = next(iterator, None)
+            producing_seconds += time.thread_time() - started
+            if chunk is None:
+                return
+            bytes_in += len(chunk)
+            yield chunk
+
+    compressed = compress_chunks(source())
+    try:
+        while True:
+            # Only the time spent in this generator, not while the server sends
+            started = time.thread_time()
+            data = next(compressed, None)
+            cpu_seconds += time.thread_time() - started
+            if data is None:
+                return
+            bytes_out += len(data)
+            yield data
+    finally:
+        stats.record(bytes_in, bytes_out, max(cpu_seconds - producing_seconds, 0.0))
+
+
+class CompressedCache:
+    """
+    LRU of compressed bodies keyed by encoding and body digest, bounded
+    in bytes. A page rendered again with the same content, or a response
+    taken from a cache, is compressed only once per encoding.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(content, encoding):
+        return encoding, hashlib.blake2b(content, digest_size=16).digest()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class CompressionStats:
+    """
+    Totals of the compression work done by this process.
+    """
+    FIELDS = ('responses', 'cache_hits', 'bytes_in', 'bytes_out', 'cpu_seconds')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+
+    def record(self, bytes_in, bytes_out, cpu_seconds, cache_hit=False):
+        with self.lock:
+            self.totals['responses'] += 1
+            self.totals['cache_hits'] += int(cache_hit)
+            self.totals['bytes_in'] += bytes_in
+            self.totals['bytes_out'] += bytes_out
+            self.totals['cpu_seconds'] += cpu_seconds
+
+    def snapshot(self):
+        """
+        Returns a copy of the totals.
+        Returns:
+            dict: The totals, with the bytes saved by compression.
+        """
+        with self.lock:
+            totals = dict(self.totals)
+        totals['bytes_saved'] = totals['bytes_in'] - totals['bytes_out']
+        return totals
+
+
+stats = CompressionStats()
@@ -0,0 +1,259 @@
+from django.apps import apps
+from django.db import connection
+from django.db.models import Count
+
+from .models import Counter
+
+
+# Counted models, with the fields their rows are also counted by. The
+# lettings are counted by the fields of their address, cities by their
+# case-folded key so spelling variants of a city are counted together
+TRACKED_MODELS = {
+    'lettings.letting': ('state', 'city_key', 'country_iso_code'),
+    'lettings.address': (),
+    'profiles.profile': (),
+}
+
+# Rows left out of the counters of a model: inactive lettings are not listed
+COUNTED_ROWS = {
+    'lettings.letting': {'is_active': True},
+}
+
+# Query paths of the facet fields that are not plain columns
+FACET_LOOKUPS = {
+    'lettings.letting': {
+        'state': 'address__state__code',
+        'city_key': 'address__city_key',
+        'country_iso_code': 'address__country__code',
+    },
+}
+
+
+def facet_key(label, field, value):
+    return f'{label}:{field}:{value}'
+
+
+def facet_fields(model):
+    return TRACKED_MODELS.get(model._meta.label_lower, ())
+
+
+def facet_lookup(model, field):
+    return FACET_LOOKUPS.get(model._meta.label_lower, {}).get(field, field)
+
+
+def counted_rows(model):
+    return model.objects.filter(**COUNTED_ROWS.get(model._meta.label_lower, {}))
+
+
+def is_counted(instance):
+    """
+    Tells whether a row adds to the counters of its model.
+    Returns:
+        bool: False for the rows COUNTED_ROWS leaves out.
+    """
+    conditions = COUNTED_ROWS.get(instance._meta.label_lower, {})
+    return all(getattr(instance, name) == value for name, value in conditions.items())
+
+
+def facet_values(model, **filters):
+    """
+    Reads the facet field values of a row from the database.
+    Args:
+        model (Model): The counted model class.
+        **filters: Lookups selecting the row, such as pk=1.
+    Returns:
+        dict: The stored value of every facet field, None if the row does not exist.
+    """
+    fields = facet_fields(model)
+    lookups = [facet_lookup(model, field) for field in fields]
+    row = model.objects.filter(**filters).values_list(*lookups).first()
+    return None if row is None else dict(zip(fields, row))
+
+
+def instance_facet_values(instance):
+    """
+    Reads the facet field values of a row from the instance and the
+    related instances its lookups follow.
+    Returns:
+        dict: The value of every facet field.
+    """
+    values = {}
+    for field in facet_fields(instance):
+        value = instance
+        for name in facet_lookup(instance, field).split('__'):
+            value = getattr(value, name)
+        values[field] = value
+    return values
+
+
+def keys_for(instance, values=None):
+    """
+    Lists the counter keys a row contributes to.
+    Args:
+        instance (Model): The counted row.
+        values (dict): Facet field values to use instead of the instance ones.
+    Returns:
+        list: The table key followed by one key per facet field.
+    """
+    label = instance._meta.label_lower
+    if values is None:
+        values = instance_facet_values(instance)
+    return [label] + [
+        facet_key(label, field, values[field]) for field in facet_fields(instance)
+    ]
+
+
+def increment(keys, delta=1):
+    """
+    Adds a delta to counters in place, creating the missing ones.
+    Args:
+        keys (list): The counter keys.
+        delta (int): The value added to each counter.
+    """
+    increment_many([(key, delta) for key in keys])
+
+
+def increment_many(deltas):
+    """
+    Adds its own delta to each counter in place, creating the missing ones.
+    Args:
+        deltas (list): (key, delta) pairs.
+    """
+    if not deltas:
+        return
+    table = connection.ops.quote_name(Counter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ("key", "value") VALUES (%s, %s) '
+            f'ON CONFLICT ("key") DO UPDATE SET "value" = {table}."value" + excluded."value"',
+            deltas,
+        )
+
+
+def uncount(model, **filters):
+    """
+    Takes rows about to be deleted in bulk off their counters, reading
+    their facet values with one grouped query. Rows left out of the
+    counters are skipped.
+    Args:
+        model (Model): The counted model class.
+        **filters: Lookups selecting the rows, such as pk__in=[1, 2].
+    """
+    fields = facet_fields(model)
+    lookups = [facet_lookup(model, field) for field in fields]
+    rows = counted_rows(model).filter(**filters)
+    if not fields:
+        increment_many([(model._meta.label_lower, -rows.count())])
+        return
+    deltas = {}
+    for group in rows.values(*lookups).annotate(rows=Count('pk')).order_by():
+        values = {field: group[lookup] for field, lookup in zip(fields, lookups)}
+        for key in keys_for(model, values):
+            deltas[key] = deltas.get(key, 0) - group['rows']
+    increment_many(list(deltas.items()))
+
+
+def get_count(model):
+    """
+    Returns the number of rows of a counted model.
+    Args:
+        model (Model): The counted model class.
+    Returns:
+        int: The maintained total, one primary key lookup.
+    """
+    label = model._meta.label_lower
+    value = Counter.objects.filter(key=label).values_list('value', flat=True).first()
+    return value or 0
+
+
+def get_facet_counts(model, field):
+    """
+    Returns the number of rows per value of a counted field.
+    Args:
+        model (Model): The counted model class.
+        field (str): The facet field name.
+    Returns:
+        dict: The rows count keyed by field value, values without rows excluded.
+    """
+    prefix = facet_key(model._meta.label_lower, field, '')
+    # A key range rather than LIKE, so the unique index on 'key' is used
+    rows = Counter.objects.filter(
+        key__gte=prefix, key__lt=prefix + '\uffff', value__gt=0
+    ).values_list('key', 'value')
+    return {key[len(prefix):]: value for key, value in rows}
+
+
+def get_all_facet_counts(model):
+    """
+    Returns the number of rows per value of every counted field of a
+    model, in one range scan of the counter keys.
+    Args:
+        model (Model): The counted model class.
+    Returns:
+        dict: For each facet field, the rows count keyed by field value,
+        values without rows excluded.
+    """
+    prefix = f'{model._meta.label_lower}:'
+    counts = {field: {} for field in facet_fields(model)}
+    rows = Counter.objects.filter(
+        key__gte=prefix, key__lt=prefix + '\uffff', value__gt=0
+    ).values_list('key', 'value')
+    for key, value in rows:
+        field, _separator, field_value = key[len(prefix):].partition(':')
+        if field in counts:
+            counts[field][field_value] = value
+    return counts
+
+
+def exact_counts(model):
+    """
+    Computes every counter of a model from its table.
+    Args:
+        model (Model): The counted model class.
+    Returns:
+        dict: The exact value of every counter key of the model.
+    """
+    label = model._meta.label_lower
+    counts = {label: counted_rows(model).count()}
+    for field in facet_fields(model):
+        rows = (
+            counted_rows(model).order_by()
+            .values_list(facet_lookup(model, field))
+            .annotate(total=Count('pk'))
+        )
+        for value, total in rows:
+            counts[facet_key(label, field, value)] = total
+    return counts
+
+
+def reconcile(model):
+    """
+    Rewrites the counters of a model from its table, fixing any drift.
+    Args:
+        model (Model): The counted model class.
+    Returns:
+        int: The number of counters that were wrong, missing or stale.
+    """
+    label = model._meta.label_lower
+    expected = exact_counts(model)
+    stored = dict(
+        Counter.objects.filter(key__gte=label, key__lt=label + ':\uffff')
+        .values_list('key', 'value')
+    )
+
+    stale = [key for key in stored if key not in expected]
+    wrong = {key: value for key, value in expected.items() if stored.get(key) != value}
+
+    for start in range(0, len(stale), 500):
+        Counter.objects.filter(key__in=stale[start:start + 500]).delete()
+    Counter.objects.bulk_create(
+        [Counter(key=key, value=value) for key, value in wrong.items()],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['value'],
+    )
+    return len(stale) + len(wrong)
+
+
+def tracked_models():
+    return [apps.get_model(label) for label in TRACKED_MODELS]
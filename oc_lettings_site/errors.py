@@ -0,0 +1,107 @@
+import threading
+import time
+
+import sentry_sdk
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .middleware import PUBLIC_ENGINE
+
+
+ERROR_TEMPLATES = {
+    404: '404.html',
+    500: '500.html',
+}
+
+# Rendered error pages, by status code
+_pages = {}
+
+
+def error_page(status):
+    """
+    Returns the HTML of an error page, rendered once per process.
+    Args:
+        status (int): 404 or 500.
+    Returns:
+        bytes: The rendered page.
+    """
+    page = _pages.get(status)
+    if page is None:
+        # The error pages do not depend on the request
+        page = render_to_string(ERROR_TEMPLATES[status], using=PUBLIC_ENGINE).encode()
+        _pages[status] = page
+    return page
+
+
+def error_response(status):
+    """
+    Builds an error response from the prerendered page.
+    Args:
+        status (int): 404 or 500.
+    Returns:
+        HttpResponse: The error page with its status code.
+    """
+    return HttpResponse(error_page(status), status=status)
+
+
+class ErrorReporter:
+    """
+    Sends one Sentry event per error, instead of an exception and a message.
+    The same error (message and exception type) is reported at most once
+    per ERROR_REPORT_INTERVAL seconds, and at most ERROR_REPORT_LIMIT
+    errors are reported per minute. The next report of an error carries
+    the number of occurrences that were left out.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.last_sent = {}
+        self.suppressed = {}
+        self.window_start = 0.0
+        self.window_count = 0
+
+    def report(self, error, message):
+        """
+        Reports an exception unless it is a duplicate or over the rate limit.
+        Args:
+            error (Exception): The caught exception.
+            message (str): Where the error happened.
+        Returns:
+            bool: True if an event was sent.
+        """
+        key = (message, type(error).__name__)
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_sent.get(key)
+            duplicate = last is not None and now - last < settings.ERROR_REPORT_INTERVAL
+            if now - self.window_start >= 60:
+                self.window_start = now
+                self.window_count = 0
+            if duplicate or self.window_count >= settings.ERROR_REPORT_LIMIT:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.window_count += 1
+            if len(self.last_sent) > 1000:
+                # Only keys still inside their interval matter
+                self.last_sent = {
+                    old_key: sent for old_key, sent in self.last_sent.items()
+                    if now - sent < settings.ERROR_REPORT_INTERVAL
+                }
+            self.last_sent[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+
+        sentry_sdk.capture_exception(
+            error, contexts={'report': {'message': message, 'suppressed': suppressed}}
+        )
+        return True
+
+
+reporter = ErrorReporter()
+
+
+def report_exception(error, message):
+    return reporter.report(error, message)
@@ -0,0 +1,65 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+
+class Command(BaseCommand):
+    """
+    Measures the per-request latency of public pages with and without
+    the anonymous fast path, through the whole middleware stack. The
+    prerendered pages are left out of both runs, so the views render.
+    """
+    help = "Benchmarks public pages with the fast path enabled and disabled."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/', '/lettings/', '/profiles/'],
+                            help="Paths to request.")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Number of timed requests per path and mode.")
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+
+        # A pages directory that does not exist: nothing served, nothing queued
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            PRERENDER_ROOT=os.path.join(directory, 'pages')
+        ):
+            client = Client(HTTP_HOST=host)
+            for path in options['paths']:
+                full, fast = self.measure(client, path, options['requests'])
+                saved = full - fast
+                self.stdout.write(
+                    f"{path}: full {full * 1e6:.0f} µs, fast {fast * 1e6:.0f} µs, "
+                    f"saved {saved * 1e6:.0f} µs ({saved / full:.1%}) per request"
+                )
+
+    @staticmethod
+    def measure(client, path, count):
+        """
+        Times requests to a path, alternating the full stack and the fast path
+        so that both modes see the same system noise.
+        Args:
+            client (Client): The test client sending the requests.
+            path (str): The requested path.
+            count (int): The number of timed requests per mode.
+        Returns:
+            tuple: The median duration of a request on the full stack and
+            on the fast path, in seconds.
+        """
+        durations = {False: [], True: []}
+        for enabled in (False, True):
+            with override_settings(FAST_PATH_ENABLED=enabled):
+                # Warm up caches and lazy imports
+                client.get(path)
+        for _ in range(count):
+            for enabled in (False, True):
+                with override_settings(FAST_PATH_ENABLED=enabled):
+                    start = time.perf_counter()
+                    client.get(path)
+                    durations[enabled].append(time.perf_counter() - start)
+        return statistics.median(durations[False]), statistics.median(durations[True])
@@ -0,0 +1,48 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+
+from oc_lettings_site import prerender
+from oc_lettings_site.middleware import is_public_route
+
+
+class Command(BaseCommand):
+    """
+    Renders the public pages into PRERENDER_ROOT, with gzip (and brotli
+    when installed) variants, for PrerenderedPageMiddleware to serve.
+    Once the directory exists, model changes regenerate the affected
+    pages, so the command only needs to run after bulk imports.
+    """
+    help = "Renders the home, lettings and profiles pages into static HTML files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help="Pages to render, every public page by default.")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete the previously rendered pages first.")
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            try:
+                match = resolve(path)
+            except Resolver404:
+                raise CommandError(f"No page at {path}.")
+            if not is_public_route(match):
+                raise CommandError(f"{path} is not a public page.")
+
+        if options['clear'] and os.path.isdir(settings.PRERENDER_ROOT):
+            shutil.rmtree(settings.PRERENDER_ROOT)
+        os.makedirs(settings.PRERENDER_ROOT, exist_ok=True)
+
+        written = skipped = 0
+        for path in options['paths'] or prerender.public_paths():
+            if prerender.prerender(path):
+                written += 1
+            else:
+                skipped += 1
+        self.stdout.write(
+            f"{written} pages rendered into {settings.PRERENDER_ROOT}, {skipped} skipped."
+        )
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from oc_lettings_site import changes, versions
+
+
+class Command(BaseCommand):
+    """
+    Deletes the old entries of the change log and the old tombstones.
+    Consumers resuming from a pruned sequence number or version are told
+    to start over from a full copy.
+    """
+    help = (
+        "Deletes the change log entries and the tombstones older than "
+        "CHANGELOG_RETENTION_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHANGELOG_RETENTION_DAYS,
+            help="Days of changes and tombstones to keep.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = changes.prune(options['days'])
+        buried = versions.prune_tombstones(options['days'])
+        self.stdout.write(f"{deleted} changes deleted, {buried} tombstones deleted.")
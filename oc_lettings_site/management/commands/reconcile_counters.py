@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from oc_lettings_site import counters
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the maintained counters from the tables, fixing the drift
+    left by bulk operations that do not send model signals.
+    """
+    help = "Rewrites row-count and facet-count counters from the tables."
+
+    def handle(self, *args, **options):
+        for model in counters.tracked_models():
+            with transaction.atomic():
+                fixed = counters.reconcile(model)
+            self.stdout.write(f"{model._meta.label_lower}: {fixed} counters fixed.")
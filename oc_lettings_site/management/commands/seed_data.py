@@ -0,0 +1,237 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from lettings.models import Address, Letting
+from profiles.models import Profile
+
+
+# (city, state, first zip code, last zip code)
+CITIES = [
+    ("Los Angeles", "CA", 90001, 90089),
+    ("San Diego", "CA", 92101, 92199),
+    ("San Francisco", "CA", 94102, 94188),
+    ("Irvine", "CA", 92602, 92620),
+    ("Anaheim", "CA", 92801, 92825),
+    ("Santa Ana", "CA", 92701, 92712),
+    ("Newport Beach", "CA", 92657, 92663),
+    ("Huntington Beach", "CA", 92646, 92649),
+    ("Joshua Tree", "CA", 92252, 92252),
+    ("Seattle", "WA", 98101, 98199),
+    ("Portland", "OR", 97201, 97299),
+    ("Phoenix", "AZ", 85001, 85099),
+    ("Las Vegas", "NV", 89101, 89199),
+    ("Salt Lake City", "UT", 84101, 84199),
+    ("Santa Fe", "NM", 87501, 87508),
+    ("Denver", "CO", 80201, 80299),
+    ("Austin", "TX", 78701, 78799),
+    ("Houston", "TX", 77001, 77099),
+    ("Dallas", "TX", 75201, 75398),
+    ("Minneapolis", "MN", 55401, 55488),
+    ("Chicago", "IL", 60601, 60699),
+    ("Nashville", "TN", 37201, 37250),
+    ("New Orleans", "LA", 70112, 70190),
+    ("Miami", "FL", 33101, 33199),
+    ("Orlando", "FL", 32801, 32899),
+    ("Atlanta", "GA", 30301, 30399),
+    ("Savannah", "GA", 31401, 31499),
+    ("Brunswick", "GA", 31520, 31527),
+    ("Charleston", "SC", 29401, 29425),
+    ("Asheville", "NC", 28801, 28806),
+    ("Newport News", "VA", 23601, 23612),
+    ("Willoughby", "OH", 44094, 44096),
+    ("Marquette", "MI", 49855, 49855),
+    ("Aliquippa", "PA", 15001, 15001),
+    ("Philadelphia", "PA", 19102, 19154),
+    ("New York", "NY", 10001, 10292),
+    ("East Meadow", "NY", 11554, 11554),
+    ("Boston", "MA", 2108, 2137),
+    ("Honolulu", "HI", 96801, 96850),
+    ("Anchorage", "AK", 99501, 99599),
+]
+
+STREET_NAMES = [
+    "Bedford", "Military", "Wintergreen", "Joy Ridge", "Harvard", "Argyle", "Maple", "Oak",
+    "Pine", "Cedar", "Elm", "Washington", "Lincoln", "Jefferson", "Madison", "Park", "Lake",
+    "Hill", "Sunset", "Ocean", "Bay", "River", "Spring", "Meadow", "Highland", "Church",
+    "Mill", "Forest", "Valley", "Ridge", "Orchard", "Willow", "Chestnut", "Magnolia",
+]
+STREET_SUFFIXES = [
+    "Street", "Avenue", "Road", "Lane", "Drive", "Boulevard", "Court", "Place", "Way",
+]
+
+TITLE_ADJECTIVES = [
+    "Cozy", "Charming", "Sunny", "Rustic", "Modern", "Secluded", "Spacious", "Quiet",
+    "Historic", "Stylish", "Bright", "Luxury", "Tiny", "Hidden", "Restored",
+]
+TITLE_NOUNS = [
+    "Cottage", "Loft", "Cabin", "Bungalow", "Studio", "Villa", "Retreat", "Farmhouse",
+    "Apartment", "Townhouse", "Guesthouse", "Dome", "Treehouse", "Hideaway", "Suite",
+]
+TITLE_FEATURES = [
+    "with Hot Tub", "near Downtown", "by the Beach", "with Ocean View", "with Garden",
+    "in the Woods", "with Pool", "near the Lake", "with Mountain View", "on the River",
+    "with Fireplace", "near the Park",
+]
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+    "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas",
+    "Sarah", "Charles", "Karen", "Daniel", "Nancy", "Matthew", "Lisa", "Anthony", "Betty",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White",
+]
+FAVORITE_CITIES = [
+    "Buenos Aires", "Barcelona", "Budapest", "Berlin", "Paris", "Lisbon", "Tokyo", "Rome",
+    "Prague", "Vienna", "Amsterdam", "Montreal",
+] + [city for city, _state, _first, _last in CITIES]
+
+
+class Command(BaseCommand):
+    """
+    Generates synthetic lettings, addresses, users and profiles.
+    Rows are generated column by column in batches and written with
+    'bulk_create', one transaction per batch. The same seed always
+    produces the same data.
+    """
+    help = "Seeds the database with synthetic lettings and profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lettings', type=int, default=0,
+                            help="Number of lettings (and addresses) to create.")
+        parser.add_argument('--profiles', type=int, default=0,
+                            help="Number of users (and profiles) to create.")
+        parser.add_argument('--seed', type=int, default=42,
+                            help="Random seed, the same seed produces the same rows.")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of rows written per transaction.")
+        parser.add_argument('--password', default='seed-password',
+                            help="Password given to every generated user.")
+
+    def handle(self, *args, **options):
+        if options['lettings'] < 0 or options['profiles'] < 0:
+            raise CommandError("--lettings and --profiles must be positive.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        seed = options['seed']
+        batch_size = options['batch_size']
+
+        # Separate streams so the lettings do not depend on --profiles and vice versa
+        lettings_rng = random.Random(f"lettings-{seed}")
+        profiles_rng = random.Random(f"profiles-{seed}")
+
+        created = 0
+        for start in range(0, options['lettings'], batch_size):
+            size = min(batch_size, options['lettings'] - start)
+            created += self.create_lettings(lettings_rng, size)
+        self.stdout.write(f"{created} lettings created.")
+
+        # Hash once, PBKDF2 would otherwise dominate the run
+        password = make_password(options['password'])
+        created = 0
+        for start in range(0, options['profiles'], batch_size):
+            size = min(batch_size, options['profiles'] - start)
+            created += self.create_profiles(profiles_rng, size, start, seed, password)
+        self.stdout.write(f"{created} profiles created.")
+
+        # bulk_create sends no post_save, bring the derived tables up to date
+        # (the letting summaries and the favorite city lists follow bulk_create)
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('geocode_addresses', missing=True, stdout=self.stdout)
+
+    def create_lettings(self, rng, size):
+        """
+        Creates one batch of addresses and their lettings.
+        Args:
+            rng (random.Random): The random generator of the lettings stream.
+            size (int): The number of lettings to create.
+        Returns:
+            int: The number of lettings created.
+        """
+        cities = rng.choices(CITIES, k=size)
+        numbers = [rng.randint(1, 9999) for _ in range(size)]
+        streets = [
+            f"{name} {suffix}" for name, suffix in zip(
+                rng.choices(STREET_NAMES, k=size),
+                rng.choices(STREET_SUFFIXES, k=size),
+            )
+        ]
+        zip_codes = [rng.randint(first, last) for _city, _state, first, last in cities]
+        titles = [
+            f"{adjective} {noun} {feature}" for adjective, noun, feature in zip(
+                rng.choices(TITLE_ADJECTIVES, k=size),
+                rng.choices(TITLE_NOUNS, k=size),
+                rng.choices(TITLE_FEATURES, k=size),
+            )
+        ]
+
+        addresses = [
+            Address(
+                number=number,
+                street=street,
+                city=city,
+                state=state,
+                zip_code=zip_code,
+                country_iso_code="USA",
+            )
+            for number, street, (city, state, _first, _last), zip_code
+            in zip(numbers, streets, cities, zip_codes)
+        ]
+        with transaction.atomic():
+            Address.objects.bulk_create(addresses)
+            Letting.objects.bulk_create(
+                Letting(title=title, address=address)
+                for title, address in zip(titles, addresses)
+            )
+        return size
+
+    def create_profiles(self, rng, size, offset, seed, password):
+        """
+        Creates one batch of users and their profiles.
+        Args:
+            rng (random.Random): The random generator of the profiles stream.
+            size (int): The number of profiles to create.
+            offset (int): The index of the first profile of the batch.
+            seed (int): The seed, used to keep usernames unique between seeds.
+            password (str): The already hashed password.
+        Returns:
+            int: The number of profiles created.
+        """
+        first_names = rng.choices(FIRST_NAMES, k=size)
+        last_names = rng.choices(LAST_NAMES, k=size)
+        favorite_cities = rng.choices(FAVORITE_CITIES, k=size)
+        usernames = [
+            f"{first}{last}{seed}-{offset + index}"
+            for index, (first, last) in enumerate(zip(first_names, last_names))
+        ]
+
+        if User.objects.filter(username__in=usernames).exists():
+            raise CommandError(
+                f"Users of seed {seed} already exist, use another --seed value."
+            )
+
+        users = [
+            User(
+                username=username,
+                first_name=first,
+                last_name=last,
+                email=f"{username.lower()}@example.com",
+                password=password,
+            )
+            for username, first, last in zip(usernames, first_names, last_names)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            Profile.objects.bulk_create(
+                Profile(user=user, favorite_city=city)
+                for user, city in zip(users, favorite_cities)
+            )
+        return size
@@ -0,0 +1,345 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import compression, prerender, slow_queries
+
+
+FAST_PATH_METHODS = ('GET', 'HEAD')
+PUBLIC_ENGINE = 'public'
+
+
+def is_fast_path(request):
+    """
+    Tells whether a request can skip sessions, auth, messages and CSRF.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        bool: True for anonymous GET/HEAD requests to a public URL namespace.
+    """
+    return getattr(request, 'fast_path', False)
+
+
+def is_public_route(match):
+    """
+    Tells whether a resolved URL is a public page.
+    Args:
+        match (ResolverMatch): The resolved URL.
+    Returns:
+        bool: True for the FAST_PATH_NAMESPACES and the FAST_PATH_ROOT_VIEWS.
+    """
+    if match.namespace:
+        return match.namespace in settings.FAST_PATH_NAMESPACES
+    return match.url_name in settings.FAST_PATH_ROOT_VIEWS
+
+
+def template_engine(request):
+    """
+    Returns the template engine a view should render with.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        str: The slim 'public' engine on the fast path, None (default engine) otherwise.
+    """
+    return PUBLIC_ENGINE if is_fast_path(request) else None
+
+
+class FastPathMiddleware:
+    """
+    Flags anonymous GET/HEAD requests to public URL namespaces.
+    Flagged requests go through the middlewares below without loading
+    a session, looking up a user or storing messages. Must be placed
+    before the session middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.fast_path = self.is_eligible(request)
+        return self.get_response(request)
+
+    @staticmethod
+    def is_eligible(request):
+        if not getattr(settings, 'FAST_PATH_ENABLED', True):
+            return False
+        if request.method not in FAST_PATH_METHODS:
+            return False
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            # A session may hold a logged in user, keep the full stack
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return is_public_route(match)
+
+
+class PrerenderedPageMiddleware:
+    """
+    Serves the pages written by 'manage.py prerender' to fast path
+    requests, with their precompressed variants. Pages not rendered yet
+    (or removed by a change) fall through to the views, and are queued
+    for the background regeneration. Must be placed after FastPathMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Looked up on every request, so regenerated pages are served at once
+        self.pages = WhiteNoise(
+            None,
+            autorefresh=True,
+            max_age=0,
+            allow_all_origins=False,
+            index_file=True,
+        )
+        self.pages.add_files(settings.PRERENDER_ROOT)
+
+    def __call__(self, request):
+        if (
+            is_fast_path(request)
+            and request.path_info.endswith('/')
+            and not request.META.get('QUERY_STRING')
+        ):
+            page = self.pages.find_file(request.path_info)
+            if page is not None:
+                return WhiteNoiseMiddleware.serve(page, request)
+            response = self.get_response(request)
+            if self.is_missing_page(response):
+                prerender.regenerator.add([request.path_info])
+            return response
+        return self.get_response(request)
+
+    @staticmethod
+    def is_missing_page(response):
+        # JSON endpoints of the public namespaces are never prerendered
+        return (
+            response.status_code == 200
+            and response.get('Content-Type', '').startswith('text/html')
+            and prerender.is_enabled()
+        )
+
+
+def preload_links():
+    """
+    Builds the Link header announcing the assets every public page loads.
+    URLs come from the static files storage, hashed by the manifest when
+    a manifest storage is configured.
+    Returns:
+        str: The Link header value, empty if no asset could be resolved.
+    """
+    links = []
+    for name, destination in settings.PRELOAD_ASSETS:
+        try:
+            url = staticfiles_storage.url(name)
+        except ValueError:
+            # Missing from the manifest, collectstatic has not been run
+            continue
+        links.append(f'<{url}>; rel=preload; as={destination}')
+    return ', '.join(links)
+
+
+class EarlyHintsMiddleware:
+    """
+    Adds 'Link: rel=preload' headers for PRELOAD_ASSETS to the HTML pages
+    of public URL namespaces. When the server exposes an early hints
+    callable in the WSGI environ ('wsgi.early_hints'), the links are also
+    sent as a 103 response before the view runs. Must be placed after
+    FastPathMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.links = preload_links()
+
+    def __call__(self, request):
+        if not self.links or request.method != 'GET' or not self.is_public(request):
+            return self.get_response(request)
+
+        send_early_hints = request.META.get('wsgi.early_hints')
+        if callable(send_early_hints):
+            send_early_hints([('Link', self.links)])
+
+        response = self.get_response(request)
+        if response.get('Content-Type', '').startswith('text/html'):
+            existing = response.get('Link')
+            response['Link'] = f'{existing}, {self.links}' if existing else self.links
+        return response
+
+    @staticmethod
+    def is_public(request):
+        if is_fast_path(request):
+            return True
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return is_public_route(match)
+
+
+class FastPathMixin:
+    """
+    Skips the wrapped middleware entirely for fast path requests.
+    """
+
+    def __call__(self, request):
+        if is_fast_path(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class FastPathSessionMiddleware(FastPathMixin, SessionMiddleware):
+    pass
+
+
+class FastPathCsrfViewMiddleware(FastPathMixin, CsrfViewMiddleware):
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_fast_path(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class FastPathAuthenticationMiddleware(FastPathMixin, AuthenticationMiddleware):
+
+    def __call__(self, request):
+        if is_fast_path(request):
+            # No session, so no user lookup: the visitor is anonymous
+            request.user = AnonymousUser()
+        return super().__call__(request)
+
+
+class FastPathMessageMiddleware(FastPathMixin, MessageMiddleware):
+    pass
+
+
+class CompressionMiddleware:
+    """
+    Compresses dynamic responses with Brotli (when installed) or gzip.
+    Public fast path pages are compressed at the configured levels and
+    kept compressed in an LRU, so an unchanged page is compressed once
+    per encoding. Other responses may hold secrets (CSRF tokens), they
+    get gzip with Django's random header padding and are never cached.
+    Adds a Server-Timing header with the CPU time spent and the sizes;
+    streamed responses are recorded in the stats once sent.
+    Must be placed above the middlewares that produce responses.
+    """
+
+    # Random gzip header padding against BREACH, as in Django's GZipMiddleware
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = compression.CompressedCache(settings.COMPRESSION_CACHE_BYTES)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.should_compress(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        public = is_fast_path(request)
+        encoding = compression.accepted_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            None if public else ('gzip',),
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if public:
+                def compress_chunks(chunks):
+                    return compression.compress_stream(chunks, encoding)
+            else:
+                def compress_chunks(chunks):
+                    return compress_sequence(chunks, max_random_bytes=self.max_random_bytes)
+            response.streaming_content = compression.measure_stream(
+                response.streaming_content, compress_chunks
+            )
+            del response.headers['Content-Length']
+            # Sent before the body: the sizes and time go to the stats at its end
+            response.headers['Server-Timing'] = f'compress;desc="{encoding} stream"'
+        elif not self.compress_content(response, encoding, public):
+            return response
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def should_compress(response):
+        if response.has_header('Content-Encoding'):
+            return False
+        if not compression.is_compressible(response.get('Content-Type', '')):
+            return False
+        if response.streaming:
+            return not response.is_async
+        return len(response.content) >= settings.COMPRESSION_MIN_SIZE
+
+    def compress_content(self, response, encoding, public):
+        """
+        Replaces a response body by its compressed version.
+        Args:
+            response (HttpResponse): A non streaming response.
+            encoding (str): 'br' or 'gzip'.
+            public (bool): Whether the body may be shared between visitors.
+        Returns:
+            bool: False if compression would not make the body smaller.
+        """
+        content = response.content
+        started = time.thread_time()
+        key = compression.CompressedCache.key(content, encoding) if public else None
+        compressed = self.cache.get(key) if public else None
+        cache_hit = compressed is not None
+        if not cache_hit:
+            if public:
+                compressed = compression.compress(content, encoding)
+                self.cache.set(key, compressed)
+            else:
+                compressed = compress_string(content, max_random_bytes=self.max_random_bytes)
+        cpu_seconds = time.thread_time() - started
+        if len(compressed) >= len(content):
+            return False
+
+        compression.stats.record(len(content), len(compressed), cpu_seconds, cache_hit)
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Server-Timing'] = (
+            f'compress;dur={cpu_seconds * 1000:.2f};'
+            f'desc="{encoding}{" cached" if cache_hit else ""} '
+            f'{len(content)}>{len(compressed)}"'
+        )
+        return True
+
+
+class SlowQueryMiddleware:
+    """
+    Names the view running the queries of a request in the slow query
+    log. Must be placed last, so the view resolved is the one called.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = slow_queries.current_view.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            slow_queries.current_view.reset(token)
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        slow_queries.current_view.set(request.resolver_match.view_name)
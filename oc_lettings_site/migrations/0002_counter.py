@@ -0,0 +1,68 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Counted models, with the fields their rows are also counted by
+TRACKED_MODELS = {
+    ('lettings', 'Letting'): (),
+    ('lettings', 'Address'): ('state', 'city', 'country_iso_code'),
+    ('profiles', 'Profile'): (),
+}
+
+
+def forward_func(apps, schema_editor):
+    """
+    Fills the counters from the existing rows.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    Counter = apps.get_model('oc_lettings_site', 'Counter')
+    counters = []
+    for (app_label, model_name), fields in TRACKED_MODELS.items():
+        model = apps.get_model(app_label, model_name)
+        label = f'{app_label}.{model_name.lower()}'
+        counters.append(Counter(key=label, value=model.objects.count()))
+        for field in fields:
+            rows = model.objects.order_by().values_list(field).annotate(total=Count('pk'))
+            for value, total in rows:
+                counters.append(Counter(key=f'{label}:{field}:{value}', value=total))
+    Counter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the 'Counter' model holding maintained row counts.
+    Also removes from the migration state the 'Address', 'Letting' and
+    'Profile' models whose tables were moved to the 'lettings' and
+    'profiles' apps (and dropped) by their '0002_migrate_data' migrations.
+    """
+
+    dependencies = [
+        ('oc_lettings_site', '0001_initial'),
+        ('lettings', '0003_admin_search_indexes'),
+        ('profiles', '0002_migrate_data'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(name='Letting'),
+                migrations.DeleteModel(name='Profile'),
+                migrations.DeleteModel(name='Address'),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID')),
+                ('key', models.CharField(max_length=160, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(forward_func, migrations.RunPython.noop),
+    ]
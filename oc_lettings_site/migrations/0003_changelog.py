@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the 'ChangeLog' model, the feed of the writes to lettings,
+    addresses and profiles.
+    """
+
+    dependencies = [
+        ('oc_lettings_site', '0002_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(
+                    choices=[
+                        ('created', 'Created'),
+                        ('updated', 'Updated'),
+                        ('deleted', 'Deleted'),
+                    ],
+                    max_length=8)),
+                ('changed_at', models.DateTimeField(
+                    db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
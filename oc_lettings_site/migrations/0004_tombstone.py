@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the 'Tombstone' model, the versions of the deleted rows.
+    """
+
+    dependencies = [
+        ('oc_lettings_site', '0003_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('version', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
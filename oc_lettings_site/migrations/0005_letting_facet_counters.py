@@ -0,0 +1,45 @@
+from django.db import migrations
+
+
+# Frozen copy of the facet lookups of the lettings at this migration
+FACET_COLUMNS = (
+    ('state', 's.code'),
+    ('city_key', 'a.city_key'),
+    ('country_iso_code', 'c.code'),
+)
+
+
+def facet_sql(field, column):
+    return (
+        'INSERT INTO oc_lettings_site_counter ("key", "value") '
+        f"SELECT 'lettings.letting:{field}:' || {column}, COUNT(*) "
+        'FROM lettings_letting l '
+        'INNER JOIN lettings_address a ON a.id = l.address_id '
+        'INNER JOIN lettings_state s ON s.id = a.state_id '
+        'INNER JOIN lettings_country c ON c.id = a.country_id '
+        f'GROUP BY {column}'
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Moves the facet counters from the addresses to the lettings, which
+    are counted by the fields of their address, and the cities by their
+    case-folded key.
+    """
+
+    dependencies = [
+        ('oc_lettings_site', '0004_tombstone'),
+        ('lettings', '0010_letting_is_active_archive'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                "DELETE FROM oc_lettings_site_counter WHERE \"key\" LIKE 'lettings.address:%' "
+                "OR \"key\" LIKE 'lettings.letting:%'",
+                *[facet_sql(field, column) for field, column in FACET_COLUMNS],
+            ],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Counter(models.Model):
+    """
+    Maintained row count, so totals never need a full-table COUNT(*).
+    Keys are 'app_label.model' for a table total, or
+    'app_label.model:field:value' for the rows sharing a field value.
+    The 'sync:version' key holds the last row version handed out, and
+    'sync:pruned' the last version of the pruned tombstones.
+    """
+    key = models.CharField(max_length=160, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        """
+        Returns a string representation of the counter in the format: 'key = value'.
+        """
+        return f'{self.key} = {self.value}'
+
+
+class ChangeLog(models.Model):
+    """
+    Append-only log of the writes to lettings, addresses and profiles.
+    Sequence numbers only grow, in commit order (SQLite has one writer at
+    a time), so a consumer resumes after the last number it has seen.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=8, choices=ACTIONS)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        """
+        Returns a string representation of the change: 'seq model id action'.
+        """
+        return f'{self.seq} {self.model} {self.object_id} {self.action}'
+
+
+class Tombstone(models.Model):
+    """
+    Version of a deleted letting, address or profile, so mirroring
+    clients learn about the deletions since their last sync.
+    """
+    version = models.BigIntegerField(primary_key=True)
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """
+        Returns a string representation of the deletion: 'version model id'.
+        """
+        return f'{self.version} {self.model} {self.object_id}'
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from . import counters
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids a full COUNT(*) on large unfiltered querysets.
+    Models with maintained counters of all their rows read their total
+    from the counter.
+    Other models estimate it from the highest primary key, read from the
+    end of the rowid index. Filtered querysets and small tables still get
+    an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return super().count
+
+        label = queryset.model._meta.label_lower
+        if label in counters.TRACKED_MODELS and label not in counters.COUNTED_ROWS:
+            return counters.get_count(queryset.model)
+
+        estimate = queryset.order_by().aggregate(highest=Max('pk'))['highest'] or 0
+        if estimate < settings.ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
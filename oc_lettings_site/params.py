@@ -0,0 +1,95 @@
+import math
+
+
+def within(name, value, low, high):
+    # The message names the bounds that are set only
+    if (low is not None and value < low) or (high is not None and value > high):
+        if high is None:
+            raise ValueError(f"'{name}' must be at least {low}.")
+        if low is None:
+            raise ValueError(f"'{name}' must be at most {high}.")
+        raise ValueError(f"'{name}' must be between {low} and {high}.")
+    return value
+
+
+def float_param(request, name, default=None, low=None, high=None):
+    """
+    Reads a numeric query parameter.
+    Returns:
+        float: The value, the default when the parameter is missing.
+    Raises:
+        ValueError: If the value is not a finite number within [low, high].
+    """
+    raw = request.GET.get(name)
+    if raw in (None, '') and default is not None:
+        return default
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number.")
+    if not math.isfinite(value):
+        raise ValueError(f"'{name}' must be a number.")
+    return within(name, value, low, high)
+
+
+def int_param(request, name, default=None, low=None, high=None):
+    """
+    Reads an integer query parameter.
+    Returns:
+        int: The value, the default when the parameter is missing.
+    Raises:
+        ValueError: If the value is not an integer within [low, high].
+    """
+    raw = request.GET.get(name)
+    if raw in (None, '') and default is not None:
+        return default
+    # int() directly, so '1e3' and '2.0' are rejected and large values stay exact
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be an integer.")
+    return within(name, value, low, high)
+
+
+def list_param(request, name, choices, default=()):
+    """
+    Reads a comma separated list query parameter.
+    Args:
+        request (HttpRequest): The HTTP request object.
+        name (str): The parameter name.
+        choices (iterable): The accepted items.
+        default (tuple): The items when the parameter is missing.
+    Returns:
+        list: The distinct items, in the given order.
+    Raises:
+        ValueError: If an item is not one of the choices.
+    """
+    raw = request.GET.get(name)
+    if raw in (None, ''):
+        return list(default)
+    items = list(dict.fromkeys(item.strip() for item in raw.split(',') if item.strip()))
+    unknown = [item for item in items if item not in choices]
+    if unknown:
+        raise ValueError(f"'{name}' accepts {', '.join(choices)}, not {', '.join(unknown)}.")
+    return items
+
+
+def int_list_param(request, name, max_items):
+    """
+    Reads a comma separated list of positive integers, duplicates dropped.
+    Returns:
+        list: The distinct integers, in the given order.
+    Raises:
+        ValueError: If the list is missing, holds something else than
+        positive integers or more than max_items of them.
+    """
+    raw = request.GET.get(name, '')
+    try:
+        items = list(dict.fromkeys(int(item) for item in raw.split(',') if item.strip()))
+    except ValueError:
+        raise ValueError(f"'{name}' must be comma separated integers.")
+    if not items or min(items) < 1:
+        raise ValueError(f"'{name}' must list positive integers.")
+    if len(items) > max_items:
+        raise ValueError(f"'{name}' accepts at most {max_items} items.")
+    return items
@@ -0,0 +1,283 @@
+import atexit
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from whitenoise.compress import Compressor, brotli_installed
+
+from lettings.models import Letting
+from profiles.models import Profile
+from . import errors
+
+
+INDEX_FILE = 'index.html'
+
+# Precompressed variants, served by WhiteNoise to clients accepting them
+ENCODINGS = [('.gz', Compressor.compress_gzip)]
+if brotli_installed:
+    ENCODINGS.insert(0, ('.br', Compressor.compress_brotli))
+
+
+def is_enabled():
+    """
+    Tells whether model changes should regenerate the prerendered pages.
+    Returns:
+        bool: True once 'manage.py prerender' has created the pages directory.
+    """
+    return settings.PRERENDER_INCREMENTAL and os.path.isdir(settings.PRERENDER_ROOT)
+
+
+def home_path():
+    return reverse('index')
+
+
+def lettings_index_path():
+    return reverse('lettings:index')
+
+
+def letting_path(letting_id):
+    return reverse('lettings:letting', kwargs={'letting_id': letting_id})
+
+
+def profiles_index_path():
+    return reverse('profiles:index')
+
+
+def profile_path(username):
+    # Files are looked up by the decoded path, like request.path_info
+    return unquote(reverse('profiles:profile', kwargs={'username': username}))
+
+
+def public_paths():
+    """
+    Yields the path of every public page, listing rows with iterators.
+    Yields:
+        str: A page path, ending with a slash.
+    """
+    yield home_path()
+    yield lettings_index_path()
+    yield profiles_index_path()
+    for letting_id in Letting.objects.order_by('pk').values_list('pk', flat=True).iterator():
+        yield letting_path(letting_id)
+    usernames = Profile.objects.order_by('pk').values_list('user__username', flat=True)
+    for username in usernames.iterator():
+        yield profile_path(username)
+
+
+def page_file(path):
+    """
+    Returns the file a page is written to.
+    Args:
+        path (str): The page path.
+    Returns:
+        str: '<PRERENDER_ROOT>/<path>/index.html', or None for a path that
+        would escape the pages directory.
+    """
+    parts = [part for part in path.split('/') if part]
+    if any(part in ('.', '..') for part in parts):
+        return None
+    return os.path.join(settings.PRERENDER_ROOT, *parts, INDEX_FILE)
+
+
+def render_page(path):
+    """
+    Renders a page through its view, as an anonymous visitor would get it.
+    Args:
+        path (str): The page path.
+    Returns:
+        HttpResponse: The view response.
+    """
+    request = RequestFactory().get(path, HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    # Fast path requests render with the 'public' engine, like visitors do
+    request.fast_path = True
+    match = resolve(path)
+    return match.func(request, *match.args, **match.kwargs)
+
+
+def write_atomic(filename, content):
+    # Readers always see a complete file, the old or the new one
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.prerender-')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def remove_file(filename):
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
+def write_page(filename, content):
+    """
+    Writes a page and its precompressed variants.
+    Args:
+        filename (str): The page file.
+        content (bytes): The rendered HTML.
+    """
+    for suffix, compress in ENCODINGS:
+        compressed = compress(content)
+        if len(compressed) < len(content) * 0.95:
+            write_atomic(filename + suffix, compressed)
+        else:
+            remove_file(filename + suffix)
+    write_atomic(filename, content)
+
+
+def remove_page(path):
+    """
+    Deletes a prerendered page, so its view serves the request again.
+    Args:
+        path (str): The page path.
+    """
+    filename = page_file(path)
+    if filename is None:
+        return
+    remove_file(filename)
+    for suffix in ('.br', '.gz'):
+        remove_file(filename + suffix)
+    try:
+        os.rmdir(os.path.dirname(filename))
+    except OSError:
+        # Not empty (it holds sub pages) or already gone
+        pass
+
+
+def prerender(path):
+    """
+    Renders a page and writes it, or removes it when the view has no page.
+    Args:
+        path (str): The page path.
+    Returns:
+        bool: True if the page was written.
+    """
+    filename = page_file(path)
+    if filename is None:
+        return False
+    response = render_page(path)
+    if response.status_code == 404:
+        remove_page(path)
+        return False
+    if response.status_code != 200:
+        # Keep serving the previous version rather than an error page
+        return False
+    content = b''.join(response) if response.streaming else response.content
+    write_page(filename, content)
+    return True
+
+
+class Regenerator:
+    """
+    Pages waiting to be rendered again by a background thread of the
+    process, so saves never render pages on the request path. The thread
+    starts on the first change and waits PRERENDER_DELAY seconds before
+    rendering, so a burst of writes renders each page once; a page
+    changed again while it waits is rendered once too.
+    Only server workers (see wsgi.py) have the thread: commands and shells
+    would exit before it runs, they render their pages with flush().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.changed = threading.Event()
+        self.thread = None
+        self.background = False
+        self.flushed_at_exit = False
+
+    def add(self, paths):
+        """
+        Queues pages for the background thread, starting it if needed.
+        Args:
+            paths (list): The paths of the pages to render again.
+        """
+        if not paths:
+            return
+        with self.lock:
+            self.paths.update(dict.fromkeys(paths))
+            self.changed.set()
+            if not self.background:
+                if not self.flushed_at_exit:
+                    # Shells never call flush()
+                    atexit.register(self.regenerate)
+                    self.flushed_at_exit = True
+            elif self.thread is None or not self.thread.is_alive():
+                self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='prerender', daemon=True)
+        self.thread.start()
+
+    def take(self):
+        with self.lock:
+            paths, self.paths = list(self.paths), {}
+            self.changed.clear()
+        return paths
+
+    def regenerate(self):
+        """
+        Renders the queued pages in the calling thread.
+        Returns:
+            int: The number of pages rendered or removed.
+        """
+        paths = self.take()
+        for path in paths:
+            try:
+                prerender(path)
+            except Exception as e:
+                # A stale page is better than a dead thread
+                errors.report_exception(e, "Erreur lors de la régénération des pages statiques.")
+        return len(paths)
+
+    def run(self):
+        while True:
+            self.changed.wait()
+            time.sleep(settings.PRERENDER_DELAY)
+            try:
+                self.regenerate()
+            finally:
+                # The thread's own database connection
+                connection.close()
+
+
+regenerator = Regenerator()
+
+
+def schedule(paths, removed=()):
+    """
+    Once the current transaction commits, removes the pages that no longer
+    exist and queues the changed ones for the background thread. Until
+    they are rendered again, the previous versions are served.
+    Args:
+        paths (list): The paths of the pages to render again.
+        removed (list): The paths of the pages that no longer exist.
+    """
+    def queue():
+        for path in removed:
+            remove_page(path)
+        regenerator.add(paths)
+
+    transaction.on_commit(queue)
+
+
+def flush():
+    """
+    Renders the queued pages in the calling thread, once the current
+    transaction commits. Called by the management commands that write,
+    as their process has no background thread.
+    """
+    transaction.on_commit(regenerator.regenerate)
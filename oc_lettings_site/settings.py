@@ -80,15 +80,37 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'oc_lettings_site.middleware.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'oc_lettings_site.middleware.FastPathMiddleware',
+    'oc_lettings_site.middleware.EarlyHintsMiddleware',
+    'oc_lettings_site.middleware.PrerenderedPageMiddleware',
+    'oc_lettings_site.middleware.FastPathSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'oc_lettings_site.middleware.FastPathCsrfViewMiddleware',
+    'oc_lettings_site.middleware.FastPathAuthenticationMiddleware',
+    'oc_lettings_site.middleware.FastPathMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'oc_lettings_site.middleware.SlowQueryMiddleware',
 ]
 
+
+# Anonymous GET requests to these URL namespaces, and to these views of
+# the root URLconf, skip sessions, auth, messages and CSRF, and render
+# with the slim 'public' template engine
+FAST_PATH_ENABLED = True
+FAST_PATH_NAMESPACES = ['lettings', 'profiles', 'profiles_api']
+FAST_PATH_ROOT_VIEWS = ['index', 'suggest']
+
+
+# Static copies of the public pages, written by 'manage.py prerender' and
+# served on the fast path. Model changes regenerate the affected pages in
+# a background thread of each worker, PRERENDER_DELAY seconds after the
+# first change, so a burst of writes renders each page once.
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
+PRERENDER_INCREMENTAL = True
+PRERENDER_DELAY = 2.0
+
 ROOT_URLCONF = 'oc_lettings_site.urls'
 
 TEMPLATES = [
@@ -105,6 +127,18 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        'NAME': 'public',
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'oc_lettings_site', 'templates')],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+            ],
+        },
+    },
 ]
 
 WSGI_APPLICATION = 'oc_lettings_site.wsgi.application'
@@ -120,6 +154,127 @@ DATABASES = {
 }
 
 
+# Cache shared by the workers of the host: an in-process LRU in front of a
+# SQLite file, surviving worker restarts. Values deleted by another worker
+# may be served for L1_TIMEOUT more seconds. get_or_set(), used for the
+# lettings of the favorite cities, computes a missing value once for all
+# the workers, and refreshes popular values ahead of their expiry
+# (EARLY_RECOMPUTE_BETA). The tests use a file of their own, emptied after
+# each test (see conftest.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'oc_lettings_site.cache_backend.TieredCache',
+        'LOCATION': os.getenv('CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 2000,
+            'L1_TIMEOUT': 5,
+            'EARLY_RECOMPUTE_BETA': 1.0,
+            'LOCK_TIMEOUT': 10,
+        },
+    }
+}
+
+
+# List pages above this many rows are streamed, rendered this many rows at a time
+STREAMING_LIST_THRESHOLD = 500
+STREAMING_CHUNK_SIZE = 200
+
+
+# Dynamic responses from this size are compressed (Brotli when installed,
+# else gzip). Compressed public pages are kept in a per process LRU.
+COMPRESSION_MIN_SIZE = 860
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_CACHE_BYTES = 8 * 1024 * 1024
+
+
+# The same error is reported to Sentry at most once per interval (seconds),
+# and at most ERROR_REPORT_LIMIT errors are reported per minute
+ERROR_REPORT_INTERVAL = 60
+ERROR_REPORT_LIMIT = 20
+
+
+# Coordinates of the zip codes used to geocode addresses offline, as a CSV
+# with 'zip_code', 'latitude' and 'longitude' columns, or a Census ZCTA
+# gazetteer file. The bundled file is an approximation at the city level:
+# every zip code of a city is placed at the city centre
+GEOCODING_DATASET = os.path.join(BASE_DIR, 'lettings', 'data', 'zip_city_centres.csv')
+
+
+# Lettings near a point: default and largest radius (km), default and largest count
+NEARBY_DEFAULT_RADIUS_KM = 25
+NEARBY_MAX_RADIUS_KM = 200
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+
+
+# Number of lettings of their favorite city shown on the profile pages,
+# seconds each city list stays in the shared cache (dropped on commit of a
+# change to the lettings of the city), and seconds before a stored list is
+# computed again
+FAVORITE_CITY_LETTINGS = 5
+FAVORITE_CITY_CACHE_TIMEOUT = 300
+FAVORITE_CITY_LIST_MAX_AGE = 3600
+
+
+# Batch lettings endpoint: ids accepted per request, and seconds each
+# letting stays cached (changes drop it from the shared cache on commit)
+LETTINGS_BATCH_MAX_IDS = 500
+LETTINGS_BATCH_CACHE_TIMEOUT = 300
+
+
+# Profile pages: contexts cached per worker by username, missing ones
+# included, for at most PROFILE_CACHE_TIMEOUT seconds
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TIMEOUT = 60
+
+
+# Profiles API: profiles per page when no limit is given, and at most
+PROFILES_API_DEFAULT_LIMIT = 100
+PROFILES_API_MAX_LIMIT = 1000
+
+
+# Typeahead: values suggested per kind, entries kept per kind, pending
+# changes merged into the compact index, and seconds between rebuilds
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_ENTRIES = 2000000
+SUGGEST_COMPACT_THRESHOLD = 1000
+SUGGEST_REBUILD_INTERVAL = 600
+
+
+# Change feed: changes per poll by default and at most, event streams per
+# process (each holds a worker thread), seconds between polls of the log,
+# between keepalive comments, before a stream ends and before a client
+# reconnects, and days the changes and the tombstones of the delta sync
+# are kept by 'manage.py prune_changelog'
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 1000
+CHANGES_MAX_STREAMS = 4
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_HEARTBEAT_INTERVAL = 15
+CHANGES_STREAM_TIMEOUT = 60
+CHANGES_RETRY_INTERVAL = 3
+CHANGELOG_RETENTION_DAYS = 30
+
+
+# Delta sync: changed and deleted rows per batch by default and at most
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 5000
+
+
+# Queries slower than this (milliseconds) are logged per worker with their
+# plan, view and call site, None disables the log; at most
+# SLOW_QUERY_MAX_FINGERPRINTS distinct queries are kept
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_MAX_FINGERPRINTS = 200
+
+
+# Admin changelists estimate the total of unfiltered tables above this size
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -148,8 +303,28 @@ WHITENOISE_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 WHITENOISE_MAX_AGE = 0
 
 
-# Production switch
+# Assets loaded by every page of base.html, announced with Link preload
+# headers (and 103 Early Hints when the server supports them)
+PRELOAD_ASSETS = [
+    ('css/styles.css', 'style'),
+    ('js/scripts.js', 'script'),
+    ('assets/img/logo.png', 'image'),
+]
+
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+
+# Production switch: hashed file names from the collectstatic manifest,
+# in the pages and in their preload headers
 if not DEBUG:
-    STATICFILES_STORAGE = (
-        'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    STORAGES['staticfiles']['BACKEND'] = (
+        'oc_lettings_site.storage.ManifestStaticFilesStorage'
     )  # WhiteNoise
@@ -1,8 +1,16 @@
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_login_failed
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 import sentry_sdk
 
+from lettings.models import Address, Letting
+from lettings.signals import city_lettings_changed
+from profiles.models import Profile
+from . import changes, counters, prerender, versions
+from .models import ChangeLog, Tombstone
+from .suggest import suggester
+
 
 @receiver(user_login_failed)
 def log_failed_login(sender, credentials, **kwargs):
@@ -18,3 +26,243 @@ def log_failed_login(sender, credentials, **kwargs):
     else:
         # Failed Username
         sentry_sdk.capture_message(f"Échec de connexion pour l'utilisateur inexistant: {username}")
+
+
+def stored_address(address):
+    # The address as saved, before the current update
+    return Address(
+        city_key=address.stored_value('city_key'),
+        state_id=address.stored_value('state_id'),
+        country_id=address.stored_value('country_id'),
+    )
+
+
+def counted_keys(letting):
+    # Lettings are counted by the fields of their address, when active
+    return set(counters.keys_for(letting)) if counters.is_counted(letting) else set()
+
+
+def move_counted_letting(old_letting, new_letting):
+    old_keys, new_keys = counted_keys(old_letting), counted_keys(new_letting)
+    counters.increment(sorted(old_keys - new_keys), -1)
+    counters.increment(sorted(new_keys - old_keys), 1)
+
+
+@receiver(post_save, sender=Letting)
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=Profile)
+def count_saved_row(sender, instance, created, raw, **kwargs):
+    if created:
+        if counters.is_counted(instance):
+            counters.increment(counters.keys_for(instance))
+    elif raw or sender is Profile:
+        return
+    elif sender is Letting:
+        previous_id = instance.stored_value('address_id')
+        was_active = instance.stored_value('is_active')
+        moved = previous_id is not None and previous_id != instance.address_id
+        if not moved and was_active == instance.is_active:
+            return
+        address = Address.objects.get(pk=previous_id) if moved else instance.address
+        move_counted_letting(Letting(address=address, is_active=was_active), instance)
+    else:
+        previous = stored_address(instance)
+        if counters.keys_for(Letting(address=previous)) == counters.keys_for(
+            Letting(address=instance)
+        ):
+            return
+        if Letting.objects.filter(address=instance, is_active=True).exists():
+            move_counted_letting(Letting(address=previous), Letting(address=instance))
+
+
+@receiver(post_delete, sender=Letting)
+@receiver(post_delete, sender=Address)
+@receiver(post_delete, sender=Profile)
+def count_deleted_row(sender, instance, **kwargs):
+    if counters.is_counted(instance):
+        counters.increment(counters.keys_for(instance), -1)
+
+
+@receiver(post_save, sender=Letting)
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=Profile)
+def log_saved_row(sender, instance, created, **kwargs):
+    changes.record(instance, ChangeLog.CREATED if created else ChangeLog.UPDATED)
+
+
+@receiver(versions.rows_bulk_created, sender=Letting)
+@receiver(versions.rows_bulk_created, sender=Address)
+@receiver(versions.rows_bulk_created, sender=Profile)
+def log_bulk_created_rows(sender, objs, **kwargs):
+    # Without a primary key when bulk_create ignored conflicts
+    changes.record_many(sender, [obj.pk for obj in objs if obj.pk is not None], ChangeLog.CREATED)
+
+
+@receiver(post_delete, sender=Letting)
+@receiver(post_delete, sender=Address)
+@receiver(post_delete, sender=Profile)
+def log_deleted_row(sender, instance, **kwargs):
+    changes.record(instance, ChangeLog.DELETED)
+
+
+def is_login(update_fields):
+    # Logins change nothing a profile shows
+    return update_fields is not None and set(update_fields) <= {'last_login'}
+
+
+@receiver(post_save, sender=User)
+def log_saved_user(sender, instance, created, raw, update_fields, **kwargs):
+    if created or raw or is_login(update_fields):
+        # A new user has no profile yet
+        return
+    profile_id = Profile.objects.filter(user=instance).values_list('pk', flat=True).first()
+    if profile_id is not None:
+        changes.record(Profile(pk=profile_id), ChangeLog.UPDATED)
+        # Synced profiles carry the username
+        versions.touch(Profile, profile_id)
+
+
+@receiver(post_delete, sender=Letting)
+@receiver(post_delete, sender=Address)
+@receiver(post_delete, sender=Profile)
+def bury_deleted_row(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        version=versions.next_version(), model=sender._meta.label_lower, object_id=instance.pk
+    )
+
+
+@receiver(post_save, sender=Letting)
+def prerender_saved_letting(sender, instance, raw, **kwargs):
+    if raw or not prerender.is_enabled():
+        return
+    prerender.schedule([prerender.letting_path(instance.pk), prerender.lettings_index_path()])
+
+
+@receiver(post_delete, sender=Letting)
+def prerender_deleted_letting(sender, instance, **kwargs):
+    if not prerender.is_enabled():
+        return
+    prerender.schedule(
+        [prerender.lettings_index_path()], removed=[prerender.letting_path(instance.pk)]
+    )
+
+
+@receiver(post_save, sender=Address)
+def prerender_saved_address(sender, instance, created, raw, **kwargs):
+    if created or raw or not prerender.is_enabled():
+        return
+    letting_ids = Letting.objects.filter(address=instance).values_list('pk', flat=True)
+    paths = [prerender.letting_path(letting_id) for letting_id in letting_ids]
+    if paths:
+        # The index shows the lettings facets
+        paths.append(prerender.lettings_index_path())
+    prerender.schedule(paths)
+
+
+@receiver(city_lettings_changed)
+def prerender_city_profiles(sender, city_keys, **kwargs):
+    if not prerender.is_enabled():
+        return
+    # Their pages list the latest lettings of their favorite city. A city
+    # may be the favorite of thousands: the pages are only removed, and
+    # rendered again on their next visit
+    usernames = Profile.objects.filter(favorite_city_key__in=city_keys).values_list(
+        'user__username', flat=True
+    )
+    prerender.schedule([], removed=[prerender.profile_path(username) for username in usernames])
+
+
+@receiver(post_save, sender=Profile)
+def prerender_saved_profile(sender, instance, created, raw, **kwargs):
+    if raw or not prerender.is_enabled():
+        return
+    paths = [prerender.profile_path(instance.user.username)]
+    if created:
+        paths.append(prerender.profiles_index_path())
+    prerender.schedule(paths)
+
+
+@receiver(post_delete, sender=Profile)
+def prerender_deleted_profile(sender, instance, **kwargs):
+    if not prerender.is_enabled():
+        return
+    prerender.schedule(
+        [prerender.profiles_index_path()],
+        removed=[prerender.profile_path(instance.user.username)],
+    )
+
+
+@receiver(post_init, sender=User)
+def remember_stored_username(sender, instance, **kwargs):
+    # Users are not our models: their username, as loaded (or built), is
+    # remembered here for the signals below, and updated once saved
+    instance._stored_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def prerender_saved_user(sender, instance, created, raw, update_fields, **kwargs):
+    if created or raw or is_login(update_fields) or not prerender.is_enabled():
+        return
+    if not Profile.objects.filter(user=instance).exists():
+        return
+    # The page of the old username must go if the user is renamed
+    previous = getattr(instance, '_stored_username', None)
+    if previous is not None and previous != instance.username:
+        prerender.schedule(
+            [prerender.profile_path(instance.username), prerender.profiles_index_path()],
+            removed=[prerender.profile_path(previous)],
+        )
+    else:
+        prerender.schedule([prerender.profile_path(instance.username)])
+
+
+@receiver(post_save, sender=Letting)
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=User)
+def suggest_saved_value(sender, instance, created, raw, update_fields, **kwargs):
+    if raw or is_login(update_fields) or not suggester.ready:
+        return
+    kind, field_name = SUGGESTED_FIELDS[sender]
+    if sender is User and not Profile.objects.filter(user=instance).exists():
+        return
+    if created:
+        previous = None
+    elif sender is User:
+        previous = instance._stored_username
+    else:
+        previous = instance.stored_value(field_name)
+    if previous is None:
+        suggester.add(kind, getattr(instance, field_name))
+    else:
+        suggester.replace(kind, previous, getattr(instance, field_name))
+
+
+@receiver(post_save, sender=Profile)
+def suggest_saved_profile(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        suggester.add('usernames', instance.user.username)
+
+
+@receiver(post_delete, sender=Letting)
+@receiver(post_delete, sender=Address)
+@receiver(post_delete, sender=Profile)
+def unsuggest_deleted_value(sender, instance, **kwargs):
+    if sender is Profile:
+        suggester.remove('usernames', instance.user.username)
+        return
+    kind, field_name = SUGGESTED_FIELDS[sender]
+    suggester.remove(kind, getattr(instance, field_name))
+
+
+# Kind of suggestion and field of the models feeding the typeahead
+SUGGESTED_FIELDS = {
+    Letting: ('titles', 'title'),
+    Address: ('cities', 'city'),
+    User: ('usernames', 'username'),
+}
+
+
+@receiver(post_save, sender=User)
+def remember_saved_username(sender, instance, **kwargs):
+    # After the receivers above, which compare with the previous username
+    instance._stored_username = instance.username
@@ -0,0 +1,170 @@
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from . import errors
+
+
+# Name of the view running the queries of the current request
+current_view = contextvars.ContextVar('current_view', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+# Frames of these directories are not call sites
+_IGNORED_PATHS = tuple(
+    os.path.dirname(module.__file__) + os.sep
+    for module in (sys.modules['django'], contextvars)
+) + (__file__,)
+
+
+def fingerprint(sql):
+    """
+    Normalizes a query so its runs with other values group together:
+    literals and placeholders become '?', IN lists '(...)'.
+    Args:
+        sql (str): The query, with '%s' placeholders.
+    Returns:
+        str: The normalized query.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql.replace('%s', '?')).strip()
+
+
+def call_site():
+    """
+    Finds the project code that ran the query, skipping Django, the
+    libraries and this module.
+    Returns:
+        str: 'path:line in function', None if only library code is on the stack.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if (
+            not path.startswith(_IGNORED_PATHS)
+            and 'site-packages' not in path
+            and str(settings.BASE_DIR) in path
+        ):
+            relative = os.path.relpath(path, settings.BASE_DIR)
+            return f'{relative}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params, many):
+    """
+    Reads the plan of a query, on a cursor without the execute wrappers.
+    Returns:
+        list: The plan lines, indented by depth, or the error message.
+    """
+    if many:
+        params = next(iter(params or []), None)
+    try:
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    depth = {0: 0}
+    lines = []
+    for node, parent, _unused, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append('  ' * (depth[node] - 1) + detail)
+    return lines
+
+
+class SlowQueryLog:
+    """
+    Slow queries of this process aggregated by fingerprint, with the plan,
+    views and call site of their last run. Holds at most
+    SLOW_QUERY_MAX_FINGERPRINTS entries, the least total time goes first.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, sql, duration, plan, view, site):
+        key = fingerprint(sql)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                    del self.entries[min(self.entries, key=lambda k: self.entries[k]['total'])]
+                entry = self.entries[key] = {
+                    'fingerprint': key, 'count': 0, 'total': 0.0, 'max': 0.0, 'views': {},
+                }
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            if view:
+                entry['views'][view] = entry['views'].get(view, 0) + 1
+            entry.update(sql=sql, plan=plan, call_site=site)
+
+    def snapshot(self):
+        """
+        Returns the aggregated slow queries.
+        Returns:
+            list: One dict per fingerprint, with times in milliseconds,
+            the largest total time first.
+        """
+        with self.lock:
+            entries = [dict(entry, views=dict(entry['views'])) for entry in self.entries.values()]
+        for entry in entries:
+            entry['mean'] = entry['total'] / entry['count']
+        return sorted(entries, key=lambda entry: -entry['total'])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+log = SlowQueryLog()
+
+
+def make_wrapper(connection):
+    """
+    Builds the execute wrapper of a connection. A fast query only costs
+    two clock reads and a comparison; a slow one is explained and recorded.
+    """
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            threshold = settings.SLOW_QUERY_THRESHOLD_MS
+            if threshold is not None and duration >= threshold:
+                try:
+                    log.record(
+                        sql, duration, explain(connection, sql, params, many),
+                        current_view.get(), call_site(),
+                    )
+                except Exception as e:
+                    errors.report_exception(
+                        e, "Erreur pendant l'enregistrement d'une requête lente."
+                    )
+
+    return wrapper
+
+
+def install(connection, **kwargs):
+    """
+    Adds the slow query wrapper to a new database connection.
+    """
+    if settings.SLOW_QUERY_THRESHOLD_MS is not None:
+        connection.execute_wrappers.append(make_wrapper(connection))
@@ -0,0 +1,57 @@
+from django.db import models
+
+
+class StoredValuesModel(models.Model):
+    """
+    Remembers the STORED_FIELDS values of a row as loaded from the
+    database, and as last saved, so the save signals compare a row with
+    its stored version without reading it again.
+    """
+
+    # Attribute names ('address_id' for a foreign key) of the remembered fields
+    STORED_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stored()
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.load_stored()
+        super().save(*args, **kwargs)
+        self.remember_stored(kwargs.get('update_fields'))
+
+    def remember_stored(self, update_fields=None):
+        stored = self.__dict__.setdefault('_stored', {})
+        if update_fields is None:
+            names = self.STORED_FIELDS
+        else:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            names = [name for name in self.STORED_FIELDS if name in saved]
+        for name in names:
+            # Deferred fields are not loaded
+            if name in self.__dict__:
+                stored[name] = self.__dict__[name]
+
+    def load_stored(self):
+        # One query, only for an instance built by hand or with deferred fields
+        stored = self.__dict__.setdefault('_stored', {})
+        missing = [name for name in self.STORED_FIELDS if name not in stored]
+        if missing:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            stored.update(row or {})
+
+    def stored_value(self, name):
+        """
+        Returns the value of a field as stored before the current save.
+        Args:
+            name (str): One of the STORED_FIELDS.
+        Returns:
+            The stored value, None for a new row.
+        """
+        return self.__dict__.get('_stored', {}).get(name)
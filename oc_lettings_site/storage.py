@@ -0,0 +1,19 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class ManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    WhiteNoise's compressed manifest storage, hashed file names included.
+    The theme stylesheet references images the project does not ship
+    (device mockups, card backgrounds): their URLs are left as they are
+    instead of failing collectstatic.
+    """
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # Not a static file of the project, the browser gets a 404 as before
+            return name
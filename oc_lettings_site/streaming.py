@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from . import errors
+
+
+# Written by the page template where the rows go, then split on
+STREAM_MARKER = '<!-- streamed rows -->'
+
+
+def should_stream(count):
+    """
+    Tells whether a list page is large enough to be streamed.
+    Args:
+        count (int): The number of rows of the list.
+    Returns:
+        bool: True above the STREAMING_LIST_THRESHOLD setting.
+    """
+    return count > settings.STREAMING_LIST_THRESHOLD
+
+
+def render_streaming(request, template_name, context, rows, rows_template_name, using=None):
+    """
+    Renders a list page as a stream: the page up to the list is sent at once,
+    then the rows chunk by chunk, then the end of the page.
+    The page template outputs 'streamed_rows' where the rows go, the rows
+    template renders one chunk given as 'rows'. Only one chunk of rows is
+    held in memory at a time.
+    Args:
+        request (HttpRequest): The HTTP request object.
+        template_name (str): The page template.
+        context (dict): The page context, without the rows.
+        rows (QuerySet): The rows, restricted with only() to the displayed fields.
+        rows_template_name (str): The template of a chunk of rows.
+        using (str): The template engine name.
+    Returns:
+        StreamingHttpResponse: The page, as a stream of HTML chunks.
+    """
+    page_context = dict(context, streamed_rows=mark_safe(STREAM_MARKER))
+    page = render_to_string(template_name, page_context, request, using=using)
+    if STREAM_MARKER not in page:
+        # Nothing to stream, the template took its empty list branch
+        return HttpResponse(page)
+    head, tail = page.split(STREAM_MARKER, 1)
+    rows_template = get_template(rows_template_name, using=using)
+    chunk_size = settings.STREAMING_CHUNK_SIZE
+
+    def stream():
+        yield head
+        try:
+            chunk = []
+            for row in rows.iterator(chunk_size=chunk_size):
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield rows_template.render({'rows': chunk})
+                    chunk = []
+            if chunk:
+                yield rows_template.render({'rows': chunk})
+        except Exception as e:
+            # Headers are sent, a 500 page is no longer possible: close the page
+            errors.report_exception(e, f"Erreur pendant le streaming de {template_name}.")
+        yield tail
+
+    return StreamingHttpResponse(stream(), content_type='text/html; charset=utf-8')
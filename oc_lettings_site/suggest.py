@@ -0,0 +1,297 @@
+import bisect
+import heapq
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.db.models.lookups import Exact
+
+from lettings.fields import fold
+from lettings.models import Address, Letting
+from profiles.models import Profile
+from . import errors
+
+
+KINDS = ('titles', 'cities', 'usernames')
+
+SEPARATOR = '\x00'
+
+
+def sort_key(value):
+    return value.casefold(), value
+
+
+class PrefixIndex:
+    """
+    Distinct strings sorted by their case-folded form, searched by prefix
+    with a binary search. The bulk of the entries is stored as one string
+    and an array of offsets, about one byte per character plus four per
+    entry. Changes go to a small sorted list and a set of removed values,
+    merged into the bulk by a background thread once they exceed
+    SUGGEST_COMPACT_THRESHOLD, so writes never pack the index.
+    """
+
+    def __init__(self, values=()):
+        self.lock = threading.Lock()
+        self.blob, self.offsets = self.pack(values)
+        self.added = []
+        self.removed = set()
+        # Changes made while the bulk is packed, applied again after
+        self.replayed = None
+
+    @staticmethod
+    def pack(values):
+        values = set(values)
+        values.discard('')
+        limit = settings.SUGGEST_MAX_ENTRIES
+        if len(values) > limit:
+            # Bounded memory: the shortest values are the likeliest completions
+            values = heapq.nsmallest(limit, values, key=lambda value: (len(value), value))
+        ordered = sorted((value.replace(SEPARATOR, '') for value in values), key=sort_key)
+        offsets = array('I', [0])
+        position = 0
+        for value in ordered:
+            position += len(value) + 1
+            offsets.append(position)
+        return SEPARATOR.join(ordered) + SEPARATOR, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1 + len(self.added) - len(self.removed)
+
+    def entry(self, position):
+        return self.blob[self.offsets[position]:self.offsets[position + 1] - 1]
+
+    def memory_bytes(self):
+        return len(self.blob) + self.offsets.itemsize * len(self.offsets)
+
+    def stored(self, value):
+        position = bisect.bisect_left(
+            range(len(self.offsets) - 1), sort_key(value), key=lambda i: sort_key(self.entry(i))
+        )
+        return position < len(self.offsets) - 1 and self.entry(position) == value
+
+    def add(self, value):
+        if not value:
+            return
+        with self.lock:
+            self.insert(value)
+            if self.replayed is not None:
+                self.replayed.append((self.insert, value))
+            self.compact_if_needed()
+
+    def remove(self, value):
+        with self.lock:
+            self.delete(value)
+            if self.replayed is not None:
+                self.replayed.append((self.delete, value))
+            self.compact_if_needed()
+
+    def insert(self, value):
+        # Called with the lock held
+        self.removed.discard(value)
+        if self.stored(value):
+            return
+        key = sort_key(value)
+        position = bisect.bisect_left(self.added, key)
+        if position == len(self.added) or self.added[position] != key:
+            self.added.insert(position, key)
+
+    def delete(self, value):
+        # Called with the lock held
+        key = sort_key(value)
+        position = bisect.bisect_left(self.added, key)
+        if position < len(self.added) and self.added[position] == key:
+            del self.added[position]
+        elif self.stored(value):
+            self.removed.add(value)
+
+    def compact_if_needed(self):
+        # Called with the lock held
+        if self.replayed is not None:
+            return
+        if len(self.added) + len(self.removed) > settings.SUGGEST_COMPACT_THRESHOLD:
+            self.replayed = []
+            self.start_compaction()
+
+    def start_compaction(self):
+        threading.Thread(target=self.compact, name='suggest-compact', daemon=True).start()
+
+    def compact(self):
+        """
+        Merges the pending changes into the bulk. The bulk is packed
+        without the lock, searches and changes go on meanwhile; the
+        changes made during the packing are applied again to the new bulk.
+        """
+        with self.lock:
+            blob, offsets = self.blob, self.offsets
+            added, removed = list(self.added), set(self.removed)
+            if self.replayed is None:
+                self.replayed = []
+        try:
+            values = [blob[offsets[i]:offsets[i + 1] - 1] for i in range(len(offsets) - 1)]
+            values += [value for _folded, value in added]
+            packed = self.pack(value for value in values if value not in removed)
+        except Exception as e:
+            with self.lock:
+                self.replayed = None
+            errors.report_exception(e, "Erreur pendant le compactage des suggestions.")
+            return
+        with self.lock:
+            self.blob, self.offsets = packed
+            self.added = []
+            self.removed = set()
+            for change, value in self.replayed:
+                change(value)
+            self.replayed = None
+
+    def search(self, prefix, limit):
+        """
+        Lists the values starting with a prefix, whatever their case.
+        Args:
+            prefix (str): The typed text.
+            limit (int): The maximum number of values.
+        Returns:
+            list: The matching values, in case-folded order.
+        """
+        prefix = prefix.casefold()
+        with self.lock:
+            count = len(self.offsets) - 1
+            start = bisect.bisect_left(
+                range(count), prefix, key=lambda i: self.entry(i).casefold()
+            )
+            bulk = (
+                self.entry(i) for i in range(start, count)
+            )
+            added_start = bisect.bisect_left(self.added, (prefix,))
+            recent = (value for _folded, value in self.added[added_start:])
+            matches = (
+                value for value in heapq.merge(bulk, recent, key=sort_key)
+                if value not in self.removed
+            )
+            result = []
+            for value in matches:
+                if not value.casefold().startswith(prefix):
+                    break
+                result.append(value)
+                if len(result) == limit:
+                    break
+            return result
+
+
+def load_values():
+    """
+    Reads the distinct suggested values from the database.
+    Returns:
+        dict: An iterator of values for each kind.
+    """
+    return {
+        'titles': Letting.objects.values_list('title', flat=True).distinct().iterator(),
+        'cities': Address.objects.values_list('city', flat=True).distinct().iterator(),
+        'usernames': Profile.objects.values_list('user__username', flat=True).iterator(),
+    }
+
+
+def still_used(kind, value):
+    # Indexed lookups: several rows may share a title or a city
+    if kind == 'titles':
+        return Letting.objects.filter(
+            Exact(Collate(F('title'), 'nocase'), value), title=value
+        ).exists()
+    if kind == 'cities':
+        return Address.objects.filter(city_key=fold(value), city=value).exists()
+    return Profile.objects.filter(user__username=value).exists()
+
+
+class Suggester:
+    """
+    Per-process typeahead over letting titles, cities and usernames.
+    The indexes are built at worker startup (see wsgi.py), kept up to
+    date by the model signals of this process, and rebuilt from the
+    database every SUGGEST_REBUILD_INTERVAL seconds to catch the changes
+    made by the other workers.
+    """
+
+    def __init__(self):
+        self.indexes = None
+        self.built_at = 0.0
+        self.build_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.rebuilding = False
+
+    @property
+    def ready(self):
+        return self.indexes is not None
+
+    def build(self):
+        indexes = {kind: PrefixIndex(values) for kind, values in load_values().items()}
+        self.indexes = indexes
+        self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if not self.ready:
+            with self.build_lock:
+                if not self.ready:
+                    self.build()
+
+    def rebuild(self):
+        try:
+            with self.build_lock:
+                self.build()
+        except Exception as e:
+            errors.report_exception(e, "Erreur pendant la construction des suggestions.")
+        finally:
+            self.rebuilding = False
+            # The thread's own database connection
+            connection.close()
+
+    def start_background_build(self):
+        """
+        Builds the indexes in a daemon thread, so the worker serves at once.
+        """
+        with self.state_lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.rebuild, name='suggest-build', daemon=True).start()
+
+    def clear(self):
+        self.indexes = None
+
+    def suggest(self, query, limit=None):
+        """
+        Completes a typed text.
+        Args:
+            query (str): The typed text.
+            limit (int): The maximum number of values of each kind.
+        Returns:
+            dict: The matching values of each kind.
+        """
+        query = query.strip()
+        if not query:
+            return {kind: [] for kind in KINDS}
+        self.ensure_built()
+        if time.monotonic() - self.built_at > settings.SUGGEST_REBUILD_INTERVAL:
+            # Served from the current indexes meanwhile
+            self.start_background_build()
+        limit = limit or settings.SUGGEST_LIMIT
+        return {kind: self.indexes[kind].search(query, limit) for kind in KINDS}
+
+    def add(self, kind, value):
+        if self.ready:
+            self.indexes[kind].add(value)
+
+    def remove(self, kind, value):
+        if self.ready and value and not still_used(kind, value):
+            self.indexes[kind].remove(value)
+
+    def replace(self, kind, old_value, new_value):
+        if old_value != new_value:
+            self.add(kind, new_value)
+            self.remove(kind, old_value)
+
+
+suggester = Suggester()
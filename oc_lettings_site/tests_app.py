@@ -1,14 +1,40 @@
+import os
 import re
 import copy
+import gzip
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from io import StringIO
 import sentry_sdk
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test.signals import template_rendered
 from django.urls import reverse
+from django.utils import timezone
 from django.template.exceptions import TemplateDoesNotExist
 from django.contrib.auth.signals import user_login_failed
 from django.contrib.auth.models import User
 
 
+from lettings.models import Address, Letting
+from profiles.models import Profile
+from oc_lettings_site import (
+    changes, compression, counters, errors, prerender, slow_queries, versions
+)
+from oc_lettings_site.cache_backend import TieredCache
+from oc_lettings_site.models import ChangeLog, Counter, Tombstone
+from oc_lettings_site.pagination import EstimatedCountPaginator
+from oc_lettings_site.params import float_param, int_param
 from oc_lettings_site.sentry_config import add_timestamp
+from oc_lettings_site.suggest import PrefixIndex, suggester
 
 
 class IndexTest(TestCase):
@@ -43,8 +69,8 @@ class IndexTest(TestCase):
         sentry_calls = []
 
         # Define mocks
-        def mock_capture_exception(exc):
-            sentry_calls.append(('exception', exc))
+        def mock_capture_exception(exc, contexts=None):
+            sentry_calls.append(('exception', exc, contexts))
             return None
 
         def mock_capture_message(message):
@@ -62,6 +88,8 @@ class IndexTest(TestCase):
             sentry_sdk.capture_exception = mock_capture_exception
             sentry_sdk.capture_message = mock_capture_message
 
+            errors.reporter.reset()
+
             # Call the view
             response = self.client.get(reverse('index'))
 
@@ -73,13 +101,12 @@ class IndexTest(TestCase):
             self.assertEqual(sentry_calls[0][0], 'exception')
             self.assertTrue(isinstance(sentry_calls[0][1], TemplateDoesNotExist))
 
-            # Check for specific message
-            message_found = False
-            for call in sentry_calls:
-                if call[0] == 'message' and call[1] == "Erreur dans oc_lettings_site.views index.":
-                    message_found = True
-                    break
-            self.assertTrue(message_found)
+            # Check a single report carries the message
+            self.assertEqual(len(sentry_calls), 1)
+            self.assertEqual(
+                sentry_calls[0][2]['report']['message'],
+                "Erreur dans oc_lettings_site.views index.",
+            )
 
         finally:
             # Restore the original functions
@@ -276,3 +303,1173 @@ class SignalsTest(TestCase):
         )
 
         assert self.messages == ["Échec de connexion sans nom d'utilisateur fourni."]
+
+
+class SeedDataCommandTest(TestCase):
+    """
+    Test case for the 'seed_data' management command.
+    """
+
+    def seed(self, **options):
+        """Runs the command quietly with small batches"""
+        options.setdefault('batch_size', 4)
+        call_command('seed_data', stdout=StringIO(), **options)
+
+    def test_seed_data_creates_rows(self):
+        """
+        Test that the requested number of lettings and profiles is created,
+        each with its own address and user.
+        """
+        self.seed(lettings=10, profiles=6)
+
+        self.assertEqual(Letting.objects.count(), 10)
+        self.assertEqual(Address.objects.count(), 10)
+        self.assertEqual(Profile.objects.count(), 6)
+        self.assertEqual(User.objects.count(), 6)
+
+    def test_seed_data_passes_validation(self):
+        """Test that every generated row satisfies the model validators"""
+        self.seed(lettings=10, profiles=6)
+
+        for address in Address.objects.all():
+            address.full_clean()
+        for letting in Letting.objects.all():
+            letting.full_clean()
+        for profile in Profile.objects.all():
+            profile.full_clean()
+
+    def test_seed_data_is_deterministic(self):
+        """Test that the same seed produces the same rows"""
+        def snapshot():
+            lettings = list(Letting.objects.order_by('id').values_list(
+                'title', 'address__number', 'address__street', 'address__city',
+                'address__zip_code'))
+            profiles = list(Profile.objects.order_by('id').values_list(
+                'user__username', 'user__email', 'favorite_city'))
+            return lettings, profiles
+
+        self.seed(lettings=8, profiles=5, seed=3)
+        first = snapshot()
+        Address.objects.all().delete()
+        User.objects.all().delete()
+
+        self.seed(lettings=8, profiles=5, seed=3)
+        self.assertEqual(snapshot(), first)
+
+    def test_seed_data_shares_password_hash(self):
+        """Test that the password is hashed once and still checks out"""
+        self.seed(profiles=3, password='s3cret-pass')
+
+        hashes = set(User.objects.values_list('password', flat=True))
+        self.assertEqual(len(hashes), 1)
+        self.assertTrue(User.objects.first().check_password('s3cret-pass'))
+
+    def test_seed_data_refuses_existing_usernames(self):
+        """Test that running twice with the same seed is refused"""
+        self.seed(profiles=2, seed=5)
+
+        with self.assertRaises(CommandError):
+            self.seed(profiles=2, seed=5)
+
+
+class FastPathTest(TestCase):
+    """
+    Test case for the anonymous fast path on public pages.
+    """
+
+    def test_public_page_skips_session_and_auth(self):
+        """
+        Test that an anonymous GET to a public page loads no session,
+        gets an anonymous user and renders without the auth and messages
+        context processors.
+        """
+        response = self.client.get(reverse('lettings:index'))
+        request = response.wsgi_request
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(request.fast_path)
+        self.assertFalse(hasattr(request, 'session'))
+        self.assertFalse(hasattr(request, '_messages'))
+        self.assertIsInstance(request.user, AnonymousUser)
+        self.assertNotIn('perms', response.context)
+        self.assertNotIn('messages', response.context)
+
+    def test_home_and_profiles_are_public(self):
+        """Test that the home page and profiles pages take the fast path"""
+        for url in (reverse('index'), reverse('profiles:index')):
+            response = self.client.get(url)
+            self.assertTrue(response.wsgi_request.fast_path)
+
+    def test_admin_keeps_full_stack(self):
+        """Test that the admin still gets sessions and context processors"""
+        response = self.client.get(reverse('admin:login'))
+        request = response.wsgi_request
+
+        self.assertFalse(request.fast_path)
+        self.assertTrue(hasattr(request, 'session'))
+        self.assertIn('perms', response.context)
+
+    def test_private_root_views_keep_full_stack(self):
+        """Test that only the listed views of the root URLconf take the fast path"""
+        for name in ('changes', 'sync', 'slow_queries'):
+            response = self.client.get(reverse(name))
+            self.assertFalse(response.wsgi_request.fast_path)
+        self.assertTrue(self.client.get(reverse('suggest')).wsgi_request.fast_path)
+
+    def test_session_cookie_keeps_full_stack(self):
+        """Test that a visitor with a session cookie is not on the fast path"""
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'some-session-key'
+        response = self.client.get(reverse('lettings:index'))
+
+        self.assertFalse(response.wsgi_request.fast_path)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+    def test_post_keeps_full_stack(self):
+        """Test that non GET/HEAD requests are not on the fast path"""
+        response = self.client.post(reverse('lettings:index'))
+        self.assertFalse(response.wsgi_request.fast_path)
+
+    @override_settings(FAST_PATH_ENABLED=False)
+    def test_fast_path_can_be_disabled(self):
+        """Test that the FAST_PATH_ENABLED setting turns the fast path off"""
+        response = self.client.get(reverse('lettings:index'))
+        self.assertFalse(response.wsgi_request.fast_path)
+
+
+class CountersTest(TestCase):
+    """
+    Test case for the maintained row-count and facet-count counters.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting in Brunswick and a profile.
+        """
+        self.address = Address.objects.create(
+            number=1,
+            street="Test Street",
+            city="Brunswick",
+            state="GA",
+            zip_code=31525,
+            country_iso_code="USA"
+        )
+        self.letting = Letting.objects.create(title="Test Letting", address=self.address)
+        user = User.objects.create_user(username="testuser")
+        Profile.objects.create(user=user, favorite_city="Berlin")
+
+    def test_counts_follow_creation(self):
+        """Test that created rows are counted in totals and facets"""
+        self.assertEqual(counters.get_count(Letting), 1)
+        self.assertEqual(counters.get_count(Address), 1)
+        self.assertEqual(counters.get_count(Profile), 1)
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {'brunswick': 1})
+        self.assertEqual(counters.get_facet_counts(Letting, 'state'), {'GA': 1})
+        self.assertEqual(counters.get_facet_counts(Letting, 'country_iso_code'), {'USA': 1})
+
+    def test_facets_count_lettings(self):
+        """Test that facets count the lettings, by the folded city of their address"""
+        Address.objects.create(
+            number=2, street="Empty Street", city="Brunswick", state="GA",
+            zip_code=31525, country_iso_code="USA"
+        )
+        address = Address.objects.create(
+            number=3, street="Bay Street", city=" BRUNSWICK", state="GA",
+            zip_code=31525, country_iso_code="USA"
+        )
+        Letting.objects.create(title="Bay Letting", address=address)
+
+        self.assertEqual(counters.get_count(Address), 3)
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {'brunswick': 2})
+
+    def test_counts_follow_update(self):
+        """Test that an updated address moves its letting between facet counters"""
+        self.address.city = "Savannah"
+        self.address.save()
+
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {'savannah': 1})
+        self.assertEqual(counters.get_facet_counts(Letting, 'state'), {'GA': 1})
+        self.assertEqual(counters.get_count(Address), 1)
+
+        address = Address.objects.create(
+            number=2, street="Other Street", city="Austin", state="TX",
+            zip_code=78701, country_iso_code="USA"
+        )
+        self.letting.address = address
+        self.letting.save()
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {'austin': 1})
+        self.assertEqual(counters.get_facet_counts(Letting, 'state'), {'TX': 1})
+
+    def test_counts_follow_deletion(self):
+        """Test that deleted rows, cascades included, are uncounted"""
+        self.address.delete()
+
+        self.assertEqual(counters.get_count(Letting), 0)
+        self.assertEqual(counters.get_count(Address), 0)
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {})
+
+    def test_reconcile_fixes_drift(self):
+        """Test that the command recounts rows created without signals"""
+        address = Address(number=2, street="Bulk Street", city="Savannah", state="GA",
+                          zip_code=31401, country_iso_code="USA")
+        address.save()
+        Letting.objects.bulk_create([Letting(title="Bulk Letting", address=address)])
+        Counter.objects.create(key='lettings.letting:city_key:nowhere', value=3)
+
+        call_command('reconcile_counters', stdout=StringIO())
+
+        self.assertEqual(counters.get_count(Letting), 2)
+        self.assertEqual(
+            counters.get_facet_counts(Letting, 'city_key'), {'brunswick': 1, 'savannah': 1}
+        )
+        self.assertFalse(
+            Counter.objects.filter(key='lettings.letting:city_key:nowhere').exists()
+        )
+
+    def test_paginator_reads_counter(self):
+        """Test that the admin paginator counts a tracked table in one lookup"""
+        paginator = EstimatedCountPaginator(Address.objects.order_by('id'), 10)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 1)
+
+    def test_inactive_lettings_are_not_counted(self):
+        """Test that deactivating a letting takes it off the counters until reactivated"""
+        self.letting.is_active = False
+        self.letting.save()
+        self.assertEqual(counters.get_count(Letting), 0)
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {})
+        self.assertEqual(counters.exact_counts(Letting), {'lettings.letting': 0})
+        # Counted exactly, the counter leaves the inactive rows out
+        paginator = EstimatedCountPaginator(Letting.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, 1)
+
+        self.letting.is_active = True
+        self.letting.save()
+        self.assertEqual(counters.get_count(Letting), 1)
+        self.assertEqual(counters.get_facet_counts(Letting, 'city_key'), {'brunswick': 1})
+
+    def test_lettings_index_shows_count(self):
+        """Test that the lettings index displays the maintained total"""
+        response = self.client.get(reverse('lettings:index'))
+        self.assertContains(response, "1 letting available")
+
+    def test_index_pages_list_uncounted_rows(self):
+        """Test that counters left behind by a bulk import hide no rows"""
+        Counter.objects.all().delete()
+
+        response = self.client.get(reverse('lettings:index'))
+        self.assertContains(response, "Test Letting")
+        self.assertNotContains(response, "No lettings are available.")
+        response = self.client.get(reverse('profiles:index'))
+        self.assertContains(response, "testuser")
+        self.assertNotContains(response, "No profiles are available.")
+
+
+class PrerenderTest(TestCase):
+    """
+    Test case for the prerendered public pages and their regeneration.
+    """
+
+    def setUp(self):
+        """
+        Points PRERENDER_ROOT to a temporary directory and creates a letting
+        and a profile.
+        """
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.override = override_settings(PRERENDER_ROOT=self.root)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        # Rendered by regenerate() in the test thread, not by a background thread
+        starter = mock.patch.object(prerender.Regenerator, 'start')
+        starter.start()
+        self.addCleanup(starter.stop)
+        # As in a server worker
+        background = mock.patch.object(prerender.regenerator, 'background', True)
+        background.start()
+        self.addCleanup(background.stop)
+        self.addCleanup(prerender.regenerator.take)
+
+        # Nothing scheduled: the test transaction never commits
+        with override_settings(PRERENDER_INCREMENTAL=False):
+            address = Address.objects.create(
+                number=1,
+                street="Test Street",
+                city="Brunswick",
+                state="GA",
+                zip_code=31525,
+                country_iso_code="USA"
+            )
+            self.letting = Letting.objects.create(title="Test Letting", address=address)
+            self.user = User.objects.create_user(username="testuser", first_name="Test")
+            Profile.objects.create(user=self.user, favorite_city="Berlin")
+
+    def page(self, path):
+        with open(prerender.page_file(path), 'rb') as page:
+            return page.read()
+
+    def test_command_renders_every_public_page(self):
+        """Test that the command writes the pages and their gzip variants"""
+        out = StringIO()
+        call_command('prerender', stdout=out)
+
+        self.assertIn("5 pages rendered", out.getvalue())
+        for path in prerender.public_paths():
+            self.assertTrue(os.path.isfile(prerender.page_file(path)))
+            self.assertTrue(os.path.isfile(prerender.page_file(path) + '.gz'))
+        self.assertIn(b"Test Letting", self.page(f'/lettings/{self.letting.pk}/'))
+
+    def test_prerendered_page_is_served(self):
+        """Test that fast path requests get the file, compressed if accepted"""
+        call_command('prerender', stdout=StringIO())
+        Letting.objects.filter(pk=self.letting.pk).update(title="Not Rendered")
+
+        response = self.client.get(reverse('lettings:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context)
+        self.assertEqual(b''.join(response.streaming_content), self.page('/lettings/'))
+
+        response = self.client.get(reverse('lettings:index'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_views_serve_other_requests(self):
+        """Test that missing pages, sessions and query strings reach the views"""
+        call_command('prerender', '/profiles/', stdout=StringIO())
+
+        self.assertIsNotNone(self.client.get(reverse('lettings:index')).context)
+        self.assertIsNotNone(self.client.get('/profiles/?page=2').context)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'some-session-key'
+        self.assertIsNotNone(self.client.get(reverse('profiles:index')).context)
+
+    def test_command_rejects_private_pages(self):
+        """Test that only public pages can be rendered"""
+        with self.assertRaises(CommandError):
+            call_command('prerender', '/admin/', stdout=StringIO())
+
+    def test_changes_regenerate_affected_pages(self):
+        """Test that saves and deletes rewrite or remove the affected pages"""
+        call_command('prerender', stdout=StringIO())
+        letting_path = prerender.letting_path(self.letting.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.letting.title = "Renamed Letting"
+            self.letting.save()
+        # Nothing rendered on the request path
+        self.assertNotIn(b"Renamed Letting", self.page(letting_path))
+        self.assertEqual(prerender.regenerator.regenerate(), 2)
+        self.assertIn(b"Renamed Letting", self.page(letting_path))
+        self.assertIn(b"Renamed Letting", self.page('/lettings/'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "renamed"
+            self.user.save()
+        self.assertFalse(os.path.exists(prerender.page_file('/profiles/testuser/')))
+        prerender.regenerator.regenerate()
+        self.assertIn(b"renamed", self.page('/profiles/renamed/'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.letting.delete()
+        self.assertFalse(os.path.exists(prerender.page_file(letting_path)))
+        prerender.regenerator.regenerate()
+        self.assertNotIn(b"Renamed Letting", self.page('/lettings/'))
+
+    def test_city_changes_remove_profiles(self):
+        """Test that a letting change in a favorite city removes the profiles listing it"""
+        call_command('prerender', stdout=StringIO())
+        profile_file = prerender.page_file('/profiles/testuser/')
+        with self.captureOnCommitCallbacks(execute=True):
+            address = Address.objects.create(
+                number=2, street="Unter den Linden", city=" BERLIN", state="BE",
+                zip_code=10117, country_iso_code="DEU"
+            )
+            letting = Letting.objects.create(title="Berlin Loft", address=address)
+        self.assertFalse(os.path.exists(profile_file))
+        self.assertNotIn('/profiles/testuser/', prerender.regenerator.take())
+
+        # The next visit gets the view, and queues the page
+        response = self.client.get('/profiles/testuser/')
+        self.assertContains(response, "Berlin Loft")
+        prerender.regenerator.regenerate()
+        self.assertIn(b"Berlin Loft", self.page('/profiles/testuser/'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            letting.delete()
+        self.assertFalse(os.path.exists(profile_file))
+
+    def test_json_misses_are_not_prerendered(self):
+        """Test that the public JSON endpoints are never queued for prerendering"""
+        call_command('prerender', stdout=StringIO())
+        self.assertEqual(self.client.get(reverse('lettings:facets')).status_code, 200)
+        self.assertEqual(prerender.regenerator.take(), [])
+
+    def test_writes_render_each_page_once(self):
+        """Test that the pages changed by a burst of writes render once"""
+        call_command('prerender', stdout=StringIO())
+        with mock.patch.object(prerender, 'prerender', wraps=prerender.prerender) as render:
+            for title in ("First", "Second", "Third"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.letting.title = title
+                    self.letting.save()
+            prerender.regenerator.regenerate()
+        self.assertEqual([call.args[0] for call in render.call_args_list].count('/lettings/'), 1)
+        self.assertIn(b"Third", self.page('/lettings/'))
+
+    def test_first_change_starts_the_thread(self):
+        """Test that a committed change wakes the background thread"""
+        call_command('prerender', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.letting.save()
+        prerender.Regenerator.start.assert_called_once_with()
+        self.assertTrue(prerender.regenerator.changed.is_set())
+
+    def test_commands_render_their_pages(self):
+        """Test that a command renders the pages it changed before it exits"""
+        call_command('prerender', stdout=StringIO())
+        Letting.objects.filter(pk=self.letting.pk).update(is_active=False)
+        prerender.regenerator.background = False
+        with mock.patch.object(prerender.regenerator, 'flushed_at_exit', True):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('archive_lettings', stdout=StringIO())
+
+        prerender.Regenerator.start.assert_not_called()
+        self.assertEqual(prerender.regenerator.take(), [])
+        self.assertFalse(os.path.exists(prerender.page_file(f'/lettings/{self.letting.pk}/')))
+        self.assertNotIn(b"Test Letting", self.page('/lettings/'))
+
+    def test_login_regenerates_nothing(self):
+        """Test that a login, which only sets last_login, schedules no page"""
+        call_command('prerender', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+    @override_settings(PRERENDER_INCREMENTAL=False)
+    def test_incremental_mode_can_be_disabled(self):
+        """Test that PRERENDER_INCREMENTAL=False leaves the pages untouched"""
+        call_command('prerender', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.letting.title = "Renamed Letting"
+            self.letting.save()
+        self.assertEqual(prerender.regenerator.take(), [])
+        self.assertNotIn(b"Renamed Letting", self.page('/lettings/'))
+
+    def test_page_file_stays_in_root(self):
+        """Test that a '..' username cannot write outside the pages directory"""
+        self.assertIsNone(prerender.page_file(prerender.profile_path('..')))
+
+
+class CompressionTest(TestCase):
+    """
+    Test case for the dynamic response compression.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting and resets the compression totals.
+        """
+        address = Address.objects.create(
+            number=1,
+            street="Test Street",
+            city="Brunswick",
+            state="GA",
+            zip_code=31525,
+            country_iso_code="USA"
+        )
+        Letting.objects.create(title="Test Letting", address=address)
+        compression.stats.reset()
+
+    def test_accepted_encoding(self):
+        """Test the Accept-Encoding negotiation, qualities included"""
+        self.assertEqual(compression.accepted_encoding('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.accepted_encoding('gzip, br;q=0', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.accepted_encoding('*;q=0.5', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.accepted_encoding('gzip;q=0, identity', ('gzip',)), None)
+        self.assertEqual(compression.accepted_encoding('', ('gzip',)), None)
+
+    def test_public_page_is_compressed_once(self):
+        """Test that a public page is gzipped, then served from the LRU"""
+        plain = self.client.get(reverse('lettings:index'))
+        first = self.client.get(reverse('lettings:index'), HTTP_ACCEPT_ENCODING='gzip')
+        second = self.client.get(reverse('lettings:index'), HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+        self.assertEqual(first['Content-Length'], str(len(first.content)))
+        self.assertNotIn('cached', first['Server-Timing'])
+        self.assertIn('gzip cached', second['Server-Timing'])
+
+        totals = compression.stats.snapshot()
+        self.assertEqual(totals['responses'], 2)
+        self.assertEqual(totals['cache_hits'], 1)
+        self.assertEqual(totals['bytes_saved'], 2 * (len(plain.content) - len(first.content)))
+
+    def test_private_page_is_not_cached(self):
+        """Test that pages outside the fast path are gzipped every time"""
+        self.client.get(reverse('admin:login'), HTTP_ACCEPT_ENCODING='br, gzip')
+        response = self.client.get(reverse('admin:login'), HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('csrfmiddlewaretoken', gzip.decompress(response.content).decode())
+        self.assertEqual(compression.stats.snapshot()['cache_hits'], 0)
+
+    @override_settings(COMPRESSION_MIN_SIZE=10 ** 6)
+    def test_small_response_is_not_compressed(self):
+        """Test that responses under COMPRESSION_MIN_SIZE are sent as is"""
+        response = self.client.get(reverse('lettings:index'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    @override_settings(STREAMING_LIST_THRESHOLD=0, STREAMING_CHUNK_SIZE=1)
+    def test_streamed_page_is_compressed(self):
+        """Test that streamed pages are compressed chunk by chunk"""
+        plain = b''.join(self.client.get(reverse('lettings:index')).streaming_content)
+        response = self.client.get(reverse('lettings:index'), HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(response['Server-Timing'], 'compress;desc="gzip stream"')
+        self.assertEqual(compression.stats.snapshot()['responses'], 0)
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(gzip.decompress(body), plain)
+
+        totals = compression.stats.snapshot()
+        self.assertEqual(totals['responses'], 1)
+        self.assertEqual((totals['bytes_in'], totals['bytes_out']), (len(plain), len(body)))
+        self.assertGreater(totals['cpu_seconds'], 0)
+
+
+class EarlyHintsTest(TestCase):
+    """
+    Test case for the preload headers and 103 Early Hints.
+    """
+
+    def test_public_page_announces_assets(self):
+        """Test that public pages get a Link preload header per asset"""
+        response = self.client.get(reverse('index'))
+        links = response['Link'].split(', ')
+
+        self.assertEqual(len(links), 3)
+        self.assertIn('</static/css/styles.css>; rel=preload; as=style', links)
+        self.assertIn('</static/js/scripts.js>; rel=preload; as=script', links)
+        self.assertIn('</static/assets/img/logo.png>; rel=preload; as=image', links)
+
+    def test_manifest_storage_announces_hashed_urls(self):
+        """Test that the production storage preloads the hashed asset URLs"""
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root, ignore_errors=True)
+        storages = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'oc_lettings_site.storage.ManifestStaticFilesStorage'
+        })
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = self.client.get(reverse('index'))
+
+        link = re.search(r'<(/static/css/styles\.[0-9a-f]{12}\.css)>; rel=preload; as=style',
+                         response['Link'])
+        self.assertIsNotNone(link)
+        # The page loads the same hashed URL
+        self.assertContains(response, link.group(1))
+
+    def test_admin_is_not_announced(self):
+        """Test that the admin, which does not use base.html, gets no Link"""
+        response = self.client.get(reverse('admin:login'))
+        self.assertFalse(response.has_header('Link'))
+
+    def test_early_hints_sent_before_view(self):
+        """Test that a server early hints callable gets the links first"""
+        events = []
+
+        def send_early_hints(headers):
+            events.append(('hints', headers))
+
+        def record_render(sender, template, **kwargs):
+            events.append(('render', template.name))
+
+        template_rendered.connect(record_render)
+        try:
+            response = self.client.get(
+                reverse('lettings:index'), **{'wsgi.early_hints': send_early_hints}
+            )
+        finally:
+            template_rendered.disconnect(record_render)
+
+        self.assertEqual(events[0], ('hints', [('Link', response['Link'])]))
+        self.assertIn(('render', 'lettings/index.html'), events[1:])
+
+
+class ErrorPagesTest(TestCase):
+    """
+    Test case for the prerendered error pages and the error reporting.
+    """
+
+    def setUp(self):
+        """
+        Replaces the Sentry exception capture and resets the reporter.
+        """
+        self.reports = []
+        self.original_capture_exception = sentry_sdk.capture_exception
+        sentry_sdk.capture_exception = (
+            lambda exc, contexts=None: self.reports.append((exc, contexts))
+        )
+        errors.reporter.reset()
+
+    def tearDown(self):
+        sentry_sdk.capture_exception = self.original_capture_exception
+
+    def test_error_pages_render_once(self):
+        """Test that 404 responses reuse the page rendered on first use"""
+        errors.error_page(404)
+        with self.assertTemplateNotUsed('404.html'):
+            response = self.client.get(reverse('lettings:letting', args=[999]))
+        self.assertContains(response, "404 - Page Not Found", status_code=404)
+
+    def test_unknown_url_uses_prerendered_404(self):
+        """Test that URLs matching no view get the site 404 page"""
+        response = self.client.get('/lettings/not-a-number/')
+        self.assertContains(response, "404 - Page Not Found", status_code=404)
+
+    def test_duplicate_errors_are_reported_once(self):
+        """Test that a repeated error is reported once, then with its count"""
+        error = ValueError("Test exception")
+        self.assertTrue(errors.report_exception(error, "Erreur de test."))
+        self.assertFalse(errors.report_exception(error, "Erreur de test."))
+        self.assertFalse(errors.report_exception(error, "Erreur de test."))
+        # Another exception type is another error
+        self.assertTrue(errors.report_exception(KeyError(), "Erreur de test."))
+        with self.settings(ERROR_REPORT_INTERVAL=0):
+            self.assertTrue(errors.report_exception(error, "Erreur de test."))
+
+        self.assertEqual(len(self.reports), 3)
+        self.assertEqual(
+            self.reports[0][1], {'report': {'message': "Erreur de test.", 'suppressed': 0}}
+        )
+        self.assertEqual(self.reports[2][1]['report']['suppressed'], 2)
+
+    @override_settings(ERROR_REPORT_LIMIT=2)
+    def test_error_storm_is_rate_limited(self):
+        """Test that at most ERROR_REPORT_LIMIT errors are reported per minute"""
+        for index in range(5):
+            errors.report_exception(ValueError(), f"Erreur de test {index}.")
+        self.assertEqual(len(self.reports), 2)
+
+
+class SuggestTest(TestCase):
+    """
+    Test case for the typeahead of the search box.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting and a profile, then builds the indexes.
+        """
+        address = Address.objects.create(
+            number=1, street="Ocean Drive", city="Savannah",
+            state="GA", zip_code=31401, country_iso_code="USA"
+        )
+        self.letting = Letting.objects.create(title="Sunny Loft", address=address)
+        user = User.objects.create_user(username="sandy", password="password")
+        Profile.objects.create(user=user, favorite_city="Savannah")
+        suggester.clear()
+        suggester.ensure_built()
+
+    def tearDown(self):
+        # Built from rows this test rolls back
+        suggester.clear()
+
+    def suggest(self, query):
+        return self.client.get(reverse('suggest'), {'q': query}).json()
+
+    def test_prefix_whatever_the_case(self):
+        """Test that titles, cities and usernames are completed by prefix"""
+        self.assertEqual(
+            self.suggest("SA"), {'titles': [], 'cities': ["Savannah"], 'usernames': ["sandy"]}
+        )
+        self.assertEqual(self.suggest("sunny l")['titles'], ["Sunny Loft"])
+        self.assertEqual(self.suggest(" "), {'titles': [], 'cities': [], 'usernames': []})
+
+    def test_signals_update_the_index(self):
+        """Test that saved, renamed and deleted rows reach the index"""
+        self.letting.title = "Sunlit Loft"
+        self.letting.save()
+        Letting.objects.create(title="Sunny Studio", address=Address.objects.create(
+            number=2, street="Bay Street", city="Sarasota",
+            state="FL", zip_code=34230, country_iso_code="USA"
+        ))
+        User.objects.filter(username="sandy").get().delete()
+
+        self.assertEqual(self.suggest("sun")['titles'], ["Sunlit Loft", "Sunny Studio"])
+        self.assertEqual(self.suggest("sa")['cities'], ["Sarasota", "Savannah"])
+        self.assertEqual(self.suggest("sa")['usernames'], [])
+
+    def test_saves_compare_with_loaded_values(self):
+        """Test that the signals read the previous values from the loaded rows"""
+        letting = Letting.objects.get(pk=self.letting.pk)
+        user = User.objects.get(username="sandy")
+        with CaptureQueriesContext(connection) as queries:
+            letting.title = "Sunlit Loft"
+            letting.save()
+            user.username = "sunny"
+            user.save()
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertFalse([sql for sql in selects if '"title" AS' in sql or '"username" AS' in sql])
+        self.assertEqual(self.suggest("sun"), {
+            'titles': ["Sunlit Loft"], 'cities': [], 'usernames': ["sunny"]
+        })
+
+    def test_login_leaves_the_index_alone(self):
+        """Test that a login, which only sets last_login, skips the suggest receiver"""
+        user = User.objects.get(username="sandy")
+        user.last_login = timezone.now()
+        with mock.patch.object(suggester, 'replace') as replace, \
+                CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        replace.assert_not_called()
+        self.assertFalse([query['sql'] for query in queries.captured_queries
+                          if 'profiles_profile' in query['sql']])
+
+    def test_index_compacts_pending_changes(self):
+        """Test that pending changes are merged into the compact index"""
+        index = PrefixIndex(["beta", "Alpha", "alpine"])
+        with override_settings(SUGGEST_COMPACT_THRESHOLD=2), \
+                mock.patch.object(index, 'start_compaction') as start:
+            index.add("Alps")
+            index.remove("beta")
+            self.assertEqual(index.search("al", 10), ["Alpha", "alpine", "Alps"])
+            index.add("alto")
+            index.add("alder")
+        # Once, from the write that crossed the threshold, in the background
+        start.assert_called_once_with()
+        index.compact()
+        self.assertEqual((index.added, index.removed), ([], set()))
+        self.assertEqual(index.search("AL", 2), ["alder", "Alpha"])
+        self.assertEqual(index.search("b", 10), [])
+
+    def test_changes_during_compaction_are_kept(self):
+        """Test that the changes made while the index is packed survive it"""
+        index = PrefixIndex(["beta", "Alpha"])
+        pack = PrefixIndex.pack
+
+        def pack_while_writing(values):
+            packed = pack(values)
+            # Another thread writes meanwhile
+            index.add("gamma")
+            index.remove("Alpha")
+            return packed
+
+        index.add("delta")
+        with mock.patch.object(index, 'pack', side_effect=pack_while_writing):
+            index.compact()
+        self.assertEqual(index.search("", 10), ["beta", "delta", "gamma"])
+
+    @override_settings(SUGGEST_MAX_ENTRIES=2)
+    def test_memory_is_bounded(self):
+        """Test that only SUGGEST_MAX_ENTRIES values are kept, the shortest"""
+        index = PrefixIndex(["a longer value", "ab", "abc"])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search("a", 10), ["ab", "abc"])
+
+
+class ChangeFeedTest(TestCase):
+    """
+    Test case for the change log and its polling and streaming endpoints.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting and a profile, then notes the last sequence number.
+        """
+        self.address = Address.objects.create(
+            number=1, street="Ocean Drive", city="Savannah",
+            state="GA", zip_code=31401, country_iso_code="USA"
+        )
+        self.letting = Letting.objects.create(title="Sunny Loft", address=self.address)
+        self.user = User.objects.create_user(username="watcher", password="password")
+        self.profile = Profile.objects.create(user=self.user, favorite_city="Savannah")
+        self.seq = ChangeLog.objects.order_by('-seq').values_list('seq', flat=True).first()
+
+    def poll(self, **params):
+        return self.client.get(reverse('changes'), params).json()
+
+    def test_writes_are_logged_in_order(self):
+        """Test that saves and deletes of the three models are logged"""
+        self.letting.title = "Renamed"
+        self.letting.save()
+        self.user.username = "renamed"
+        self.user.save()
+        letting_id = self.letting.pk
+        self.letting.delete()
+
+        body = self.poll(since=self.seq)
+        self.assertEqual(
+            [(change['model'], change['object_id'], change['action'])
+             for change in body['changes']],
+            [
+                ('lettings.letting', letting_id, 'updated'),
+                ('profiles.profile', self.profile.pk, 'updated'),
+                ('lettings.letting', letting_id, 'deleted'),
+            ],
+        )
+        self.assertEqual(body['last_seq'], body['changes'][-1]['seq'])
+        self.assertEqual(self.poll(since=body['last_seq'])['changes'], [])
+
+    def test_bulk_created_rows_are_logged(self):
+        """Test that the rows inserted by bulk_create are logged like saved rows"""
+        addresses = Address.objects.bulk_create([
+            Address(number=number, street="Bulk Street", city="Savannah", state="GA",
+                    zip_code=31401, country_iso_code="USA")
+            for number in (2, 3)
+        ])
+
+        self.assertEqual(
+            [(change['model'], change['object_id'], change['action'])
+             for change in self.poll(since=self.seq)['changes']],
+            [('lettings.address', address.pk, 'created') for address in addresses],
+        )
+
+    def test_polling_by_pages(self):
+        """Test that a limited poll says more changes follow"""
+        body = self.poll(since=0, limit=2)
+        self.assertEqual([change['model'] for change in body['changes']],
+                         ['lettings.address', 'lettings.letting'])
+        self.assertTrue(body['more'])
+        self.assertEqual(self.poll(since=0, limit="x").get('error'), "'limit' must be an integer.")
+        self.assertEqual(
+            self.poll(since=0, limit="1e3").get('error'), "'limit' must be an integer."
+        )
+
+    @override_settings(CHANGES_STREAM_TIMEOUT=0)
+    def test_stream_resumes_from_last_event_id(self):
+        """Test that the stream sends the changes after the Last-Event-ID"""
+        self.letting.save()
+        response = self.client.get(
+            reverse('change_stream'), HTTP_LAST_EVENT_ID=str(self.seq)
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        response.close()
+
+        self.assertIn(f'id: {self.seq + 1}\nevent: change\n', body)
+        self.assertEqual(body.count('event: change'), 1)
+        self.assertTrue(changes.reserve_stream())
+        changes.release_stream()
+
+    @override_settings(CHANGES_MAX_STREAMS=0)
+    def test_streams_are_bounded(self):
+        """Test that streams beyond CHANGES_MAX_STREAMS are refused"""
+        response = self.client.get(reverse('change_stream'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_pruned_changes_are_reported(self):
+        """Test that a consumer behind the pruned changes is told to start over"""
+        ChangeLog.objects.update(changed_at=timezone.now() - timezone.timedelta(days=40))
+        call_command('prune_changelog', stdout=StringIO())
+
+        self.assertEqual(list(ChangeLog.objects.values_list('seq', flat=True)), [self.seq])
+        self.assertTrue(self.poll(since=0)['truncated'])
+        self.assertFalse(self.poll(since=self.seq - 1)['truncated'])
+
+
+class SyncTest(TestCase):
+    """
+    Test case for the row versions and the delta sync endpoint.
+    """
+
+    def setUp(self):
+        """
+        Creates a letting and a profile, then syncs everything.
+        """
+        self.address = Address.objects.create(
+            number=1, street="Ocean Drive", city="Savannah",
+            state="GA", zip_code=31401, country_iso_code="USA"
+        )
+        self.letting = Letting.objects.create(title="Sunny Loft", address=self.address)
+        self.user = User.objects.create_user(username="mirror", password="password")
+        self.profile = Profile.objects.create(user=self.user, favorite_city="Savannah")
+        self.version = self.sync(0)['version']
+
+    def sync(self, since, **params):
+        return self.client.get(reverse('sync'), {'since': since, **params}).json()
+
+    def test_versions_grow_across_tables(self):
+        """Test that every save, partial or not, takes a new greater version"""
+        row_versions = [self.address.version, self.letting.version, self.profile.version]
+        self.assertEqual(row_versions, sorted(set(row_versions)))
+
+        self.letting.title = "Renamed"
+        self.letting.save(update_fields=['title'])
+        self.letting.refresh_from_db()
+        self.assertGreater(self.letting.version, self.profile.version)
+
+        with self.assertNumQueries(3):
+            # The versions of a batch are reserved at once, and logged at once
+            addresses = Address.objects.bulk_create([
+                Address(number=i, street="Bay Street", city="Savannah", state="GA",
+                        zip_code=31401, country_iso_code="USA")
+                for i in range(1, 4)
+            ])
+        self.assertEqual(
+            [address.version for address in addresses],
+            list(range(self.letting.version + 1, self.letting.version + 4)),
+        )
+
+    def test_clock_commits_with_the_row(self):
+        """Test that the clock upsert runs in the atomic block writing the row"""
+        depths = []
+        next_versions = versions.next_versions
+
+        def record_depth(count):
+            depths.append(len(connection.atomic_blocks))
+            return next_versions(count)
+
+        outside = len(connection.atomic_blocks)
+        with mock.patch('oc_lettings_site.versions.next_versions', side_effect=record_depth):
+            self.letting.save()
+            self.letting.save(update_fields=['title'])
+            Address.objects.bulk_create([Address(
+                number=2, street="Bay Street", city="Savannah", state="GA",
+                zip_code=31401, country_iso_code="USA"
+            )])
+            versions.touch(Profile, self.profile.pk)
+        self.assertEqual(depths, [outside + 1] * 4)
+
+    def test_sync_returns_only_the_delta(self):
+        """Test that changed, renamed and deleted rows since a version are returned"""
+        self.address.street = "Bay Street"
+        self.address.save()
+        self.user.username = "renamed"
+        self.user.save()
+        letting_id = self.letting.pk
+        self.letting.delete()
+
+        with self.assertNumQueries(5):
+            body = self.sync(self.version)
+        self.assertEqual(
+            [row['street'] for row in body['changed']['lettings.address']], ["Bay Street"]
+        )
+        self.assertEqual(body['changed']['lettings.letting'], [])
+        self.assertEqual(
+            [row['username'] for row in body['changed']['profiles.profile']], ["renamed"]
+        )
+        self.assertEqual(
+            [(row['model'], row['id']) for row in body['deleted']],
+            [('lettings.letting', letting_id)],
+        )
+        self.assertEqual(body['version'], Tombstone.objects.get().version)
+        self.assertEqual(self.sync(body['version'])['deleted'], [])
+
+    def test_batches_are_bounded(self):
+        """Test that a sync is split in batches of at most 'limit' rows"""
+        body = self.sync(0, limit=2)
+        self.assertTrue(body['more'])
+        self.assertEqual(len(body['changed']['lettings.address']), 1)
+        self.assertEqual(len(body['changed']['lettings.letting']), 1)
+        self.assertEqual(body['changed']['lettings.address'][0]['state'], "GA")
+
+        body = self.sync(body['version'], limit=2)
+        self.assertEqual(len(body['changed']['profiles.profile']), 1)
+        self.assertFalse(body['more'])
+        self.assertEqual(self.sync(-1).get('error'), "'since' must be at least 0.")
+
+    def test_pruned_tombstones_are_reported(self):
+        """Test that a client behind the pruned deletions is told to start over"""
+        self.letting.delete()
+        self.address.delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timezone.timedelta(days=40))
+        profile_id = self.profile.pk
+        self.profile.delete()
+        output = StringIO()
+        call_command('prune_changelog', stdout=output)
+
+        self.assertIn("2 tombstones deleted.", output.getvalue())
+        self.assertEqual(
+            list(Tombstone.objects.values_list('model', 'object_id')),
+            [('profiles.profile', profile_id)],
+        )
+        self.assertTrue(self.sync(self.version)['truncated'])
+        self.assertFalse(self.sync(0)['truncated'])
+        latest = self.sync(0)['version']
+        self.assertFalse(self.sync(latest)['truncated'])
+
+
+class ParamsTest(TestCase):
+    """
+    Test case for the query parameter readers.
+    """
+
+    def read(self, reader, value, **kwargs):
+        return reader(RequestFactory().get('/', {'value': value}), 'value', **kwargs)
+
+    def test_integers_parsed_exactly(self):
+        """Test that integers are not read through a float"""
+        self.assertEqual(self.read(int_param, str(2 ** 60 + 1)), 2 ** 60 + 1)
+        self.assertEqual(self.read(int_param, "", default=5), 5)
+        for value in ("1e3", "2.0", "x"):
+            with self.assertRaisesMessage(ValueError, "'value' must be an integer."):
+                self.read(int_param, value)
+
+    def test_messages_name_the_set_bounds(self):
+        """Test that the out of range messages only name the bounds that are set"""
+        for kwargs, message in (
+            ({'low': 0}, "'value' must be at least 0."),
+            ({'high': -5}, "'value' must be at most -5."),
+            ({'low': 0, 'high': 10}, "'value' must be between 0 and 10."),
+        ):
+            with self.subTest(**kwargs):
+                with self.assertRaisesMessage(ValueError, message):
+                    self.read(int_param, -1, **kwargs)
+                with self.assertRaisesMessage(ValueError, message):
+                    self.read(float_param, -1, **kwargs)
+
+
+class SlowQueryTest(TestCase):
+    """
+    Test case for the slow query log and its staff page.
+    """
+
+    def setUp(self):
+        slow_queries.log.clear()
+
+    def tearDown(self):
+        slow_queries.log.clear()
+
+    def test_fingerprint_groups_values(self):
+        """Test that literals, placeholders and IN lists are normalized"""
+        self.assertEqual(
+            slow_queries.fingerprint(
+                "SELECT 'it''s', 12  FROM t\nWHERE id IN (%s, %s) AND x = 1.5"
+            ),
+            "SELECT ?, ? FROM t WHERE id IN (...) AND x = ?",
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_records_plan_view_and_call_site(self):
+        """Test that a slow query is logged once per fingerprint with its origin"""
+        address = Address.objects.create(
+            number=1, street="Ocean Drive", city="Savannah",
+            state="GA", zip_code=31401, country_iso_code="USA"
+        )
+        letting = Letting.objects.create(title="Sunny Loft", address=address)
+        for letting_id in (letting.pk, letting.pk + 1):
+            self.client.get(reverse('lettings:letting', args=[letting_id]))
+
+        entries = [
+            entry for entry in slow_queries.log.snapshot()
+            if 'lettings:letting' in entry['views']
+        ]
+        self.assertTrue(entries)
+        summary = next(entry for entry in entries if 'lettings_lettingsummary' in entry['sql'])
+        self.assertEqual(summary['count'], 2)
+        self.assertIn('lettings/views.py', summary['call_site'])
+        self.assertTrue(any('lettings_lettingsummary' in line for line in summary['plan']))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=1000000)
+    def test_fast_queries_are_not_logged(self):
+        """Test that queries below the threshold leave the log empty"""
+        self.client.get(reverse('lettings:index'))
+        self.assertEqual(slow_queries.log.snapshot(), [])
+
+    def test_page_is_staff_only(self):
+        """Test that the log page needs a staff user, who may empty it"""
+        url = reverse('slow_queries')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        slow_queries.log.record("SELECT 1", 150.0, ["SCAN t"], None, None)
+        User.objects.create_user(username="admin", password="password", is_staff=True)
+        self.client.login(username="admin", password="password")
+        response = self.client.get(url)
+        self.assertContains(response, "SCAN t")
+
+        self.client.post(url)
+        self.assertEqual(slow_queries.log.snapshot(), [])
+
+
+class TieredCacheTest(TestCase):
+    """
+    Test case for the two-tier cache backend, two instances on the same
+    file standing for two workers.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workers = [self.make_cache() for _ in range(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, **options):
+        options = {'L1_MAX_ENTRIES': 2, 'L1_TIMEOUT': 0, 'LOCK_TIMEOUT': 2, **options}
+        return TieredCache(os.path.join(self.directory, 'cache.sqlite3'), {'OPTIONS': options})
+
+    def test_workers_share_entries(self):
+        """Test that values written by a worker are read and deleted by the other"""
+        first, second = self.workers
+        first.set_many({'a': 1, 'b': [2], 'c': {'d': 3}})
+        self.assertEqual(len(first.l1), 2)
+        self.assertEqual(second.get_many(['a', 'b', 'c', 'x']), {'a': 1, 'b': [2], 'c': {'d': 3}})
+        self.assertFalse(second.add('a', 10))
+        self.assertEqual(second.incr('a', 4), 5)
+        self.assertEqual(first.get('a'), 5)
+
+        second.delete('b')
+        self.assertIsNone(first.get('b'))
+        first.set('e', 1, timeout=0)
+        self.assertFalse(second.has_key('e'))  # noqa: W601
+        self.assertTrue(second.add('e', 2))
+        first.clear()
+        self.assertIsNone(second.get('c'))
+
+    def test_get_or_set_computes_once(self):
+        """Test that concurrent misses of a key run a single computation"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': len(calls)}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda cache=cache: results.append(
+                cache.get_or_set('key', compute, 60)
+            ))
+            for cache in self.workers * 4
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * 8)
+
+    def test_waits_for_another_worker(self):
+        """Test that a worker misses a key leased by another one and reads its value"""
+        first, second = self.workers
+        token = first.acquire_lease(first.make_key('key'))
+
+        def finish():
+            time.sleep(0.2)
+            first.set('key', "from first")
+            first.release_lease(first.make_key('key'), token)
+
+        threading.Thread(target=finish).start()
+        compute = mock.Mock(return_value="from second")
+        self.assertEqual(second.get_or_set('key', compute), "from first")
+        compute.assert_not_called()
+
+    def test_early_recomputation(self):
+        """Test that a slow value is recomputed ahead of its expiry, a fast one is not"""
+        cache = self.workers[0]
+        cache.write({
+            cache.make_key('slow'): cache.make_entry("old", 10, delta=20.0),
+            cache.make_key('fast'): cache.make_entry("old", 10, delta=0.001),
+        })
+        with mock.patch('oc_lettings_site.cache_backend.random.random', return_value=0.5):
+            self.assertEqual(cache.get_or_set('slow', "new"), "new")
+            self.assertEqual(cache.get_or_set('fast', "new"), "old")
+
+        cache.set('slow', "old", 10)
+        self.assertEqual(cache.get_or_set('slow', "new"), "old")
@@ -5,14 +5,29 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('suggest/', views.suggest, name='suggest'),
+    path('changes/', views.change_feed, name='changes'),
+    path('changes/stream/', views.change_stream, name='change_stream'),
     path('lettings/', include('lettings.urls', namespace='lettings')),
     path('profiles/', include('profiles.urls', namespace='profiles')),
+    path('api/profiles/', include('profiles.api_urls', namespace='profiles_api')),
+    path('api/sync/', views.sync, name='sync'),
+    path('admin/slow-queries/', views.slow_query_log, name='slow_queries'),
     path('admin/', admin.site.urls),
 ]
+
+handler404 = 'oc_lettings_site.views.page_not_found'
+handler500 = 'oc_lettings_site.views.server_error'
 """
 URL configuration for the main app.
 - '' → Calls the index view and
+- 'suggest/' → Calls the suggest view, typeahead of the search box.
+- 'changes/' → Calls the change_feed view, the changes since a sequence number.
+- 'changes/stream/' → Calls the change_stream view, the changes as Server-Sent Events.
 - 'lettings/' → Calls the lettings view and lists all lettings.
 - 'profiles/' → Calls the profiles view and lists all profiles.
+- 'api/profiles/' → Calls the profiles JSON API.
+- 'api/sync/' → Calls the sync view, the rows changed since a version.
+- 'admin/slow-queries/' → Calls the slow_query_log view, staff only.
 - 'admin/' → Calls the admin view.
 """
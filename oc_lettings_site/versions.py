@@ -0,0 +1,232 @@
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from lettings import registry
+from .models import Counter, Tombstone
+
+
+# Counter holding the last row version handed out, shared by every table
+CLOCK_KEY = 'sync:version'
+# Counter holding the last version of the pruned tombstones
+PRUNED_KEY = 'sync:pruned'
+
+# Sent with 'objs', the rows inserted by VersionedQuerySet.bulk_create(),
+# in the transaction of the insert: bulk_create sends no post_save
+rows_bulk_created = Signal()
+
+# Synchronized models and their columns, the foreign codes from the registries
+SYNCED_COLUMNS = {
+    'lettings.letting': ('id', 'version', 'title', 'address_id'),
+    'lettings.address': (
+        'id', 'version', 'number', 'street', 'city', 'state_id', 'zip_code', 'country_id',
+        'latitude', 'longitude',
+    ),
+    'profiles.profile': ('id', 'version', 'user_id', 'user__username', 'favorite_city'),
+}
+
+
+def next_versions(count):
+    """
+    Hands out the next row versions, in the transaction of the write. The
+    upsert takes SQLite's write lock until the transaction commits, so the
+    versions are handed out in commit order; callers must run it in the
+    atomic block writing the rows, or it commits on its own.
+    Args:
+        count (int): The number of versions.
+    Returns:
+        range: Versions greater than any version handed out before.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {Counter._meta.db_table} (key, value) VALUES (%s, %s) '
+            'ON CONFLICT (key) DO UPDATE SET value = value + excluded.value RETURNING value',
+            [CLOCK_KEY, count],
+        )
+        last = cursor.fetchone()[0]
+    return range(last - count + 1, last + 1)
+
+
+def next_version():
+    return next_versions(1)[0]
+
+
+def backfill_sql(table):
+    """
+    Builds the statements giving the existing rows of a table distinct
+    versions above the clock, then moving the clock past them.
+    Args:
+        table (str): The table name.
+    Returns:
+        list: The SQL statements, copied into a migration when it is written.
+    """
+    counter = Counter._meta.db_table
+    clock = f"(SELECT value FROM {counter} WHERE key = '{CLOCK_KEY}')"
+    return [
+        f'UPDATE {table} SET version = id + COALESCE({clock}, 0)',
+        f"INSERT INTO {counter} (key, value) "
+        f"VALUES ('{CLOCK_KEY}', COALESCE((SELECT MAX(version) FROM {table}), 0)) "
+        'ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)',
+    ]
+
+
+def touch(model, pk):
+    """
+    Gives a new version to a row changed by a write to another table.
+    Returns:
+        int: The new version.
+    """
+    with transaction.atomic(savepoint=False):
+        version = next_version()
+        model.objects.filter(pk=pk).update(version=version)
+    return version
+
+
+class VersionField(models.BigIntegerField):
+    """
+    Row version, set from the shared clock on every save and bulk_create,
+    indexed so the rows changed since a version are a range scan.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', 0)
+        kwargs.setdefault('db_index', True)
+        kwargs['editable'] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['editable']
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # Reserved by VersionedQuerySet.bulk_create(), one clock update per batch
+        value = model_instance.__dict__.pop('_reserved_version', None) or next_version()
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class VersionedQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            for obj, version in zip(objs, next_versions(len(objs)) if objs else ()):
+                obj._reserved_version = version
+            created = super().bulk_create(objs, *args, **kwargs)
+            rows_bulk_created.send(sender=self.model, objs=created)
+            return created
+
+
+class VersionedModel(models.Model):
+    """
+    Model whose rows carry a version, new on every save, even one
+    restricted by update_fields. The version and the row are committed
+    together. QuerySet.update() leaves it unchanged.
+    """
+    version = VersionField()
+
+    objects = VersionedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        # Else the clock commits first, and a row of a lower version could
+        # commit after a client synced past it
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+
+def prune_tombstones(days):
+    """
+    Deletes the tombstones older than some days, and remembers the last
+    version deleted, so the clients syncing from before it start over.
+    Returns:
+        int: The number of tombstones deleted.
+    """
+    before = timezone.now() - timezone.timedelta(days=days)
+    old = Tombstone.objects.filter(deleted_at__lt=before)
+    with transaction.atomic():
+        last = old.aggregate(last=models.Max('version'))['last']
+        if last is None:
+            return 0
+        deleted, _ = old.filter(version__lte=last).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {Counter._meta.db_table} (key, value) VALUES (%s, %s) '
+                'ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)',
+                [PRUNED_KEY, last],
+            )
+    return deleted
+
+
+def is_truncated(version):
+    """
+    Tells whether deletions following a version were pruned.
+    Returns:
+        bool: True if the client has to start over from a full copy.
+    """
+    if version == 0:
+        return False
+    pruned = Counter.objects.filter(key=PRUNED_KEY).values_list('value', flat=True).first()
+    return pruned is not None and version < pruned
+
+
+def serialize(label, row):
+    if label == 'lettings.address':
+        row['state'] = registry.states.get_by_id(row.pop('state_id')).code
+        row['country_iso_code'] = registry.countries.get_by_id(row.pop('country_id')).code
+    elif label == 'profiles.profile':
+        row['username'] = row.pop('user__username')
+    return row
+
+
+def changes_since(version, limit):
+    """
+    Reads a batch of the rows changed and deleted after a version. Each
+    source is read by a range scan of its version index, at most 'limit'
+    rows, then the oldest 'limit' changes of all sources are kept.
+    Args:
+        version (int): The version of the last sync, 0 for a full copy.
+        limit (int): The maximum number of changed and deleted rows.
+    Returns:
+        dict: The changed rows by model, the deleted rows, the version to
+        sync from next time, whether more changes follow, and whether
+        deletions following 'version' were pruned.
+    """
+    sources = [
+        (label, apps.get_model(label).objects.values(*columns))
+        for label, columns in SYNCED_COLUMNS.items()
+    ]
+    sources.append((None, Tombstone.objects.values('version', 'model', 'object_id')))
+    batches = []
+    # A full source may hold more changes, even if the others are empty
+    more = False
+    for label, rows in sources:
+        rows = list(rows.filter(version__gt=version).order_by('version')[:limit])
+        more = more or len(rows) == limit
+        batches.extend((row['version'], label, row) for row in rows)
+    batches.sort(key=lambda batch: batch[0])
+
+    more = more or len(batches) > limit
+    batches = batches[:limit]
+    changed = {label: [] for label in SYNCED_COLUMNS}
+    deleted = []
+    for _version, label, row in batches:
+        if label is None:
+            deleted.append({'model': row['model'], 'id': row['object_id'],
+                            'version': row['version']})
+        else:
+            changed[label].append(serialize(label, row))
+    return {
+        'changed': changed,
+        'deleted': deleted,
+        'version': batches[-1][0] if batches else version,
+        'more': more,
+        'truncated': is_truncated(version),
+    }
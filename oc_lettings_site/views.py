@@ -1,5 +1,12 @@
-import sentry_sdk
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from . import changes, errors, slow_queries, versions
+from .params import int_param
+from .suggest import suggester
+from .middleware import template_engine
 
 
 def index(request):
@@ -11,9 +18,166 @@ def index(request):
         HttpResponse: The rendered 'index.html' template.
     """
     try:
-        return render(request, 'oc_lettings_site/index.html')
+        return render(request, 'oc_lettings_site/index.html', using=template_engine(request))
     except Exception as e:
         # Capturing sentry exception
-        sentry_sdk.capture_exception(e)
-        sentry_sdk.capture_message("Erreur dans oc_lettings_site.views index.")
-        return render(request, '500.html', status=500)
+        errors.report_exception(e, "Erreur dans oc_lettings_site.views index.")
+        return errors.error_response(500)
+
+
+def suggest(request):
+    """
+    Completes the text typed in the search box, as JSON.
+    Args:
+        request: The HTTP request object, the typed text in 'q'.
+    Returns:
+        JsonResponse: The matching letting titles, cities and usernames.
+    """
+    try:
+        # Longer than any suggested value, nothing to complete
+        query = request.GET.get('q', '')[:256]
+        return JsonResponse(suggester.suggest(query))
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans oc_lettings_site.views suggest.")
+        return errors.error_response(500)
+
+
+def change_feed(request):
+    """
+    Returns the changes following a sequence number, as JSON.
+    Query parameters: 'since', the last sequence number seen, and 'limit'.
+    Args:
+        request: The HTTP request object.
+    Returns:
+        JsonResponse: The changes, the sequence number to resume from, and
+        whether older changes were pruned, or a 400 response listing the
+        invalid parameter.
+    """
+    try:
+        since = int_param(request, 'since', 0, 0)
+        limit = int_param(
+            request, 'limit', settings.CHANGES_DEFAULT_LIMIT, 1, settings.CHANGES_MAX_LIMIT
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        rows = changes.changes_since(since, limit)
+        return JsonResponse({
+            'changes': rows,
+            'last_seq': rows[-1]['seq'] if rows else since,
+            'more': len(rows) == limit,
+            'truncated': changes.is_truncated(since),
+        })
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans oc_lettings_site.views change_feed.")
+        return errors.error_response(500)
+
+
+def change_stream(request):
+    """
+    Streams the changes following a sequence number as Server-Sent Events.
+    The sequence number comes from the Last-Event-ID header of a
+    reconnecting client, else from the 'since' query parameter.
+    Args:
+        request: The HTTP request object.
+    Returns:
+        StreamingHttpResponse: The 'text/event-stream' of the changes, a 400
+        response for an invalid sequence number, or a 503 response when
+        this worker serves CHANGES_MAX_STREAMS streams already.
+    """
+    try:
+        since = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        try:
+            since = int_param(request, 'since', 0, 0)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    if not changes.reserve_stream():
+        response = JsonResponse({'error': "Too many streams, poll the changes."}, status=503)
+        response.headers['Retry-After'] = str(int(settings.CHANGES_RETRY_INTERVAL))
+        return response
+    response = StreamingHttpResponse(
+        changes.ChangeStream(since), content_type='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Events must not wait in a proxy buffer
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def sync(request):
+    """
+    Returns the lettings, addresses and profiles changed or deleted after
+    a version, as JSON, a bounded batch at a time.
+    Query parameters: 'since', the version of the last sync (0 for a full
+    copy), and 'limit'.
+    Args:
+        request: The HTTP request object.
+    Returns:
+        JsonResponse: The changed rows by model, the deleted rows, the
+        version to sync from next, whether more changes follow and whether
+        deletions were pruned, or a 400 response listing the invalid
+        parameter.
+    """
+    try:
+        since = int_param(request, 'since', 0, 0)
+        limit = int_param(
+            request, 'limit', settings.SYNC_DEFAULT_LIMIT, 1, settings.SYNC_MAX_LIMIT
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return JsonResponse(versions.changes_since(since, limit))
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans oc_lettings_site.views sync.")
+        return errors.error_response(500)
+
+
+@staff_member_required
+def slow_query_log(request):
+    """
+    Lists the slow queries of the worker serving the request, the largest
+    total time first, with their plan, views and call site. A POST empties
+    the log.
+    Args:
+        request: The HTTP request object.
+    Returns:
+        HttpResponse: The 'oc_lettings_site/slow_queries.html' page, or a
+        redirect to it once emptied.
+    """
+    if request.method == 'POST':
+        slow_queries.log.clear()
+        return redirect('slow_queries')
+    context = dict(
+        admin.site.each_context(request),
+        title="Slow queries",
+        entries=slow_queries.log.snapshot(),
+        threshold=settings.SLOW_QUERY_THRESHOLD_MS,
+    )
+    return render(request, 'oc_lettings_site/slow_queries.html', context)
+
+
+def page_not_found(request, exception):
+    """
+    Serves the prerendered 404 page for URLs matching no view.
+    Args:
+        request (HttpRequest): The HTTP request object.
+        exception (Exception): The Http404 or Resolver404 raised.
+    Returns:
+        HttpResponse: The '404.html' page.
+    """
+    return errors.error_response(404)
+
+
+def server_error(request):
+    """
+    Serves the prerendered 500 page for unhandled exceptions.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        HttpResponse: The '500.html' page.
+    """
+    return errors.error_response(500)
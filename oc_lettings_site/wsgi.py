@@ -5,3 +5,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oc_lettings_site.settings')
 
 application: WSGIHandler = get_wsgi_application()
+
+# Each worker builds its typeahead indexes while it starts serving
+from oc_lettings_site.suggest import suggester  # noqa: E402
+from oc_lettings_site import prerender  # noqa: E402
+
+suggester.start_background_build()
+# Changed pages are rendered by a thread of the worker
+prerender.regenerator.background = True
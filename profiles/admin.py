@@ -1,4 +1,17 @@
 from django.contrib import admin
+from oc_lettings_site.pagination import EstimatedCountPaginator
 from .models import Profile
 
-admin.site.register(Profile)  # Registers Profile model to manage profiles in the admin interface
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    """
+    Admin for profiles, the user is joined on the changelist and picked
+    by id. The search matches a username exactly to hit its unique index.
+    """
+    list_display = ('user', 'favorite_city')
+    list_select_related = ('user',)
+    search_fields = ('user__username__exact',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from oc_lettings_site import errors
+from oc_lettings_site.params import int_param, list_param
+from .models import Profile
+
+
+# Field names of the API and their column, 'username' is always returned.
+# The API is public and anonymous: the email addresses are not exposed
+FIELDS = {
+    'username': 'user__username',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    'favorite_city': 'favorite_city',
+}
+
+
+def requested_fields(request):
+    """
+    Reads the 'fields' parameter, all the fields when it is missing.
+    Returns:
+        list: The field names, 'username' first.
+    Raises:
+        ValueError: If a field is unknown.
+    """
+    fields = list_param(request, 'fields', list(FIELDS), default=FIELDS)
+    return ['username'] + [field for field in fields if field != 'username']
+
+
+def select(fields):
+    """
+    Builds the query of the profiles, projected on the columns of some fields.
+    Args:
+        fields (list): The field names, 'username' first.
+    Returns:
+        QuerySet: Tuples of the column values, in the order of the fields.
+    """
+    return Profile.objects.values_list(*(FIELDS[field] for field in fields))
+
+
+def profiles(request):
+    """
+    Lists the profiles as JSON, by username, a page at a time.
+    Query parameters: 'fields' (comma separated), 'limit', and 'after',
+    the last username of the previous page.
+    Args:
+        request (HttpRequest): The HTTP request object.
+    Returns:
+        JsonResponse: The page of profiles and the URL of the next one,
+        or a 400 response listing the invalid parameter.
+    """
+    try:
+        fields = requested_fields(request)
+        limit = int_param(
+            request, 'limit', settings.PROFILES_API_DEFAULT_LIMIT, 1,
+            settings.PROFILES_API_MAX_LIMIT
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        rows = select(fields).order_by('user__username')
+        after = request.GET.get('after')
+        if after:
+            # Keyset paging: a range scan of the username index, whatever the page
+            rows = rows.filter(user__username__gt=after)
+        rows = list(rows[:limit + 1])
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            query = {'after': rows[-1][0], 'limit': limit}
+            if request.GET.get('fields'):
+                query['fields'] = ','.join(fields)
+            next_url = f"{reverse('profiles_api:profiles')}?{urlencode(query)}"
+        return JsonResponse({
+            'results': [dict(zip(fields, row)) for row in rows],
+            'next': next_url,
+        })
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans profiles.api profiles.")
+        return errors.error_response(500)
+
+
+def profile(request, username):
+    """
+    Returns a profile as JSON.
+    Query parameter: 'fields' (comma separated).
+    Args:
+        request (HttpRequest): The HTTP request object.
+        username (str): The username of the profile.
+    Returns:
+        JsonResponse: The requested fields of the profile, or a 400 or 404
+        response with the error.
+    """
+    try:
+        fields = requested_fields(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        row = select(fields).filter(user__username=username).first()
+        if row is None:
+            return JsonResponse({'error': f"No profile for '{username}'."}, status=404)
+        return JsonResponse(dict(zip(fields, row)))
+    except Exception as e:
+        errors.report_exception(e, "Erreur dans profiles.api profile.")
+        return errors.error_response(500)
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import api
+
+
+app_name = 'profiles_api'
+urlpatterns = [
+    path('', api.profiles, name='profiles'),
+    path('<str:username>/', api.profile, name='profile'),
+]
+"""
+URL configuration of the profiles JSON API.
+- '' → Calls the profiles view, a page of profiles by username.
+- '<str:username>/' → Calls the profile view for a specific profile by username.
+"""
@@ -6,3 +6,6 @@ class ProfilesConfig(AppConfig):
     Configuration class for the Profiles application.
     """
     name = 'profiles'
+
+    def ready(self):
+        import profiles.signals  # noqa: F401
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Profile
+
+
+# Cached for a username without profile, so repeated 404s cost no query
+MISSING = object()
+
+FIELDS = ('user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__email',
+          'favorite_city')
+
+
+def load_context(username):
+    """
+    Reads the profile of a username, only the columns the page shows.
+    Args:
+        username (str): The username.
+    Returns:
+        dict: The profile, shaped like the model for the template
+        ('profile.user.username'), or None if there is no such profile.
+    """
+    row = Profile.objects.filter(user__username=username).values(*FIELDS).first()
+    if row is None:
+        return None
+    return {
+        'user': {
+            'id': row['user_id'],
+            'username': row['user__username'],
+            'first_name': row['user__first_name'],
+            'last_name': row['user__last_name'],
+            'email': row['user__email'],
+        },
+        'favorite_city': row['favorite_city'],
+    }
+
+
+class ProfileCache:
+    """
+    LRU of the profile page contexts keyed by username, holding the
+    usernames without profile too. Entries expire after
+    PROFILE_CACHE_TIMEOUT seconds, which bounds how long the changes made
+    by other workers go unseen; the changes made by this worker evict the
+    entries at once through the model signals. A context read while an
+    eviction happens is not kept, and it is only kept once the transaction
+    reading it commits, so a rollback never leaves a stale entry.
+    """
+    FIELDS = ('hits', 'negative_hits', 'misses', 'evictions', 'invalidations')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # User id of the cached usernames, a renamed user is evicted by id
+        self.usernames = {}
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+
+    def get(self, username):
+        """
+        Returns the page context of a username, read from the database on a miss.
+        Args:
+            username (str): The username.
+        Returns:
+            dict: The profile context, None if there is no such profile.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(username)
+                value = entry[1]
+                self.totals['negative_hits' if value is MISSING else 'hits'] += 1
+                return None if value is MISSING else value
+            self.totals['misses'] += 1
+            generation = self.generation
+        context = load_context(username)
+        value = MISSING if context is None else context
+        transaction.on_commit(lambda: self.put(username, value, generation))
+        return context
+
+    def put(self, username, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                # Evicted while it was read, the value may be stale
+                return
+            self.discard(username)
+            self.entries[username] = (time.monotonic() + settings.PROFILE_CACHE_TIMEOUT, value)
+            if value is not MISSING:
+                self.usernames[value['user']['id']] = username
+            while len(self.entries) > settings.PROFILE_CACHE_SIZE:
+                self.discard(next(iter(self.entries)))
+                self.totals['evictions'] += 1
+
+    def discard(self, username):
+        _expires, value = self.entries.pop(username, (None, MISSING))
+        if value is not MISSING:
+            self.usernames.pop(value['user']['id'], None)
+
+    def invalidate(self, *usernames, user_id=None):
+        """
+        Evicts the entries of usernames, and the one of a user id.
+        """
+        with self.lock:
+            self.generation += 1
+            self.totals['invalidations'] += 1
+            if user_id in self.usernames:
+                self.discard(self.usernames[user_id])
+            for username in usernames:
+                self.discard(username)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.usernames.clear()
+
+    def snapshot(self):
+        """
+        Returns the hit and miss statistics of this process.
+        Returns:
+            dict: The totals, with the number of entries and the hit rate.
+        """
+        with self.lock:
+            totals = dict(self.totals)
+            totals['entries'] = len(self.entries)
+        found = totals['hits'] + totals['negative_hits']
+        lookups = found + totals['misses']
+        totals['hit_rate'] = found / lookups if lookups else 0.0
+        return totals
+
+
+profile_cache = ProfileCache()
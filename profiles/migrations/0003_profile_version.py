@@ -0,0 +1,32 @@
+from django.db import migrations
+import oc_lettings_site.versions
+
+
+# Frozen copy of versions.backfill_sql('profiles_profile') at this migration
+BACKFILL_PROFILES_PROFILE_SQL = [
+    'UPDATE profiles_profile SET version = id + COALESCE((SELECT value FROM '
+    "oc_lettings_site_counter WHERE key = 'sync:version'), 0)",
+    "INSERT INTO oc_lettings_site_counter (key, value) VALUES ('sync:version', "
+    'COALESCE((SELECT MAX(version) FROM profiles_profile), 0)) ON CONFLICT (key) DO '
+    'UPDATE SET value = MAX(value, excluded.value)',
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the row versions of the profiles, numbered from the shared clock.
+    """
+
+    dependencies = [
+        ('profiles', '0002_migrate_data'),
+        ('lettings', '0009_letting_address_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='version',
+            field=oc_lettings_site.versions.VersionField(db_index=True, default=0),
+        ),
+        migrations.RunSQL(BACKFILL_PROFILES_PROFILE_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+import lettings.fields
+
+
+def fill_favorite_city_keys(apps, schema_editor):
+    """
+    Computes the case-folded favorite city of every profile in one
+    statement, with the key function of the field registered as an SQLite
+    function.
+    Args:
+        apps: The Django app registry.
+        schema_editor: Database schema editor to apply changes.
+    """
+    schema_editor.connection.connection.create_function(
+        'fold_city', 1, lettings.fields.fold, deterministic=True
+    )
+    schema_editor.execute(
+        'UPDATE profiles_profile SET favorite_city_key = fold_city(favorite_city)'
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the indexed case-folded favorite city of the profiles, to find
+    the prerendered pages listing the lettings of a city.
+    """
+
+    dependencies = [
+        ('profiles', '0003_profile_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='favorite_city_key',
+            field=lettings.fields.FoldedKeyField(
+                db_index=True, default='', max_length=64, source='favorite_city'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_favorite_city_keys, migrations.RunPython.noop),
+    ]
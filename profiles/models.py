@@ -1,14 +1,18 @@
 import sentry_sdk
 from django.db import models
 from django.contrib.auth.models import User
+from lettings.fields import FoldedKeyField
+from oc_lettings_site.versions import VersionedModel
 
 
-class Profile(models.Model):
+class Profile(VersionedModel):
     """
     Represents a user profile with additional information linked to a Django User.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     favorite_city = models.CharField(max_length=64, blank=True)
+    # Matches 'Address.city_key', to find the profiles showing a city's lettings
+    favorite_city_key = FoldedKeyField(max_length=64, source='favorite_city', db_index=True)
 
     def __str__(self):
         """
@@ -16,6 +20,12 @@ class Profile(models.Model):
         """
         return self.user.username
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'favorite_city' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'favorite_city_key'}
+        super().save(*args, **kwargs)
+
     def clean(self):
         try:
             super().clean()
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import profile_cache
+from .models import Profile
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_profile(sender, instance, **kwargs):
+    # By id too, for the entry of the username before a rename
+    profile_cache.invalidate(instance.username, user_id=instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_saved_profile(sender, instance, created, **kwargs):
+    if created:
+        # The username was cached as having no profile
+        profile_cache.invalidate(instance.user.username)
+    else:
+        profile_cache.invalidate(user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=Profile)
+def invalidate_deleted_profile(sender, instance, **kwargs):
+    profile_cache.invalidate(user_id=instance.user_id)
@@ -1,8 +1,15 @@
 import sentry_sdk
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.template.exceptions import TemplateDoesNotExist
+from lettings.models import Address, CityTopLettings, Letting
+from oc_lettings_site import errors
+from .cache import profile_cache
 from .models import Profile
 
 
@@ -66,8 +73,7 @@ class ProfileTest(TestCase):
         Tests the profile detail view with a non-existing user, ensuring a 404 is returned.
         """
         response = self.client.get(reverse('profiles:profile', args=["nonexistentuser"]))
-        self.assertEqual(response.status_code, 404)
-        self.assertTemplateUsed(response, '404.html')
+        self.assertContains(response, "404 - Page Not Found", status_code=404)
 
     def test_profile_index_view_exception(self):
         """
@@ -83,8 +89,8 @@ class ProfileTest(TestCase):
         sentry_calls = []
 
         # Define mocks
-        def mock_capture_exception(exc):
-            sentry_calls.append(('exception', exc))
+        def mock_capture_exception(exc, contexts=None):
+            sentry_calls.append(('exception', exc, contexts))
             return None
 
         def mock_capture_message(message):
@@ -102,6 +108,8 @@ class ProfileTest(TestCase):
             sentry_sdk.capture_exception = mock_capture_exception
             sentry_sdk.capture_message = mock_capture_message
 
+            errors.reporter.reset()
+
             # Call the view
             response = self.client.get(reverse('profiles:index'))
 
@@ -113,13 +121,11 @@ class ProfileTest(TestCase):
             self.assertEqual(sentry_calls[0][0], 'exception')
             self.assertTrue(isinstance(sentry_calls[0][1], TemplateDoesNotExist))
 
-            # Check for specific message
-            message_found = False
-            for call in sentry_calls:
-                if call[0] == 'message' and call[1] == "Erreur dans profiles.views index.":
-                    message_found = True
-                    break
-            self.assertTrue(message_found)
+            # Check a single report carries the message
+            self.assertEqual(len(sentry_calls), 1)
+            self.assertEqual(
+                sentry_calls[0][2]['report']['message'], "Erreur dans profiles.views index."
+            )
 
         finally:
             # Restore original functions
@@ -141,8 +147,8 @@ class ProfileTest(TestCase):
         sentry_calls = []
 
         # Define mocks
-        def mock_capture_exception(exc):
-            sentry_calls.append(('exception', exc))
+        def mock_capture_exception(exc, contexts=None):
+            sentry_calls.append(('exception', exc, contexts))
             return None
 
         def mock_capture_message(message):
@@ -160,6 +166,8 @@ class ProfileTest(TestCase):
             sentry_sdk.capture_exception = mock_capture_exception
             sentry_sdk.capture_message = mock_capture_message
 
+            errors.reporter.reset()
+
             # Call the view
             response = self.client.get(reverse('profiles:profile', args=["testuser"]))
 
@@ -171,13 +179,11 @@ class ProfileTest(TestCase):
             self.assertEqual(sentry_calls[0][0], 'exception')
             self.assertTrue(isinstance(sentry_calls[0][1], TemplateDoesNotExist))
 
-            # Check for specific message
-            message_found = False
-            for call in sentry_calls:
-                if call[0] == 'message' and call[1] == "Erreur dans profiles.views profile.":
-                    message_found = True
-                    break
-            self.assertTrue(message_found)
+            # Check a single report carries the message
+            self.assertEqual(len(sentry_calls), 1)
+            self.assertEqual(
+                sentry_calls[0][2]['report']['message'], "Erreur dans profiles.views profile."
+            )
 
         finally:
             # Restore original functions
@@ -239,3 +245,332 @@ class ProfileTest(TestCase):
             sentry_sdk.capture_exception = original_capture_exception
             sentry_sdk.capture_message = original_capture_message
             self.profile.__class__.__base__.clean = original_super_clean
+
+
+class ProfileAdminTest(TestCase):
+    """
+    Test case for the Profile admin pages.
+    """
+
+    def setUp(self):
+        """
+        Logs a superuser in and creates a few profiles.
+        """
+        self.admin = User.objects.create_superuser(
+            username="admin", email="admin@test.com", password="adminpassword"
+        )
+        self.client.force_login(self.admin)
+        self.create_profiles(1, 4)
+
+    def create_profiles(self, first, last):
+        """Creates users and their profiles"""
+        for index in range(first, last):
+            user = User.objects.create_user(username=f"user{index}")
+            Profile.objects.create(user=user, favorite_city="Test City")
+
+    def count_changelist_queries(self):
+        """Returns the number of queries needed to render the changelist"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:profiles_profile_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """
+        Test that the changelist joins the user instead of querying it
+        once per row.
+        """
+        before = self.count_changelist_queries()
+        self.create_profiles(4, 10)
+        self.assertEqual(self.count_changelist_queries(), before)
+
+    def test_changelist_search_by_username(self):
+        """Test that the search matches the exact username"""
+        response = self.client.get(
+            reverse('admin:profiles_profile_changelist'), {'q': 'user2'}
+        )
+        self.assertContains(response, "user2")
+        self.assertNotContains(response, "user3")
+
+    def test_profile_form_uses_raw_id(self):
+        """Test that the user is picked by id instead of a full <select>"""
+        response = self.client.get(reverse('admin:profiles_profile_add'))
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+
+
+class ProfileIndexTest(TestCase):
+    """
+    Test case for the profiles index with many rows.
+    """
+
+    def setUp(self):
+        """
+        Creates five users and their profiles.
+        """
+        for index in range(1, 6):
+            user = User.objects.create_user(username=f"user{index}")
+            Profile.objects.create(user=user, favorite_city="Test City")
+
+    def test_index_queries_do_not_grow_with_rows(self):
+        """Test that the usernames are joined instead of queried per row"""
+        with self.assertNumQueries(3):
+            # The emptiness check, the profiles list and the profiles counter
+            response = self.client.get(reverse('profiles:index'))
+        self.assertContains(response, "user5")
+
+    @override_settings(STREAMING_LIST_THRESHOLD=3, STREAMING_CHUNK_SIZE=2)
+    def test_large_index_is_streamed(self):
+        """Test that the profiles are streamed in chunks, in order"""
+        response = self.client.get(reverse('profiles:index'))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(chunks), 5)
+        page = ''.join(chunks)
+        positions = [page.index(f">user{index}<") for index in range(1, 6)]
+        self.assertEqual(positions, sorted(positions))
+
+
+@override_settings(FAVORITE_CITY_LETTINGS=2)
+class FavoriteCityLettingsTest(TestCase):
+    """
+    Test case for the lettings of the favorite city on the profile page.
+    """
+
+    def setUp(self):
+        """
+        Creates a profile and three lettings in its favorite city.
+        """
+        user = User.objects.create_user(username="traveler", password="password")
+        self.profile = Profile.objects.create(user=user, favorite_city=" bruNSWICK ")
+        self.lettings = [self.create_letting(f"Letting {i}") for i in range(3)]
+
+    @staticmethod
+    def create_letting(title, city="Brunswick"):
+        address = Address.objects.create(
+            number=1, street="Ocean Drive", city=city,
+            state="GA", zip_code=31525, country_iso_code="USA"
+        )
+        return Letting.objects.create(title=title, address=address)
+
+    def get_profile(self):
+        return self.client.get(reverse('profiles:profile', args=["traveler"]))
+
+    def test_latest_lettings_whatever_the_case(self):
+        """Test that the latest lettings of the city are listed"""
+        response = self.get_profile()
+
+        self.assertContains(response, "Lettings in  bruNSWICK ")
+        self.assertContains(response, "Letting 2")
+        self.assertContains(response, "Letting 1")
+        self.assertNotContains(response, "Letting 0")
+
+    def test_cached_list_costs_one_lookup(self):
+        """Test that a computed list is read from the shared cache, then its table"""
+        self.get_profile()
+        self.assertTrue(CityTopLettings.objects.filter(city_key="brunswick").exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_profile()
+        self.assertFalse(any('lettings_' in query['sql'] for query in queries))
+
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_profile()
+        self.assertEqual(
+            sum('lettings_citytoplettings' in query['sql'] for query in queries), 1
+        )
+        self.assertFalse(any('lettings_letting' in query['sql'] for query in queries))
+
+    def test_invalidated_when_lettings_change(self):
+        """Test that letting and address changes recompute the list"""
+        self.get_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_letting("Brand New")
+        self.assertContains(self.get_profile(), "Brand New")
+
+        address = self.lettings[2].address
+        address.city = "Savannah"
+        with self.captureOnCommitCallbacks(execute=True):
+            address.save()
+        response = self.get_profile()
+        self.assertNotContains(response, "Letting 2")
+        self.assertContains(response, "Letting 1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lettings[1].delete()
+        self.assertNotContains(self.get_profile(), "Letting 1")
+
+    def test_list_computed_before_a_change_is_not_stored(self):
+        """Test that a list computed while the city changes is left out"""
+        self.get_profile()
+        CityTopLettings.invalidate("brunswick")
+        compute = Letting.objects.filter
+
+        def change_city(*args, **kwargs):
+            # A write to the city commits while the list is computed
+            CityTopLettings.invalidate("brunswick")
+            return compute(*args, **kwargs)
+
+        with mock.patch.object(Letting.objects, 'filter', side_effect=change_city):
+            CityTopLettings.load("brunswick")
+        self.assertIsNone(CityTopLettings.objects.get(city_key="brunswick").lettings)
+
+    def test_stored_lists_expire(self):
+        """Test that a list older than FAVORITE_CITY_LIST_MAX_AGE is computed again"""
+        CityTopLettings.objects.filter(city_key="brunswick").update(lettings=[])
+        self.assertEqual(CityTopLettings.load("brunswick"), [])
+
+        with override_settings(FAVORITE_CITY_LIST_MAX_AGE=0):
+            lettings = CityTopLettings.load("brunswick")
+        self.assertEqual([letting['title'] for letting in lettings], ["Letting 2", "Letting 1"])
+
+    def test_bulk_created_lettings_are_listed(self):
+        """Test that lettings written by bulk_create recompute the list"""
+        self.get_profile()
+        address = Address.objects.create(
+            number=2, street="Ocean Drive", city="Brunswick",
+            state="GA", zip_code=31525, country_iso_code="USA"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Letting.objects.bulk_create([Letting(title="Bulk Letting", address=address)])
+        self.assertContains(self.get_profile(), "Bulk Letting")
+
+
+class ProfileCacheTest(TestCase):
+    """
+    Test case for the cache of the profile page contexts.
+    """
+
+    def setUp(self):
+        """
+        Creates a profile, with an empty cache and statistics.
+        """
+        user = User.objects.create_user(
+            username="cached", password="password", first_name="Old", email="old@test.com"
+        )
+        self.profile = Profile.objects.create(user=user, favorite_city="Savannah")
+        profile_cache.clear()
+        profile_cache.reset()
+
+    def tearDown(self):
+        # Filled from rows this test rolls back
+        profile_cache.clear()
+
+    def get_profile(self, username="cached"):
+        # The context is cached once the request transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse('profiles:profile', args=[username]))
+
+    def test_hit_costs_no_profile_query(self):
+        """Test that a cached profile is rendered without reading the profile tables"""
+        self.get_profile()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_profile()
+
+        self.assertContains(response, "old@test.com")
+        self.assertFalse(any('profiles_profile' in query['sql'] for query in queries))
+        totals = profile_cache.snapshot()
+        self.assertEqual((totals['hits'], totals['misses'], totals['entries']), (1, 1, 1))
+
+    def test_missing_username_is_cached(self):
+        """Test that a 404 is cached until a profile is created for the username"""
+        self.assertEqual(self.get_profile("newcomer").status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_profile("newcomer").status_code, 404)
+        self.assertEqual(profile_cache.snapshot()['negative_hits'], 1)
+
+        user = User.objects.create_user(username="newcomer", password="password")
+        Profile.objects.create(user=user, favorite_city="Athens")
+        self.assertContains(self.get_profile("newcomer"), "Athens")
+
+    def test_invalidated_by_user_and_profile_changes(self):
+        """Test that saved, renamed and deleted users and profiles are evicted"""
+        self.get_profile()
+        user = self.profile.user
+        user.first_name = "New"
+        user.save()
+        self.assertContains(self.get_profile(), "New")
+
+        self.profile.favorite_city = "Macon"
+        self.profile.save()
+        self.assertContains(self.get_profile(), "Macon")
+
+        user.username = "renamed"
+        user.save()
+        self.assertEqual(self.get_profile().status_code, 404)
+        self.assertContains(self.get_profile("renamed"), "Macon")
+
+        self.profile.delete()
+        self.assertEqual(self.get_profile("renamed").status_code, 404)
+
+    @override_settings(PROFILE_CACHE_SIZE=1)
+    def test_least_recently_used_is_evicted(self):
+        """Test that the cache holds at most PROFILE_CACHE_SIZE entries"""
+        self.get_profile()
+        self.get_profile("unknown")
+
+        totals = profile_cache.snapshot()
+        self.assertEqual((totals['entries'], totals['evictions']), (1, 1))
+        with self.assertNumQueries(0):
+            self.get_profile("unknown")
+
+
+class ProfilesApiTest(TestCase):
+    """
+    Test case for the profiles JSON API.
+    """
+
+    def setUp(self):
+        """
+        Creates three profiles.
+        """
+        for name in ("carol", "alice", "bob"):
+            user = User.objects.create_user(
+                username=name, password="password", first_name=name.title(),
+                email=f"{name}@test.com"
+            )
+            Profile.objects.create(user=user, favorite_city=f"{name.title()} City")
+
+    def test_only_requested_columns_are_read(self):
+        """Test that the fields parameter narrows the response and the query"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('profiles_api:profile', args=["bob"]), {'fields': "favorite_city"}
+            )
+
+        self.assertEqual(response.json(), {'username': "bob", 'favorite_city': "Bob City"})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"email"', queries[0]['sql'])
+        self.assertNotIn('"password"', queries[0]['sql'])
+
+    def test_pages_follow_usernames(self):
+        """Test that the next URL continues after the last username"""
+        response = self.client.get(
+            reverse('profiles_api:profiles'), {'fields': "first_name", 'limit': 2}
+        ).json()
+        self.assertEqual(response['results'], [
+            {'username': "alice", 'first_name': "Alice"},
+            {'username': "bob", 'first_name': "Bob"},
+        ])
+
+        response = self.client.get(response['next']).json()
+        self.assertEqual(response, {
+            'results': [{'username': "carol", 'first_name': "Carol"}], 'next': None
+        })
+
+    def test_emails_are_not_exposed(self):
+        """Test that the public API never returns the email addresses"""
+        response = self.client.get(reverse('profiles_api:profile', args=["bob"]))
+        self.assertNotIn('email', response.json())
+        self.assertNotContains(response, "bob@test.com")
+        response = self.client.get(reverse('profiles_api:profiles'), {'fields': "email"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_parameters(self):
+        """Test that unknown fields, bad limits and missing profiles are reported"""
+        url = reverse('profiles_api:profiles')
+        self.assertEqual(self.client.get(url, {'fields': "password"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        missing = self.client.get(reverse('profiles_api:profile', args=["nobody"]))
+        self.assertEqual(missing.status_code, 404)
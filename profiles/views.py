@@ -1,6 +1,8 @@
-import sentry_sdk
-from django.http import Http404
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
+from oc_lettings_site import counters, errors, streaming
+from oc_lettings_site.middleware import template_engine
+from lettings.models import CityTopLettings
+from .cache import profile_cache
 from .models import Profile
 
 
@@ -14,14 +16,22 @@ def index(request):
     """
     try:
         # Profiles.index view logic
-        profiles_list = Profile.objects.all()
-        context = {'profiles_list': profiles_list}
-        return render(request, 'profiles/index.html', context)
+        profiles_list = (
+            Profile.objects.select_related('user').only('user__username').order_by('pk')
+        )
+        context = {'has_profiles': profiles_list.exists()}
+        # The counter only chooses how to render, a bulk import may leave it behind
+        if streaming.should_stream(counters.get_count(Profile)):
+            return streaming.render_streaming(
+                request, 'profiles/index.html', context, profiles_list,
+                'profiles/index_rows.html', using=template_engine(request),
+            )
+        context['profiles_list'] = profiles_list
+        return render(request, 'profiles/index.html', context, using=template_engine(request))
     except Exception as e:
         # Capturing sentry exception
-        sentry_sdk.capture_exception(e)
-        sentry_sdk.capture_message("Erreur dans profiles.views index.")
-        return render(request, '500.html', status=500)
+        errors.report_exception(e, "Erreur dans profiles.views index.")
+        return errors.error_response(500)
 
 
 def profile(request, username):
@@ -35,14 +45,18 @@ def profile(request, username):
     """
     try:
         # Profiles.profile view logic
-        profile = get_object_or_404(Profile, user__username=username)
-        context = {'profile': profile}
-        return render(request, 'profiles/profile.html', context)
-    except Http404:
-        # Username doesn't exist, 404
-        return render(request, '404.html', status=404)
+        # No query once the username is cached, with or without a profile
+        profile = profile_cache.get(username)
+        if profile is None:
+            # Username doesn't exist, 404
+            return errors.error_response(404)
+        context = {
+            'profile': profile,
+            # One primary key lookup once the city list is computed
+            'city_lettings': CityTopLettings.for_city(profile['favorite_city']),
+        }
+        return render(request, 'profiles/profile.html', context, using=template_engine(request))
     except Exception as e:
         # Capturing other exception
-        sentry_sdk.capture_exception(e)
-        sentry_sdk.capture_message("Erreur dans profiles.views profile.")
-        return render(request, '500.html', status=500)
+        errors.report_exception(e, "Erreur dans profiles.views profile.")
+        return errors.error_response(500)
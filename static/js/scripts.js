@@ -47,4 +47,28 @@
     // Collapse the navbar when page is scrolled
     document.addEventListener('scroll', navbarCollapse);
 
+    // Typeahead of the search box, asked once typing pauses
+    const suggestInput = document.body.querySelector('#suggest-input');
+    if (suggestInput) {
+        const suggestList = document.body.querySelector('#suggest-list');
+        let suggestTimer = null;
+        suggestInput.addEventListener('input', () => {
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(() => {
+                const query = suggestInput.value.trim();
+                if (!query) {
+                    suggestList.replaceChildren();
+                    return;
+                }
+                fetch(suggestInput.dataset.suggestUrl + '?q=' + encodeURIComponent(query))
+                    .then(response => response.json())
+                    .then(data => {
+                        const values = [...data.titles, ...data.cities, ...data.usernames];
+                        suggestList.replaceChildren(...values.map(value => new Option(value)));
+                    })
+                    .catch(() => suggestList.replaceChildren());
+            }, 100);
+        });
+    }
+
 });